@@ -0,0 +1,596 @@
+#!/usr/bin/env python3
+"""
+Analysis Store
+Analysis history: per-user most-recent-first records plus the full analysis
+data, held under a global byte budget. AnalysisStore keeps it in process
+memory; SQLiteAnalysisStore keeps it in a WAL-mode database file that every
+server worker shares and that survives restarts
+"""
+
+import base64
+import json
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+
+# Default budget for stored analyses (records, analysis data and artifacts)
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+def encode_cursor(record):
+    """Opaque page cursor for the position just after record (date, then id)"""
+    key = json.dumps([record['date'], record['id']])
+    return base64.urlsafe_b64encode(key.encode('utf-8')).decode('ascii')
+
+def decode_cursor(cursor):
+    """Return the (date, id) key of a cursor; raises ValueError if malformed"""
+    try:
+        date, analysis_id = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if not isinstance(date, str) or not isinstance(analysis_id, str):
+        raise ValueError('Invalid cursor')
+    return date, analysis_id
+
+def matches(record, result=None, date_from=None, date_to=None, patient_id=None):
+    """Whether a history record passes the filters (date_from inclusive, date_to exclusive)"""
+    return ((result is None or record['result'] == result)
+            and (date_from is None or record['date'] >= date_from)
+            and (date_to is None or record['date'] < date_to)
+            and (patient_id is None or record['patient_id'] == patient_id))
+
+def estimate_nbytes(value):
+    """Approximate the footprint of a JSON-like value by its encoded size"""
+    return len(json.dumps(value, default=str))
+
+class StoredAnalysis:
+    """One analysis: the history record, its full data and its accounted size"""
+
+    def __init__(self, record, data, nbytes):
+        self.record = record
+        self.data = data
+        self.nbytes = nbytes
+        self.last_access = time.time()
+
+class AnalysisStore:
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=7 * 24 * 3600,
+                 max_per_user=50, on_evict=None):
+        """Create an empty store; on_evict(data) is called for every dropped analysis"""
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_per_user = max_per_user
+        self.on_evict = on_evict
+        self.current_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._entries = OrderedDict()  # analysis_id -> StoredAnalysis, least recently used first
+        self._by_user = {}  # user_id -> OrderedDict of analysis ids, oldest first
+        self._counters = {}  # user_id -> running totals, kept in step with save/_pop
+        self._lock = threading.Lock()
+
+    def save(self, analysis_id, record, data, extra_bytes=0):
+        """
+        Store an analysis and return its ID
+
+        extra_bytes accounts for storage the analysis owns outside this
+        process (e.g. its rendered image) so the budget covers it too.
+        """
+        entry = StoredAnalysis(record, data, estimate_nbytes(record) + estimate_nbytes(data) + extra_bytes)
+        user_id = record['user_id']
+
+        with self._lock:
+            dropped = self._pop(analysis_id)
+            self._entries[analysis_id] = entry
+            self.current_bytes += entry.nbytes
+            self._by_user.setdefault(user_id, OrderedDict())[analysis_id] = None
+            self._count(record, 1)
+
+            # Per-user cap, then expired entries, then the global budget
+            user_ids = self._by_user[user_id]
+            while len(user_ids) > self.max_per_user:
+                dropped.extend(self._pop(next(iter(user_ids))))
+                self.evictions += 1
+            dropped.extend(self._evict(keep=analysis_id))
+
+        self._notify(dropped)
+        return analysis_id
+
+    def get(self, analysis_id):
+        """Return the full analysis data, or None if unknown or expired"""
+        with self._lock:
+            entry = self._entries.get(analysis_id)
+            if entry is not None and self._expired(entry, time.time()):
+                dropped = self._pop(analysis_id)
+                self.expirations += 1
+                entry = None
+            else:
+                dropped = []
+                if entry is not None:
+                    entry.last_access = time.time()
+                    self._entries.move_to_end(analysis_id)
+
+        self._notify(dropped)
+        return entry.data if entry is not None else None
+
+    def get_user_analyses(self, user_id, limit=None, cursor=None, result=None,
+                          date_from=None, date_to=None, patient_id=None):
+        """
+        Return the user's history records, most recent first
+
+        cursor is the (date, id) key of the last record of the previous
+        page. History is capped per user, so pages are a short walk back
+        from the newest entry.
+        """
+        with self._lock:
+            dropped = self._evict()
+            records = []
+            for analysis_id in reversed(self._by_user.get(user_id, ())):
+                if limit is not None and len(records) >= limit:
+                    break
+                record = self._entries[analysis_id].record
+                if cursor is not None and (record['date'], record['id']) >= cursor:
+                    continue
+                if matches(record, result, date_from, date_to, patient_id):
+                    records.append(record)
+
+        self._notify(dropped)
+        return records
+
+    def count_user_analyses(self, user_id):
+        with self._lock:
+            dropped = self._expire_user(user_id)
+            count = len(self._by_user.get(user_id, []))
+
+        self._notify(dropped)
+        return count
+
+    def delete(self, analysis_id):
+        """Remove an analysis; returns True if it existed"""
+        with self._lock:
+            dropped = self._pop(analysis_id)
+        self._notify(dropped)
+        return bool(dropped)
+
+    def user_stats(self, user_id, month):
+        """Return counts for the user's history; month is a 'YYYY-MM' prefix"""
+        with self._lock:
+            dropped = self._expire_user(user_id)
+            counters = self._counters.get(user_id)
+            if counters is None:
+                stats = {'total': 0, 'completed': 0, 'tumor_detected': 0, 'this_month': 0}
+            else:
+                stats = {
+                    'total': counters['total'],
+                    'completed': counters['completed'],
+                    'tumor_detected': counters['tumor_detected'],
+                    'this_month': counters['months'].get(month, 0)
+                }
+
+        self._notify(dropped)
+        return stats
+
+    def stats(self):
+        with self._lock:
+            return {
+                'backend': 'memory',
+                'entries': len(self._entries),
+                'users': len(self._by_user),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def _expired(self, entry, now):
+        return self.ttl_seconds is not None and now - entry.last_access > self.ttl_seconds
+
+    def _count(self, record, sign):
+        """Add (sign=1) or remove (sign=-1) a record from its user's counters (lock held)"""
+        user_id = record['user_id']
+        counters = self._counters.setdefault(
+            user_id, {'total': 0, 'completed': 0, 'tumor_detected': 0, 'months': {}}
+        )
+        counters['total'] += sign
+        counters['completed'] += sign if record['status'] == 'completed' else 0
+        counters['tumor_detected'] += sign if record['result'] == 'tumor_detected' else 0
+
+        months = counters['months']
+        month = record['date'][:7]
+        months[month] = months.get(month, 0) + sign
+        if months[month] <= 0:
+            del months[month]
+        if counters['total'] <= 0:
+            del self._counters[user_id]
+
+    def _pop(self, analysis_id):
+        """Unlink an analysis (lock held); returns the list of dropped data"""
+        entry = self._entries.pop(analysis_id, None)
+        if entry is None:
+            return []
+
+        self.current_bytes -= entry.nbytes
+        self._count(entry.record, -1)
+        user_id = entry.record['user_id']
+        user_ids = self._by_user.get(user_id)
+        if user_ids is not None:
+            user_ids.pop(analysis_id, None)
+            if not user_ids:
+                del self._by_user[user_id]
+        return [entry.data]
+
+    def _expire_user(self, user_id):
+        """Drop the user's idle-expired entries so their counters only cover live ones (lock held)"""
+        dropped = []
+        now = time.time()
+        for analysis_id in list(self._by_user.get(user_id, ())):
+            if self._expired(self._entries[analysis_id], now):
+                dropped.extend(self._pop(analysis_id))
+                self.expirations += 1
+        return dropped
+
+    def _evict(self, keep=None):
+        """Drop idle-expired entries, then least recently used ones over budget (lock held)"""
+        dropped = []
+        now = time.time()
+
+        # Entries are in access order, so expired ones sit at the front
+        while self._entries:
+            analysis_id, entry = next(iter(self._entries.items()))
+            if analysis_id == keep or not self._expired(entry, now):
+                break
+            dropped.extend(self._pop(analysis_id))
+            self.expirations += 1
+
+        while self.current_bytes > self.max_bytes and len(self._entries) > 1:
+            analysis_id = next(iter(self._entries))
+            if analysis_id == keep:
+                self._entries.move_to_end(analysis_id)
+                continue
+            dropped.extend(self._pop(analysis_id))
+            self.evictions += 1
+
+        return dropped
+
+    def _notify(self, dropped):
+        if self.on_evict is None:
+            return
+        for data in dropped:
+            try:
+                self.on_evict(data)
+            except Exception as e:
+                print(f"⚠️ Failed to clean up evicted analysis: {e}")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS analyses (
+    id TEXT PRIMARY KEY,
+    user_id TEXT NOT NULL,
+    date TEXT NOT NULL,
+    status TEXT NOT NULL,
+    result TEXT NOT NULL,
+    patient_id TEXT,
+    nbytes INTEGER NOT NULL,
+    record TEXT NOT NULL,
+    data TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS idx_analyses_date ON analyses (date);
+CREATE TABLE IF NOT EXISTS user_stats (
+    user_id TEXT NOT NULL,
+    month TEXT NOT NULL,
+    total INTEGER NOT NULL,
+    completed INTEGER NOT NULL,
+    tumor_detected INTEGER NOT NULL,
+    PRIMARY KEY (user_id, month)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS store_stats (
+    id INTEGER PRIMARY KEY CHECK (id = 1),
+    entries INTEGER NOT NULL,
+    nbytes INTEGER NOT NULL
+);
+"""
+
+# Indexes serving keyset pages, alone or with a result/patient filter
+INDEXES = """
+DROP INDEX IF EXISTS idx_analyses_user_date;
+DROP INDEX IF EXISTS idx_analyses_user_result;
+CREATE INDEX IF NOT EXISTS idx_analyses_user_page ON analyses (user_id, date, id);
+CREATE INDEX IF NOT EXISTS idx_analyses_user_result_page ON analyses (user_id, result, date, id);
+CREATE INDEX IF NOT EXISTS idx_analyses_user_patient_page ON analyses (user_id, patient_id, date, id);
+"""
+
+# Per-user, per-month counters rebuilt from the analyses table (first run on an older database)
+REBUILD_STATS = """
+INSERT INTO user_stats (user_id, month, total, completed, tumor_detected)
+SELECT user_id, substr(date, 1, 7), COUNT(*),
+       SUM(status = 'completed'), SUM(result = 'tumor_detected')
+FROM analyses GROUP BY user_id, substr(date, 1, 7)
+"""
+
+# Store-wide entry and byte totals rebuilt from the analyses table (first run on an older database)
+REBUILD_TOTALS = """
+INSERT INTO store_stats (id, entries, nbytes)
+SELECT 1, COUNT(*), COALESCE(SUM(nbytes), 0) FROM analyses
+"""
+
+class SQLiteAnalysisStore:
+    def __init__(self, db_path, max_bytes=DEFAULT_MAX_BYTES, ttl_seconds=7 * 24 * 3600,
+                 max_per_user=50, on_evict=None):
+        """
+        Open (or create) the database at db_path
+
+        Same interface as AnalysisStore. Retention is by age since the
+        analysis was saved rather than by last access, so reads never write.
+        """
+        self.db_path = db_path
+        self.max_bytes = max_bytes
+        self.ttl_seconds = ttl_seconds
+        self.max_per_user = max_per_user
+        self.on_evict = on_evict
+        self.evictions = 0
+        self.expirations = 0
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+
+        conn = self._connect()
+        conn.executescript(SCHEMA)
+        columns = [row[1] for row in conn.execute('PRAGMA table_info(analyses)')]
+        if 'patient_id' not in columns:
+            conn.executescript(
+                'ALTER TABLE analyses ADD COLUMN patient_id TEXT;'
+                "UPDATE analyses SET patient_id = json_extract(record, '$.patient_id');"
+            )
+        conn.executescript(INDEXES)
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            if conn.execute('SELECT NOT EXISTS (SELECT 1 FROM user_stats) '
+                            'AND EXISTS (SELECT 1 FROM analyses)').fetchone()[0]:
+                conn.execute(REBUILD_STATS)
+            if not conn.execute('SELECT EXISTS (SELECT 1 FROM store_stats)').fetchone()[0]:
+                conn.execute(REBUILD_TOTALS)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def _connect(self):
+        """Return this thread's connection, opening one if needed (and after fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def save(self, analysis_id, record, data, extra_bytes=0):
+        """Store an analysis and return its ID"""
+        record_json = json.dumps(record)
+        data_json = json.dumps(data)
+        nbytes = len(record_json) + len(data_json) + extra_bytes
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            dropped = self._pop(conn, 'id = ?', (analysis_id,))
+            conn.execute(
+                'INSERT INTO analyses (id, user_id, date, status, result, patient_id, nbytes, record, data) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (analysis_id, record['user_id'], record['date'], record['status'],
+                 record['result'], record.get('patient_id'), nbytes, record_json, data_json)
+            )
+            self._count(conn, record['user_id'], record['date'], record['status'], record['result'], 1)
+            self._total(conn, 1, nbytes)
+
+            # Per-user cap, then expired entries, then the global budget
+            capped = self._pop(conn, 'id IN (SELECT id FROM analyses WHERE user_id = ? '
+                                     'ORDER BY date DESC LIMIT -1 OFFSET ?)',
+                               (record['user_id'], self.max_per_user))
+            with self._lock:
+                self.evictions += len(capped)
+            dropped += capped + self._evict(conn)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        self._notify(dropped)
+        return analysis_id
+
+    def get(self, analysis_id):
+        """Return the full analysis data, or None if unknown or expired"""
+        row = self._connect().execute(
+            'SELECT data FROM analyses WHERE id = ? AND date >= ?',
+            (analysis_id, self._cutoff())
+        ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def get_user_analyses(self, user_id, limit=None, cursor=None, result=None,
+                          date_from=None, date_to=None, patient_id=None):
+        """
+        Return the user's history records, most recent first
+
+        cursor is the (date, id) key of the last record of the previous
+        page, so each page is a single index range scan.
+        """
+        where = ['user_id = ?', 'date >= ?']
+        params = [user_id, max(self._cutoff(), date_from or '')]
+        if cursor is not None:
+            where.append('(date, id) < (?, ?)')
+            params.extend(cursor)
+        if date_to is not None:
+            where.append('date < ?')
+            params.append(date_to)
+        if result is not None:
+            where.append('result = ?')
+            params.append(result)
+        if patient_id is not None:
+            where.append('patient_id = ?')
+            params.append(patient_id)
+        params.append(-1 if limit is None else limit)
+
+        rows = self._connect().execute(
+            f"SELECT record FROM analyses WHERE {' AND '.join(where)} "
+            'ORDER BY date DESC, id DESC LIMIT ?',
+            params
+        ).fetchall()
+        return [json.loads(row[0]) for row in rows]
+
+    def count_user_analyses(self, user_id):
+        self._purge_user(user_id)
+        return self._connect().execute(
+            'SELECT COALESCE(SUM(total), 0) FROM user_stats WHERE user_id = ?', (user_id,)
+        ).fetchone()[0]
+
+    def delete(self, analysis_id):
+        """Remove an analysis; returns True if it existed"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            dropped = self._pop(conn, 'id = ?', (analysis_id,))
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        self._notify(dropped)
+        return bool(dropped)
+
+    def user_stats(self, user_id, month):
+        """
+        Return counts for the user's history; month is a 'YYYY-MM' prefix
+
+        Reads the running counters (one row per month of retained history)
+        once the user's expired analyses have been purged.
+        """
+        self._purge_user(user_id)
+        total, completed, tumor_detected, this_month = self._connect().execute(
+            'SELECT COALESCE(SUM(total), 0), COALESCE(SUM(completed), 0), '
+            'COALESCE(SUM(tumor_detected), 0), '
+            'COALESCE(SUM(CASE WHEN month = ? THEN total END), 0) '
+            'FROM user_stats WHERE user_id = ?',
+            (month, user_id)
+        ).fetchone()
+        return {
+            'total': total,
+            'completed': completed,
+            'tumor_detected': tumor_detected,
+            'this_month': this_month
+        }
+
+    def stats(self):
+        entries, total_bytes = self._connect().execute(
+            'SELECT entries, nbytes FROM store_stats'
+        ).fetchone()
+        with self._lock:
+            return {
+                'backend': 'sqlite',
+                'entries': entries,
+                'bytes': total_bytes,
+                'max_bytes': self.max_bytes,
+                'evictions': self.evictions,
+                'expirations': self.expirations
+            }
+
+    def _cutoff(self):
+        """ISO timestamp before which analyses count as expired"""
+        if self.ttl_seconds is None:
+            return ''
+        return (datetime.now() - timedelta(seconds=self.ttl_seconds)).isoformat()
+
+    def _count(self, conn, user_id, date, status, result, sign):
+        """Add (sign=1) or remove (sign=-1) an analysis from its user's counters (transaction open)"""
+        month = date[:7]
+        conn.execute(
+            'INSERT INTO user_stats (user_id, month, total, completed, tumor_detected) '
+            'VALUES (?, ?, ?, ?, ?) '
+            'ON CONFLICT (user_id, month) DO UPDATE SET '
+            'total = total + excluded.total, '
+            'completed = completed + excluded.completed, '
+            'tumor_detected = tumor_detected + excluded.tumor_detected',
+            (user_id, month, sign, sign if status == 'completed' else 0,
+             sign if result == 'tumor_detected' else 0)
+        )
+        if sign < 0:
+            conn.execute('DELETE FROM user_stats WHERE user_id = ? AND month = ? AND total <= 0',
+                         (user_id, month))
+
+    def _purge_user(self, user_id):
+        """Delete the user's expired rows, so their counters only cover live history"""
+        conn = self._connect()
+        where, params = 'user_id = ? AND date < ?', (user_id, self._cutoff())
+        # An index probe first, so reads only take the write lock when something expired
+        if not conn.execute(f'SELECT EXISTS (SELECT 1 FROM analyses WHERE {where})', params).fetchone()[0]:
+            return
+
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            expired = self._pop(conn, where, params)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+        with self._lock:
+            self.expirations += len(expired)
+        self._notify(expired)
+
+    def _total(self, conn, entries, nbytes):
+        """Adjust the store-wide entry and byte totals (transaction open)"""
+        conn.execute('UPDATE store_stats SET entries = entries + ?, nbytes = nbytes + ?', (entries, nbytes))
+
+    def _pop(self, conn, where, params):
+        """Delete matching rows (transaction open); returns the list of dropped data"""
+        rows = conn.execute(
+            f'SELECT data, user_id, date, status, result, nbytes FROM analyses WHERE {where}', params
+        ).fetchall()
+        if rows:
+            conn.execute(f'DELETE FROM analyses WHERE {where}', params)
+            self._total(conn, -len(rows), -sum(row[5] for row in rows))
+        for _, user_id, date, status, result, _ in rows:
+            self._count(conn, user_id, date, status, result, -1)
+        return [json.loads(row[0]) for row in rows]
+
+    def _evict(self, conn):
+        """Drop expired rows, then the oldest ones over budget (transaction open)"""
+        expired = self._pop(conn, 'date < ?', (self._cutoff(),))
+        with self._lock:
+            self.expirations += len(expired)
+
+        entries, total_bytes = conn.execute('SELECT entries, nbytes FROM store_stats').fetchone()
+        if total_bytes <= self.max_bytes:
+            return expired
+
+        # Oldest first until the remainder fits, always keeping the newest row;
+        # rows are read off the date index only as far as needed
+        over = total_bytes - self.max_bytes
+        victims = []
+        cursor = conn.execute('SELECT id, nbytes FROM analyses ORDER BY date LIMIT ?', (entries - 1,))
+        for analysis_id, nbytes in cursor:
+            if over <= 0:
+                break
+            victims.append(analysis_id)
+            over -= nbytes
+        cursor.close()
+
+        evicted = []
+        for analysis_id in victims:
+            evicted += self._pop(conn, 'id = ?', (analysis_id,))
+        with self._lock:
+            self.evictions += len(evicted)
+        return expired + evicted
+
+    def _notify(self, dropped):
+        if self.on_evict is None:
+            return
+        for data in dropped:
+            try:
+                self.on_evict(data)
+            except Exception as e:
+                print(f"⚠️ Failed to clean up evicted analysis: {e}")
@@ -13,26 +13,60 @@ warnings.filterwarnings('ignore')
 print(f"🐍 Python executable: {sys.executable}")
 print(f"🐍 Python version: {sys.version}")
 
-from flask import Flask, render_template, request, jsonify, send_file, redirect, url_for
+from flask import Flask, Request, render_template, request, jsonify, send_file, redirect, url_for, Response, stream_with_context
 import tempfile
-import base64
+import threading
+import time
 import io
-import matplotlib
-matplotlib.use('Agg')  # Use non-interactive backend
-import matplotlib.pyplot as plt
-import numpy as np
-from datetime import datetime
-import matplotlib.patches as patches
-from matplotlib.gridspec import GridSpec
+from datetime import datetime, timedelta
 import json
 import uuid
 
+# NumPy, matplotlib, OpenCV and TensorFlow are imported on first use so the
+# web layer can answer requests while the model loads in the background
+
+class UploadRequest(Request):
+    """Request that keeps uploaded files in memory up to UPLOAD_SPOOL_BYTES (Werkzeug spills at 500 KB)"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=app.config['UPLOAD_SPOOL_BYTES'], mode='rb+')
+
 app = Flask(__name__)
+app.request_class = UploadRequest
 app.config['MAX_CONTENT_LENGTH'] = 100 * 1024 * 1024  # 100MB max file size
-
-# In-memory storage for analysis history (in production, use a database)
-analysis_history = {}  # user_id -> list of analyses
-analysis_results = {}  # analysis_id -> full analysis data
+app.config['UPLOAD_SPOOL_BYTES'] = 64 * 1024 * 1024  # Uploads (and inflated volumes) up to this size stay in memory
+app.config['MAX_VOLUME_BYTES'] = 256 * 1024 * 1024  # Largest uncompressed image data accepted per volume
+app.config['INFERENCE_MAX_BATCH_SIZE'] = 8  # Max slices per batched forward pass
+app.config['INFERENCE_MAX_WAIT_MS'] = 5  # Max time a request waits for a batch to fill
+app.config['PREDICTION_CACHE_BYTES'] = 64 * 1024 * 1024  # Memory budget for cached slice results
+app.config['MODEL_SERVER_SOCKET'] = os.environ.get('MODEL_SERVER_SOCKET')  # Use model_server.py instead of loading the model here
+app.config['CONVERTED_MODEL_DIR'] = None  # Where the native .keras copy is cached (defaults to the model's directory)
+app.config['TFLITE_MODEL_PATH'] = os.environ.get('TFLITE_MODEL_PATH')  # Run this quantized export instead of the Keras model
+app.config['ONNX_MODEL_PATH'] = os.environ.get('ONNX_MODEL_PATH')  # Run this ONNX export on onnxruntime instead
+app.config['INFERENCE_THREADS'] = None  # Intra-op threads for the TFLite/ONNX backends (None = automatic)
+app.config['INFERENCE_INTER_OP_THREADS'] = None  # Inter-op threads for the ONNX backend
+app.config['DATA_DIR'] = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'data')
+app.config['STUDY_STORAGE_DIR'] = os.path.join(app.config['DATA_DIR'], 'studies')  # Uploaded studies, shared by all workers
+app.config['STUDY_TTL_SECONDS'] = 60 * 60  # Idle time before an uploaded study expires
+app.config['STUDY_MAX_BYTES'] = 2 * 1024 * 1024 * 1024  # Disk quota for uploaded studies
+app.config['ARTIFACT_STORAGE_DIR'] = None  # data/artifacts with the SQLite history, a temporary directory with in-memory history
+app.config['ARTIFACT_MAX_AGE'] = 24 * 60 * 60  # Browser cache lifetime for rendered images (seconds)
+app.config['REPORT_PROFILE'] = 'print'  # Default JPG report size/DPI: 'print' (300 dpi), 'standard' or 'screen'
+app.config['VOLUME_CHUNK_SIZE'] = 16  # Slices per forward pass (and progress update) in volume jobs
+app.config['VOLUME_SKIP_EMPTY_SLICES'] = True  # Leave slices without tissue as background instead of predicting them
+app.config['VOLUME_INTENSITY_THRESHOLD'] = 0.05  # Fraction of a modality's peak above which a voxel counts as tissue
+app.config['VOLUME_MIN_TISSUE_FRACTION'] = 0.002  # Fraction of a slice that must be tissue for it to be segmented
+app.config['JOB_WORKERS'] = 2  # Worker threads for background prediction/report jobs
+app.config['JOB_QUEUE_SIZE'] = 16  # Queued jobs before new submissions get 429
+app.config['JOB_SPOOL_BYTES'] = 1024 * 1024  # Inflated volumes held by queued jobs spill to disk past this
+app.config['MAX_JOBS'] = 200  # Finished jobs kept for polling
+app.config['JOB_TTL_SECONDS'] = 60 * 60  # Finished jobs and their result files are dropped after this
+app.config['JOB_DB_PATH'] = os.path.join(app.config['DATA_DIR'], 'jobs.db')  # Job state shared by all workers; None keeps it per process
+app.config['JOB_RESULTS_DIR'] = None  # data/job_results with the shared job state, a temporary directory otherwise
+app.config['ANALYSIS_DB_PATH'] = os.path.join(app.config['DATA_DIR'], 'analyses.db')  # None keeps history in memory
+app.config['ANALYSIS_STORE_MAX_BYTES'] = 512 * 1024 * 1024  # Budget for stored analyses and their images
+app.config['ANALYSIS_TTL_SECONDS'] = 30 * 24 * 60 * 60  # Analyses older than this are dropped
+app.config['MAX_ANALYSES_PER_USER'] = 50  # History entries kept per user
 
 def get_user_id_from_token(token):
     """Extract user ID from token (simplified for demo)"""
@@ -41,7 +75,7 @@ def get_user_id_from_token(token):
     # In a real app, decode JWT token
     return token.split('_')[-1] if '_' in token else 'demo_user'
 
-def save_analysis(user_id, analysis_data):
+def save_analysis(user_id, analysis_data, artifact_bytes=0):
     """Save analysis to history"""
     analysis_id = str(uuid.uuid4())
 
@@ -58,23 +92,9 @@ def save_analysis(user_id, analysis_data):
         'created_at': datetime.now().isoformat()
     }
 
-    # Store full analysis data
-    analysis_results[analysis_id] = analysis_data
-
-    # Add to user's history
-    if user_id not in analysis_history:
-        analysis_history[user_id] = []
-
-    analysis_history[user_id].insert(0, analysis_record)  # Most recent first
-
-    # Keep only last 50 analyses per user
-    if len(analysis_history[user_id]) > 50:
-        # Remove oldest analysis data
-        oldest = analysis_history[user_id].pop()
-        if oldest['id'] in analysis_results:
-            del analysis_results[oldest['id']]
-
-    return analysis_id
+    # Store record and full data; the store evicts (and cleans up) old analyses
+    return get_analysis_store().save(analysis_id, analysis_record, analysis_data,
+                                     extra_bytes=artifact_bytes)
 
 def determine_analysis_result(class_stats):
     """Determine if tumor was detected based on statistics"""
@@ -103,30 +123,315 @@ def calculate_tumor_percentage(class_stats):
 
     return round((tumor_pixels / total_pixels) * 100, 2)
 
-def get_user_analyses(user_id, limit=10):
-    """Get user's analysis history"""
-    if user_id not in analysis_history:
-        return []
+def get_user_analyses(user_id, limit=10, cursor=None, **filters):
+    """Get user's analysis history (cursor and filters as in AnalysisStore)"""
+    return get_analysis_store().get_user_analyses(user_id, limit, cursor, **filters)
 
-    return analysis_history[user_id][:limit]
+def parse_date_filter(value, end=False):
+    """Parse a date filter to an ISO bound; a bare end date includes that whole day"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed.isoformat()
 
 def get_analysis_by_id(analysis_id):
     """Get full analysis data by ID"""
-    return analysis_results.get(analysis_id)
+    return get_analysis_store().get(analysis_id)
+
+def delete_analysis_by_id(analysis_id):
+    """Delete an analysis and its rendered images"""
+    return get_analysis_store().delete(analysis_id)
+
+def delete_analysis_artifacts(analysis_data):
+    """Remove the rendered images and stored prediction referenced by an analysis"""
+    for key in ('visualization_artifact', 'prediction_artifact', 'report_artifact'):
+        artifact_id = analysis_data.get(key)
+        if artifact_id:
+            get_artifact_store().delete(artifact_id)
+
+def render_analysis_report(analysis_data, profile=None):
+    """Render the JPG report of a stored analysis from its compact prediction, without the model
+
+    Raises LookupError if the analysis has no stored prediction.
+    """
+    import numpy as np
+    from prediction_cache import CachedPrediction
+
+    artifact_id = analysis_data.get('prediction_artifact')
+    content = get_artifact_store().read(artifact_id) if artifact_id else None
+    if content is None:
+        raise LookupError('No stored prediction for this analysis; run the prediction again')
+
+    prediction, probabilities, flair, t1ce = CachedPrediction.from_bytes(content).unpack()
+    counts = np.bincount(prediction.ravel(), minlength=4)
+    class_stats = {i: int(count) for i, count in enumerate(counts) if count}
+
+    report_buffer = create_comprehensive_report(
+        flair, t1ce, prediction, probabilities, analysis_data.get('slice_index', 0), class_stats, profile=profile
+    )
+    return report_buffer.getvalue()
+
+# Analysis history, created on first use
+analysis_store = None
+analysis_store_lock = threading.Lock()
+
+def get_analysis_store():
+    """Return the process-wide AnalysisStore"""
+    global analysis_store
+    with analysis_store_lock:
+        if analysis_store is None:
+            from analysis_store import AnalysisStore, SQLiteAnalysisStore
+            options = dict(
+                max_bytes=app.config['ANALYSIS_STORE_MAX_BYTES'],
+                ttl_seconds=app.config['ANALYSIS_TTL_SECONDS'],
+                max_per_user=app.config['MAX_ANALYSES_PER_USER'],
+                on_evict=delete_analysis_artifacts
+            )
+            if app.config['ANALYSIS_DB_PATH']:
+                analysis_store = SQLiteAnalysisStore(app.config['ANALYSIS_DB_PATH'], **options)
+            else:
+                analysis_store = AnalysisStore(**options)
+        return analysis_store
+
+# Rendered images, created on first use
+artifact_store = None
+artifact_store_lock = threading.Lock()
+
+def get_artifact_store():
+    """Return the process-wide ArtifactStore"""
+    global artifact_store
+    with artifact_store_lock:
+        if artifact_store is None:
+            from artifact_store import ArtifactStore
+            # Artifacts only persist alongside a persistent history that references them
+            root_dir = app.config['ARTIFACT_STORAGE_DIR']
+            if root_dir is None and app.config['ANALYSIS_DB_PATH']:
+                root_dir = os.path.join(app.config['DATA_DIR'], 'artifacts')
+            artifact_store = ArtifactStore(root_dir=root_dir)
+        return artifact_store
+
+def artifact_url(artifact_id):
+    return f'/api/artifacts/{artifact_id}'
+
+# Uploaded studies, created on first use
+study_store = None
+study_store_lock = threading.Lock()
+
+def get_study_store():
+    """Return the process-wide StudyStore"""
+    global study_store
+    with study_store_lock:
+        if study_store is None:
+            from study_store import StudyStore
+            study_store = StudyStore(
+                root_dir=app.config['STUDY_STORAGE_DIR'],
+                ttl_seconds=app.config['STUDY_TTL_SECONDS'],
+                max_bytes=app.config['STUDY_MAX_BYTES'],
+                max_volume_bytes=app.config['MAX_VOLUME_BYTES']
+            )
+        return study_store
+
+class RequestVolumes:
+    """FLAIR/T1CE volumes for one request, released with close()
+
+    flair and t1ce are file paths (stored studies) or nibabel images read
+    from the upload stream; both are accepted wherever the predictor takes
+    a volume.
+    """
+
+    def __init__(self, flair, t1ce, flair_filename, t1ce_filename, digests=None, cleanup=None,
+                 study_id=None):
+        self.flair = flair
+        self.t1ce = t1ce
+        self.flair_filename = flair_filename
+        self.t1ce_filename = t1ce_filename
+        self.digests = digests
+        self.study_id = study_id
+        self._cleanup = cleanup
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def close(self):
+        if self._cleanup is not None:
+            self._cleanup()
+            self._cleanup = None
+
+def get_request_volumes(spool_bytes=None):
+    """Resolve the volumes of the current request from a study_id or uploaded files
+
+    Uploads are inflated into memory up to spool_bytes (UPLOAD_SPOOL_BYTES by
+    default). Raises LookupError for an unknown study and ValueError for
+    missing files.
+    """
+    study_id = request.form.get('study_id')
+    if study_id:
+        lease = get_study_store().acquire(study_id, get_request_user_id())
+        if lease is None:
+            raise LookupError('Study not found or expired')
+        study = lease.study
+        return RequestVolumes(study.flair_path, study.t1ce_path, study.flair_filename, study.t1ce_filename,
+                              digests=study.digests, cleanup=lease.release, study_id=study.id)
+
+    if 'flair' not in request.files or 't1ce' not in request.files:
+        raise ValueError('Both FLAIR and T1CE files (or a study_id) are required')
+
+    flair_file = request.files['flair']
+    t1ce_file = request.files['t1ce']
+
+    if not flair_file.filename or not t1ce_file.filename:
+        raise ValueError('No files selected')
+
+    # Read both volumes straight from the upload streams, concurrently
+    from brain_tumor_predictor import decode_pair
+    flair, t1ce = decode_pair(lambda upload: ingest_upload(*upload, spool_bytes=spool_bytes),
+                              (flair_file, 'FLAIR'), (t1ce_file, 'T1CE'),
+                              discard=lambda volume: volume.close())
+
+    def cleanup():
+        flair.close()
+        t1ce.close()
+
+    return RequestVolumes(flair.image, t1ce.image, flair_file.filename, t1ce_file.filename,
+                          digests=(flair.digest, t1ce.digest), cleanup=cleanup)
+
+def ingest_upload(upload, modality, spool_bytes=None):
+    """Validate and read one uploaded volume; ValueError messages name the modality"""
+    from nifti_ingest import load_volume
+
+    try:
+        return load_volume(upload.stream, max_volume_bytes=app.config['MAX_VOLUME_BYTES'],
+                           spool_bytes=spool_bytes or app.config['UPLOAD_SPOOL_BYTES'])
+    except ValueError as e:
+        raise ValueError(f'{modality}: {e}')
+
+# Background jobs, created on first use
+job_queue = None
+job_queue_lock = threading.Lock()
+
+def get_job_queue():
+    """Return the process-wide JobQueue"""
+    global job_queue
+    with job_queue_lock:
+        if job_queue is None:
+            from artifact_store import ArtifactStore
+            from job_queue import JobQueue, SQLiteJobStore
+
+            store = None
+            results_dir = app.config['JOB_RESULTS_DIR']
+            if app.config['JOB_DB_PATH']:
+                store = SQLiteJobStore(app.config['JOB_DB_PATH'])
+                results_dir = results_dir or os.path.join(app.config['DATA_DIR'], 'job_results')
+
+            job_queue = JobQueue(
+                num_workers=app.config['JOB_WORKERS'],
+                max_queued=app.config['JOB_QUEUE_SIZE'],
+                max_jobs=app.config['MAX_JOBS'],
+                ttl_seconds=app.config['JOB_TTL_SECONDS'],
+                result_store=ArtifactStore(root_dir=results_dir),
+                store=store
+            )
+        return job_queue
 
 # Global predictor instance
 predictor = None
+inference_scheduler = None
 model_status = "not_loaded"
 model_error = None
 
+# Background model loading: current stage and when loading started
+MODEL_LOAD_STAGES = ['importing_tensorflow', 'loading_model', 'warming_up', 'ready']
+model_load_stage = None
+model_load_started = None
+model_load_finished = None
+model_loader = None
+
+def set_model_load_stage(stage):
+    global model_load_stage, model_load_finished
+    model_load_stage = stage
+    if stage == 'ready':
+        model_load_finished = time.time()
+    print(f"⏳ Model loading: {stage}")
+
+def start_model_loading():
+    """Load and warm up the model in a background thread so the server can start at once"""
+    global model_loader, model_status, model_load_started
+    if model_loader is not None:
+        return model_loader
+
+    model_status = "loading"
+    model_load_started = time.time()
+    model_loader = threading.Thread(target=init_model, name='model-loader', daemon=True)
+    model_loader.start()
+    return model_loader
+
+def model_loading_progress():
+    """Loading stage, fraction done and elapsed seconds for /api/status"""
+    if model_load_stage is None:
+        return None
+    return {
+        'stage': model_load_stage,
+        'progress': round(MODEL_LOAD_STAGES.index(model_load_stage) / (len(MODEL_LOAD_STAGES) - 1), 2),
+        'elapsed_seconds': round((model_load_finished or time.time()) - model_load_started, 1)
+                           if model_load_started else None
+    }
+
+def model_unavailable_response():
+    """503 while the model is still loading, 500 if loading failed"""
+    if model_status == "loading":
+        response = jsonify({
+            'error': 'Model is still loading',
+            'model_status': model_status,
+            'loading': model_loading_progress()
+        })
+        response.headers['Retry-After'] = '5'
+        return response, 503
+
+    return jsonify({
+        'error': 'Model not loaded',
+        'model_status': model_status,
+        'model_error': model_error,
+        'message': 'Model loading failed. Check server logs for details.'
+    }), 500
+
 def init_model():
     """Initialize the brain tumor predictor with correct imports"""
-    global predictor, model_status, model_error
-    
+    global predictor, inference_scheduler, model_status, model_error, model_load_started
+
+    model_status = "loading"
+    model_load_started = model_load_started or time.time()
     try:
+        # Web workers in front of a model server only need a socket client
+        if app.config['MODEL_SERVER_SOCKET']:
+            from model_server import ModelClient
+            backend = ModelClient(app.config['MODEL_SERVER_SOCKET'])
+            return init_model_backend(backend, f"model server at {backend.socket_path} (pid {backend.server_pid})")
+
+        # Quantized TFLite export (see compare_quantized.py)
+        if app.config['TFLITE_MODEL_PATH']:
+            set_model_load_stage('loading_model')
+            from tflite_inference import TFLiteInference
+            backend = TFLiteInference(app.config['TFLITE_MODEL_PATH'], num_threads=app.config['INFERENCE_THREADS'])
+            return init_model_backend(backend, f"TFLite model {backend.tflite_path}")
+
+        # ONNX export on onnxruntime (see tests/test_backend_parity.py)
+        if app.config['ONNX_MODEL_PATH']:
+            set_model_load_stage('loading_model')
+            from inference_backends import OnnxRuntimeBackend
+            backend = OnnxRuntimeBackend(app.config['ONNX_MODEL_PATH'],
+                                         intra_op_threads=app.config['INFERENCE_THREADS'],
+                                         inter_op_threads=app.config['INFERENCE_INTER_OP_THREADS'])
+            return init_model_backend(backend, f"ONNX model {backend.onnx_path} on onnxruntime")
+
         print("🔍 Initializing model with correct TensorFlow/Keras versions...")
         
         # Import TensorFlow and verify version
+        set_model_load_stage('importing_tensorflow')
         import tensorflow as tf
         print(f"✅ TensorFlow version: {tf.__version__}")
         
@@ -144,8 +449,22 @@ def init_model():
         
         # Import and initialize predictor
         from brain_tumor_predictor import BrainTumorPredictor
-        predictor = BrainTumorPredictor(model_path)
-        
+        model = BrainTumorPredictor(model_path, cache_bytes=app.config['PREDICTION_CACHE_BYTES'],
+                                    converted_model_dir=app.config['CONVERTED_MODEL_DIR'],
+                                    on_progress=set_model_load_stage)
+
+        # Batch concurrent single-slice requests into one forward pass
+        from inference_scheduler import InferenceScheduler
+        scheduler = InferenceScheduler(
+            model,
+            max_batch_size=app.config['INFERENCE_MAX_BATCH_SIZE'],
+            max_wait_ms=app.config['INFERENCE_MAX_WAIT_MS']
+        )
+
+        # Publish both at once: request handlers check predictor first
+        inference_scheduler = scheduler
+        predictor = model
+        set_model_load_stage('ready')
         model_status = "loaded"
         print("✅ Model initialized successfully!")
         return True
@@ -158,226 +477,279 @@ def init_model():
         traceback.print_exc()
         return False
 
-def create_visualization(flair_img, t1ce_img, prediction, probabilities, slice_idx):
-    """Create visualization plot and return as base64 string"""
-    fig, axes = plt.subplots(2, 3, figsize=(15, 10))
-    axes = axes.flatten()
-    
-    # Original FLAIR
-    axes[0].imshow(flair_img, cmap='gray')
-    axes[0].set_title('FLAIR Image')
-    axes[0].axis('off')
-    
-    # Original T1CE
-    axes[1].imshow(t1ce_img, cmap='gray')
-    axes[1].set_title('T1CE Image')
-    axes[1].axis('off')
-    
-    # Prediction overlay
-    axes[2].imshow(flair_img, cmap='gray')
-    axes[2].imshow(prediction, alpha=0.5, cmap='jet')
-    axes[2].set_title('Segmentation Overlay')
-    axes[2].axis('off')
-    
-    # Individual class predictions
-    class_names = ['Background', 'Necrotic/Non-enhancing', 'Edema', 'Enhancing']
-    for i in range(4):
-        if i + 3 < len(axes):
-            axes[i + 3].imshow(probabilities[:, :, i], cmap='hot')
-            axes[i + 3].set_title(f'{class_names[i]} Probability')
-            axes[i + 3].axis('off')
-    
-    plt.tight_layout()
-    
-    # Convert to base64
-    buffer = io.BytesIO()
-    plt.savefig(buffer, format='png', dpi=100, bbox_inches='tight')
-    buffer.seek(0)
-    image_base64 = base64.b64encode(buffer.getvalue()).decode()
-    plt.close(fig)
-    
-    return image_base64
+def init_model_backend(backend, description):
+    """Initialize the predictor on an already created InferenceBackend"""
+    global predictor, inference_scheduler, model_status, model_error
 
-def create_comprehensive_report(flair_img, t1ce_img, prediction, probabilities, slice_idx, class_stats, patient_info=None):
-    """Create a comprehensive medical report as high-quality JPG"""
+    from brain_tumor_predictor import BrainTumorPredictor
+    from inference_scheduler import InferenceScheduler
 
-    # Set up the figure with professional layout
-    fig = plt.figure(figsize=(16, 20), dpi=300)
-    gs = GridSpec(6, 4, figure=fig, height_ratios=[0.8, 2, 2, 1.5, 1.5, 0.5], hspace=0.3, wspace=0.2)
+    model = BrainTumorPredictor("best_model.h5", cache_bytes=app.config['PREDICTION_CACHE_BYTES'],
+                                backend=backend)
+    inference_scheduler = InferenceScheduler(
+        model,
+        max_batch_size=app.config['INFERENCE_MAX_BATCH_SIZE'],
+        max_wait_ms=app.config['INFERENCE_MAX_WAIT_MS']
+    )
+    predictor = model
+    set_model_load_stage('ready')
 
-    # Color scheme for professional medical report
-    bg_color = '#f8f9fa'
-    header_color = '#2c3e50'
+    model_status = "loaded"
+    model_error = None
+    print(f"✅ Using {description}")
+    return True
+
+def create_visualization(flair_img, t1ce_img, prediction, probabilities, slice_idx):
+    """Render the visualization panels and return them as PNG bytes"""
+    from visualization import render_visualization, encode_png
+
+    image = render_visualization(flair_img, t1ce_img, prediction, probabilities)
+    return encode_png(image)
+
+def create_comprehensive_report(flair_img, t1ce_img, prediction, probabilities, slice_idx, class_stats,
+                                patient_info=None, profile=None):
+    """Create a comprehensive medical report as high-quality JPG
+
+    The static layout comes from a per-process template (see
+    report_renderer); profile picks its size and DPI, defaulting to
+    REPORT_PROFILE.
+    """
+    from report_renderer import render_report
+
+    report = render_report(flair_img, t1ce_img, prediction, probabilities, slice_idx, class_stats,
+                           profile_name=profile or app.config['REPORT_PROFILE'])
+    return io.BytesIO(report)
+
+def run_slice_prediction(volumes, slice_index, patient_id, user_id, job=None):
+    """Predict one slice, render its visualization and save it to history"""
+    import numpy as np
+
+    # Make prediction (the preprocessed slices are reused for display)
+    prediction, probabilities, inputs = inference_scheduler.predict_single_slice(
+        volumes.flair, volumes.t1ce, slice_index, return_inputs=True,
+        digests=volumes.digests
+    )
+
+    if prediction is None:
+        raise RuntimeError('Failed to process images')
+
+    if job is not None:
+        job.check_cancelled()
+
+    flair_img = inputs.flair
+    t1ce_img = inputs.t1ce
+
+    # Create visualization, stored once as a binary artifact
+    visualization = create_visualization(
+        flair_img, t1ce_img, prediction, probabilities, slice_index
+    )
+
+    # Compact prediction for re-rendering the report from history; the
+    # report itself is rendered into report_artifact on first download
+    from prediction_cache import CachedPrediction
+    compact = CachedPrediction(prediction, probabilities, flair_img, t1ce_img).to_bytes()
+
+    visualization_artifact = get_artifact_store().put(visualization, 'image/png')
+    prediction_artifact = get_artifact_store().put(compact, 'application/x-npz')
+
+    # Calculate statistics
+    unique, counts = np.unique(prediction, return_counts=True)
+    class_stats = dict(zip(unique.astype(int).tolist(), counts.astype(int).tolist()))
+
+    # Prepare analysis data
+    analysis_data = {
+        'visualization_artifact': visualization_artifact,
+        'visualization_url': artifact_url(visualization_artifact),
+        'prediction_artifact': prediction_artifact,
+        'report_artifact': get_artifact_store().new_id(),
+        'slice_index': int(slice_index),
+        'class_statistics': class_stats,
+        'prediction_shape': prediction.shape if prediction is not None else None,
+        'probabilities_shape': probabilities.shape if probabilities is not None else None,
+        'patient_id': patient_id,
+        'flair_filename': volumes.flair_filename,
+        't1ce_filename': volumes.t1ce_filename,
+        'study_id': volumes.study_id,
+        'user_id': user_id
+    }
 
-    # Set background color safely
+    # Save to history; without a history record nothing would clean up the artifacts
     try:
-        # Use matplotlib's figure patch attribute
-        figure_patch = getattr(fig, 'patch', None)
-        if figure_patch is not None:
-            figure_patch.set_facecolor(bg_color)
-    except (AttributeError, Exception):
-        pass  # Skip if not supported
-
-    # Header section
-    header_ax = fig.add_subplot(gs[0, :])
-    header_ax.text(0.5, 0.7, 'BRAIN TUMOR SEGMENTATION REPORT',
-                   fontsize=24, fontweight='bold', ha='center', va='center',
-                   color=header_color, transform=header_ax.transAxes)
-
-    # Report metadata
-    timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    header_ax.text(0.5, 0.3, f'Generated: {timestamp} | Slice Index: {slice_idx}',
-                   fontsize=12, ha='center', va='center',
-                   color='#7f8c8d', transform=header_ax.transAxes)
-    header_ax.axis('off')
-
-    # Original images section
-    flair_ax = fig.add_subplot(gs[1, 0])
-    flair_ax.imshow(flair_img, cmap='gray')
-    flair_ax.set_title('FLAIR Sequence', fontsize=14, fontweight='bold', pad=10)
-    flair_ax.axis('off')
-
-    t1ce_ax = fig.add_subplot(gs[1, 1])
-    t1ce_ax.imshow(t1ce_img, cmap='gray')
-    t1ce_ax.set_title('T1CE Sequence', fontsize=14, fontweight='bold', pad=10)
-    t1ce_ax.axis('off')
-
-    # Segmentation overlay
-    overlay_ax = fig.add_subplot(gs[1, 2])
-    overlay_ax.imshow(flair_img, cmap='gray')
-    overlay_ax.imshow(prediction, alpha=0.6, cmap='jet')
-    overlay_ax.set_title('Segmentation Overlay', fontsize=14, fontweight='bold', pad=10)
-    overlay_ax.axis('off')
-
-    # Legend for segmentation
-    legend_ax = fig.add_subplot(gs[1, 3])
-    class_names = ['Background', 'Necrotic/Core', 'Edema', 'Enhancing']
-    colors = ['#000000', '#ff0000', '#0000ff', '#00ff00']
-
-    # Create simple text legend without patches
-    legend_text = "SEGMENTATION LEGEND:\n\n"
-    for i, (name, color) in enumerate(zip(class_names, colors)):
-        legend_text += f"● {name}\n"
-
-    legend_ax.text(0.1, 0.9, legend_text, fontsize=12, va='top', ha='left',
-                   transform=legend_ax.transAxes, family='monospace')
-    legend_ax.set_title('Segmentation Legend', fontsize=14, fontweight='bold', pad=10)
-    legend_ax.axis('off')
-
-    # Individual probability maps
-    prob_titles = ['Background Probability', 'Necrotic/Core Probability',
-                   'Edema Probability', 'Enhancing Probability']
-
-    for i in range(4):
-        prob_ax = fig.add_subplot(gs[2, i])
-        im = prob_ax.imshow(probabilities[:, :, i], cmap='hot', vmin=0, vmax=1)
-        prob_ax.set_title(prob_titles[i], fontsize=12, fontweight='bold', pad=10)
-        prob_ax.axis('off')
-
-        # Add colorbar
-        cbar = plt.colorbar(im, ax=prob_ax, fraction=0.046, pad=0.04)
-        cbar.set_label('Probability', fontsize=10)
-
-    # Statistics section
-    stats_ax = fig.add_subplot(gs[3, :2])
-    stats_ax.axis('off')
-
-    # Calculate total pixels and percentages
-    total_pixels = sum(class_stats.values())
-    tumor_pixels = sum(class_stats.get(i, 0) for i in [1, 2, 3])
-    tumor_percentage = (tumor_pixels / total_pixels * 100) if total_pixels > 0 else 0
+        analysis_id = save_analysis(user_id, analysis_data, artifact_bytes=len(visualization) + len(compact))
+    except Exception:
+        delete_analysis_artifacts(analysis_data)
+        raise
+
+    return {
+        'success': True,
+        'analysis_id': analysis_id,
+        'slice_index': slice_index,
+        'visualization_url': artifact_url(visualization_artifact),
+        'class_statistics': class_stats,
+        'message': 'Prediction completed successfully'
+    }
 
-    stats_text = f"""QUANTITATIVE ANALYSIS
+def run_report(volumes, slice_index, job=None, profile=None):
+    """Predict one slice and render the comprehensive JPG report
 
-Total Pixels Analyzed: {total_pixels:,}
-Tumor Pixels Detected: {tumor_pixels:,}
-Tumor Coverage: {tumor_percentage:.1f}%
+    The forward pass is served from the prediction cache when the same
+    slice of the same study was just analyzed. Returns (report_buffer, filename).
+    """
+    import numpy as np
 
-TISSUE BREAKDOWN:
-"""
+    # Make prediction (the preprocessed slices are reused for display)
+    prediction, probabilities, inputs = inference_scheduler.predict_single_slice(
+        volumes.flair, volumes.t1ce, slice_index, return_inputs=True,
+        digests=volumes.digests
+    )
 
-    for i, name in enumerate(class_names):
-        pixels = class_stats.get(i, 0)
-        percentage = (pixels / total_pixels * 100) if total_pixels > 0 else 0
-        stats_text += f"• {name}: {pixels:,} pixels ({percentage:.1f}%)\n"
-
-    stats_ax.text(0.05, 0.95, stats_text, fontsize=11, va='top', ha='left',
-                  transform=stats_ax.transAxes, family='monospace',
-                  bbox=dict(boxstyle="round,pad=0.5", facecolor='white', alpha=0.8))
-
-    # Clinical assessment
-    clinical_ax = fig.add_subplot(gs[3, 2:])
-    clinical_ax.axis('off')
-
-    # Determine clinical assessment
-    if tumor_percentage > 5:
-        assessment = "SIGNIFICANT TUMOR PRESENCE"
-        recommendation = "• Recommend clinical correlation\n• Consider follow-up imaging\n• Consult oncology if indicated"
-        status_color = '#e74c3c'
-    elif tumor_percentage > 1:
-        assessment = "MODERATE TUMOR ACTIVITY"
-        recommendation = "• Monitor for changes\n• Clinical correlation advised\n• Follow institutional protocols"
-        status_color = '#f39c12'
-    else:
-        assessment = "MINIMAL TUMOR ACTIVITY"
-        recommendation = "• Low tumor burden detected\n• Routine follow-up as indicated\n• Clinical correlation recommended"
-        status_color = '#27ae60'
-
-    clinical_text = f"""CLINICAL ASSESSMENT
-
-Status: {assessment}
-
-RECOMMENDATIONS:
-{recommendation}
-"""
+    if prediction is None:
+        raise RuntimeError('Failed to process images')
 
-    clinical_ax.text(0.05, 0.95, clinical_text, fontsize=11, va='top', ha='left',
-                     transform=clinical_ax.transAxes,
-                     bbox=dict(boxstyle="round,pad=0.5", facecolor=status_color, alpha=0.1))
+    if job is not None:
+        job.check_cancelled()
 
-    # Technical information
-    tech_ax = fig.add_subplot(gs[4, :])
-    tech_ax.axis('off')
+    # Calculate statistics
+    unique, counts = np.unique(prediction, return_counts=True)
+    class_stats = dict(zip(unique.astype(int).tolist(), counts.astype(int).tolist()))
 
-    tech_text = """TECHNICAL INFORMATION
+    # Create comprehensive report
+    report_buffer = create_comprehensive_report(
+        inputs.flair, inputs.t1ce, prediction, probabilities, slice_index, class_stats, profile=profile
+    )
 
-Model: Deep Learning U-Net Architecture for Brain Tumor Segmentation
-Input: FLAIR and T1CE MRI sequences (128x128 resolution)
-Output: 4-class segmentation (Background, Necrotic/Core, Edema, Enhancing)
-Processing: Automated AI analysis with probability mapping
+    # Generate filename with timestamp
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    filename = f"brain_tumor_report_{timestamp}_slice_{slice_index}.jpg"
 
-DISCLAIMER: This analysis is generated by an AI system for research and educational purposes only.
-Results should not be used for clinical diagnosis without proper medical supervision and validation.
-Always consult qualified medical professionals for clinical interpretation and decision-making."""
+    return report_buffer, filename
 
-    tech_ax.text(0.05, 0.95, tech_text, fontsize=10, va='top', ha='left',
-                 transform=tech_ax.transAxes, style='italic',
-                 bbox=dict(boxstyle="round,pad=0.5", facecolor='#ecf0f1', alpha=0.8))
+def calculate_volume_statistics(class_counts, spacing):
+    """Voxel counts and volumes (cm³) per class of a full-resolution label map"""
+    from brain_tumor_predictor import SEGMENT_CLASSES
 
-    # Footer
-    footer_ax = fig.add_subplot(gs[5, :])
-    footer_ax.text(0.5, 0.5, 'Brain Tumor Segmentation System | AI-Powered Medical Image Analysis',
-                   fontsize=10, ha='center', va='center', style='italic',
-                   color='#7f8c8d', transform=footer_ax.transAxes)
-    footer_ax.axis('off')
+    voxel_volume_mm3 = spacing[0] * spacing[1] * spacing[2]
 
-    # Save to high-quality image
-    buffer = io.BytesIO()
-    try:
-        # Try JPEG with quality settings
-        plt.savefig(buffer, format='jpeg', dpi=300, bbox_inches='tight',
-                    facecolor=bg_color, edgecolor='none', pil_kwargs={'quality': 95})
-    except (TypeError, ValueError):
-        # Fallback to JPEG without quality parameter
-        buffer.seek(0)
-        buffer.truncate(0)
-        plt.savefig(buffer, format='jpeg', dpi=300, bbox_inches='tight',
-                    facecolor=bg_color, edgecolor='none')
+    class_statistics = {i: int(class_counts[i]) for i in range(len(SEGMENT_CLASSES))}
+    class_volumes_cm3 = {i: round(count * voxel_volume_mm3 / 1000.0, 3)
+                         for i, count in class_statistics.items()}
+
+    return {
+        'class_statistics': class_statistics,
+        'class_volumes_cm3': class_volumes_cm3,
+        'tumor_voxels': sum(class_statistics[i] for i in [1, 2, 3]),
+        'tumor_volume_cm3': round(sum(class_volumes_cm3[i] for i in [1, 2, 3]), 3),
+        'tumor_percentage': calculate_tumor_percentage(class_statistics),
+        'voxel_spacing_mm': list(spacing),
+        'voxel_volume_mm3': round(voxel_volume_mm3, 4)
+    }
+
+def run_volume_segmentation(job, volumes, start_slice, num_slices, batch_size, skip_empty=True, label_map=False):
+    """Segment a slice range batch by batch, publishing progress after each batch
+
+    Returns the volume statistics, or with label_map the full-resolution
+    label map as a .nii.gz JobFile carrying the statistics.
+    """
+    from job_queue import JobFile
+    from volume_segmentation import segment_volume
 
-    buffer.seek(0)
-    plt.close(fig)
+    progress = {'completed_slices': 0, 'total_slices': num_slices}
+    job.publish('progress', progress, progress=progress)
 
-    return buffer
+    def on_batch(completed, total):
+        progress = {
+            'completed_slices': completed,
+            'total_slices': total,
+            'skipped_slices': num_slices - total
+        }
+        job.publish('progress', progress, progress=progress)
+        job.check_cancelled()
+
+    segmentation = segment_volume(
+        predictor, volumes.flair, volumes.t1ce, start_slice, num_slices, batch_size,
+        skip_empty=skip_empty,
+        intensity_threshold=app.config['VOLUME_INTENSITY_THRESHOLD'],
+        min_tissue_fraction=app.config['VOLUME_MIN_TISSUE_FRACTION'],
+        on_batch=on_batch
+    )
+
+    result = calculate_volume_statistics(segmentation.class_counts(), segmentation.spacing)
+    brain_range = segmentation.brain_range
+    result.update({
+        'start_slice': start_slice,
+        'num_slices': num_slices,
+        'segmented_slices': len(segmentation.segmented_slices),
+        'skipped_slices': segmentation.skipped_slices,
+        'brain_range': list(brain_range) if brain_range else None,
+        'label_map_shape': list(segmentation.labels.shape)
+    })
+
+    if label_map:
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        return JobFile(segmentation.to_nifti_bytes(), 'application/gzip',
+                       f"brain_tumor_segmentation_{timestamp}.nii.gz", metadata=result)
+    return result
+
+def get_request_flag(name, default):
+    """Boolean form field ('1'/'true'/'yes' or '0'/'false'/'no'), or default if absent"""
+    value = request.form.get(name)
+    if value is None or value == '':
+        return default
+    value = value.strip().lower()
+    if value in ('1', 'true', 'yes', 'on'):
+        return True
+    if value in ('0', 'false', 'no', 'off'):
+        return False
+    raise ValueError(f'{name} must be true or false')
+
+def get_request_user_id():
+    """Get user ID from the Authorization bearer token (if provided)"""
+    auth_header = request.headers.get('Authorization', '')
+    token = auth_header.replace('Bearer ', '') if auth_header.startswith('Bearer ') else None
+    return get_user_id_from_token(token) if token else 'anonymous'
+
+def job_accepted_response(job, **extra):
+    """202 response pointing at the job's status, events and result"""
+    return jsonify({
+        'success': True,
+        'job_id': job.id,
+        'status': job.status,
+        'status_url': f'/api/jobs/{job.id}',
+        'events_url': f'/api/jobs/{job.id}/events',
+        'result_url': f'/api/jobs/{job.id}/result',
+        **extra
+    }), 202
+
+def get_request_report_profile():
+    """Report profile named by the request's 'profile' field, or the configured default"""
+    from report_renderer import REPORT_PROFILES
+
+    profile = request.form.get('profile') or app.config['REPORT_PROFILE']
+    if profile not in REPORT_PROFILES:
+        raise ValueError(f"Unknown report profile: {profile} (choose from {', '.join(REPORT_PROFILES)})")
+    return profile
+
+def get_request_job(job_id):
+    """The job with this ID if it was submitted by the caller, else None
+
+    Jobs of other users are reported exactly like unknown IDs.
+    """
+    job = get_job_queue().get(job_id)
+    if job is None or job.user_id != get_request_user_id():
+        return None
+    return job
+
+def submit_job(kind, fn, volumes, user_id):
+    """Queue fn(job) with volumes released afterwards; returns (job, error_response)"""
+    from job_queue import QueueFullError
+
+    try:
+        return get_job_queue().submit(kind, fn, user_id=user_id, cleanup=volumes.close), None
+    except QueueFullError as e:
+        volumes.close()
+        response = jsonify({'error': f'{str(e)}. Please retry shortly.'})
+        response.headers['Retry-After'] = '5'
+        return None, (response, 429)
 
 @app.route('/')
 def index():
@@ -405,111 +777,53 @@ def status():
     return jsonify({
         'model_loaded': predictor is not None,
         'model_status': model_status,
+        'inference_backend': predictor.backend.name if predictor is not None else None,
+        'model_loading': model_loading_progress(),
+        'model_server': app.config['MODEL_SERVER_SOCKET'],
+        'jobs': job_queue.stats() if job_queue is not None else None,
         'model_error': model_error,
         'server_status': 'running',
         'tensorflow_version': get_tf_version(),
-        'keras_version': get_keras_version()
+        'keras_version': get_keras_version(),
+        'prediction_cache': predictor.cache.stats() if predictor is not None and predictor.cache is not None else None,
+        'analysis_store': analysis_store.stats() if analysis_store is not None else None
     })
 
 def get_tf_version():
     """Get TensorFlow version safely"""
-    try:
-        import tensorflow as tf
-        return tf.__version__
-    except:
-        return "unknown"
+    if predictor is not None and hasattr(predictor.backend, 'tensorflow_version'):
+        return predictor.backend.tensorflow_version
+    # Only report what is already imported; importing here would block on the loader
+    tf = sys.modules.get('tensorflow')
+    return getattr(tf, '__version__', 'not loaded')
 
 def get_keras_version():
     """Get Keras version safely"""
-    try:
-        import keras
-        return getattr(keras, '__version__', 'unknown')
-    except:
-        return "unknown"
+    if predictor is not None and hasattr(predictor.backend, 'keras_version'):
+        return predictor.backend.keras_version
+    keras = sys.modules.get('keras')
+    return getattr(keras, '__version__', 'not loaded')
 
 @app.route('/api/predict', methods=['POST'])
 def predict():
-    """Handle prediction request"""
+    """Handle prediction request for uploaded files or a stored study"""
     if predictor is None:
-        return jsonify({
-            'error': 'Model not loaded',
-            'model_status': model_status,
-            'model_error': model_error,
-            'message': 'Model loading failed. Check server logs for details.'
-        }), 500
+        return model_unavailable_response()
     
     try:
-        # Get uploaded files
-        if 'flair' not in request.files or 't1ce' not in request.files:
-            return jsonify({'error': 'Both FLAIR and T1CE files are required'}), 400
-        
-        flair_file = request.files['flair']
-        t1ce_file = request.files['t1ce']
         slice_index = int(request.form.get('slice_index', 75))
         patient_id = request.form.get('patient_id', '')
-
-        # Get user info from token (if provided)
-        auth_header = request.headers.get('Authorization', '')
-        token = auth_header.replace('Bearer ', '') if auth_header.startswith('Bearer ') else None
-        user_id = get_user_id_from_token(token) if token else 'anonymous'
+        user_id = get_request_user_id()
         
-        if not flair_file.filename or not t1ce_file.filename:
-            return jsonify({'error': 'No files selected'}), 400
-        
-        # Save files temporarily
-        with tempfile.TemporaryDirectory() as temp_dir:
-            flair_path = os.path.join(temp_dir, 'flair.nii')
-            t1ce_path = os.path.join(temp_dir, 't1ce.nii')
-            
-            flair_file.save(flair_path)
-            t1ce_file.save(t1ce_path)
-            
-            # Make prediction
-            prediction, probabilities = predictor.predict_single_slice(
-                flair_path, t1ce_path, slice_index
-            )
-            
-            if prediction is None:
-                return jsonify({'error': 'Failed to process images'}), 500
-            
-            # Get the original images for visualization
-            flair_img = predictor.preprocess_image(flair_path, slice_index)
-            t1ce_img = predictor.preprocess_image(t1ce_path, slice_index)
-            
-            # Create visualization
-            visualization = create_visualization(
-                flair_img, t1ce_img, prediction, probabilities, slice_index
-            )
-            
-            # Calculate statistics
-            unique, counts = np.unique(prediction, return_counts=True)
-            class_stats = dict(zip(unique.astype(int).tolist(), counts.astype(int).tolist()))
-
-            # Prepare analysis data
-            analysis_data = {
-                'visualization': visualization,
-                'slice_index': int(slice_index),
-                'class_statistics': class_stats,
-                'prediction_shape': prediction.shape if prediction is not None else None,
-                'probabilities_shape': probabilities.shape if probabilities is not None else None,
-                'patient_id': patient_id,
-                'flair_filename': flair_file.filename,
-                't1ce_filename': t1ce_file.filename,
-                'user_id': user_id
-            }
-
-            # Save to history
-            analysis_id = save_analysis(user_id, analysis_data)
-
-            return jsonify({
-                'success': True,
-                'analysis_id': analysis_id,
-                'slice_index': slice_index,
-                'visualization': visualization,
-                'class_statistics': class_stats,
-                'message': 'Prediction completed successfully'
-            })
+        with get_request_volumes() as volumes:
+            return jsonify(run_slice_prediction(volumes, slice_index, patient_id, user_id))
     
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
     except Exception as e:
         return jsonify({'error': f'Prediction error: {str(e)}'}), 500
 
@@ -517,66 +831,298 @@ def predict():
 def download_report():
     """Generate and download comprehensive JPG report"""
     if predictor is None:
-        return jsonify({
-            'error': 'Model not loaded',
-            'model_status': model_status,
-            'model_error': model_error
-        }), 500
+        return model_unavailable_response()
 
     try:
-        # Get uploaded files and parameters
+        slice_index = int(request.form.get('slice_index', 75))
+        profile = get_request_report_profile()
+
+        with get_request_volumes() as volumes:
+            report_buffer, filename = run_report(volumes, slice_index, profile=profile)
+
+        return send_file(
+            report_buffer,
+            mimetype='image/jpeg',
+            as_attachment=True,
+            download_name=filename
+        )
+
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except Exception as e:
+        return jsonify({'error': f'Report generation error: {str(e)}'}), 500
+
+@app.route('/api/jobs/predict', methods=['POST'])
+def submit_prediction_job():
+    """Queue a single-slice prediction; same form fields as /api/predict"""
+    if predictor is None:
+        return model_unavailable_response()
+
+    try:
+        slice_index = int(request.form.get('slice_index', 75))
+        patient_id = request.form.get('patient_id', '')
+        user_id = get_request_user_id()
+
+        # The files must outlive this request, so the job releases them; queued
+        # jobs keep their volumes on disk rather than in memory
+        volumes = get_request_volumes(spool_bytes=app.config['JOB_SPOOL_BYTES'])
+        job, error = submit_job(
+            'predict',
+            lambda job: run_slice_prediction(volumes, slice_index, patient_id, user_id, job),
+            volumes, user_id
+        )
+        return error or job_accepted_response(job)
+
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except Exception as e:
+        return jsonify({'error': f'Prediction error: {str(e)}'}), 500
+
+@app.route('/api/jobs/report', methods=['POST'])
+def submit_report_job():
+    """Queue a JPG report; same form fields as /api/download-report"""
+    if predictor is None:
+        return model_unavailable_response()
+
+    try:
+        from job_queue import JobFile
+
+        slice_index = int(request.form.get('slice_index', 75))
+        profile = get_request_report_profile()
+        user_id = get_request_user_id()
+
+        def render(job):
+            report_buffer, filename = run_report(volumes, slice_index, job, profile)
+            return JobFile(report_buffer.getvalue(), 'image/jpeg', filename)
+
+        volumes = get_request_volumes(spool_bytes=app.config['JOB_SPOOL_BYTES'])
+        job, error = submit_job('report', render, volumes, user_id)
+        return error or job_accepted_response(job)
+
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    except Exception as e:
+        return jsonify({'error': f'Report generation error: {str(e)}'}), 500
+
+@app.route('/api/predict-volume', methods=['POST'])
+def predict_volume():
+    """Queue a full-volume segmentation job for uploaded files or a stored study
+
+    Slices without tissue are skipped unless skip_empty=false; with
+    label_map=true the job result is the full-resolution label map as a
+    .nii.gz file, and the statistics are reported in the job status.
+    """
+    if predictor is None:
+        return model_unavailable_response()
+
+    volumes = None
+    try:
+        start_slice = int(request.form.get('start_slice', 0))
+        num_slices = request.form.get('num_slices')
+        chunk_size = int(request.form.get('chunk_size', app.config['VOLUME_CHUNK_SIZE']))
+        skip_empty = get_request_flag('skip_empty', app.config['VOLUME_SKIP_EMPTY_SLICES'])
+        label_map = get_request_flag('label_map', False)
+        user_id = get_request_user_id()
+
+        # The files must outlive this request, so the job releases them; queued
+        # jobs keep their volumes on disk rather than in memory
+        volumes = get_request_volumes(spool_bytes=app.config['JOB_SPOOL_BYTES'])
+
+        # Validate the slice range from the header alone
+        from brain_tumor_predictor import NiftiSliceReader
+        total_slices = min(NiftiSliceReader(volumes.flair).num_slices,
+                           NiftiSliceReader(volumes.t1ce).num_slices)
+
+        if not 0 <= start_slice < total_slices:
+            raise ValueError(f'start_slice must be between 0 and {total_slices - 1}')
+
+        num_slices = total_slices - start_slice if num_slices is None else min(int(num_slices), total_slices - start_slice)
+
+        if num_slices <= 0 or chunk_size <= 0:
+            raise ValueError('num_slices and chunk_size must be positive')
+
+        job, error = submit_job(
+            'volume',
+            lambda job: run_volume_segmentation(job, volumes, start_slice, num_slices, chunk_size,
+                                                skip_empty, label_map),
+            volumes, user_id
+        )
+        return error or job_accepted_response(job, start_slice=start_slice, num_slices=num_slices)
+
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+
+    except ValueError as e:
+        if volumes:
+            volumes.close()
+        return jsonify({'error': str(e)}), 400
+
+    except Exception as e:
+        if volumes:
+            volumes.close()
+        return jsonify({'error': f'Volume prediction error: {str(e)}'}), 500
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+@app.route('/api/predict-volume/<job_id>', methods=['GET'])
+def get_job(job_id):
+    """Get status, progress and (for JSON results) the result of a job"""
+    job = get_request_job(job_id)
+
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/result', methods=['GET'])
+def get_job_result(job_id):
+    """Get the result of a completed job (JSON, or the file for report jobs)"""
+    from job_queue import JobFile
+
+    job = get_request_job(job_id)
+
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    if job.status != 'completed':
+        return jsonify({'error': f'Job is {job.status}', 'job': job.to_dict()}), 409
+
+    if isinstance(job.result, JobFile):
+        found = get_job_queue().result_path(job)
+        if found is None:
+            return jsonify({'error': 'Job result has expired'}), 404
+        return send_file(
+            found[0],
+            mimetype=job.result.mimetype,
+            as_attachment=True,
+            download_name=job.result.filename
+        )
+
+    return jsonify(job.result)
+
+@app.route('/api/jobs/<job_id>', methods=['DELETE'])
+def cancel_job(job_id):
+    """Cancel a queued or running job"""
+    if get_request_job(job_id) is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    job = get_job_queue().cancel(job_id)
+
+    return jsonify({'success': True, 'job': job.to_dict()})
+
+@app.route('/api/jobs/<job_id>/events', methods=['GET'])
+@app.route('/api/predict-volume/<job_id>/events', methods=['GET'])
+def stream_job(job_id):
+    """Stream job progress as Server-Sent Events"""
+    from job_queue import TERMINAL_EVENTS
+
+    queue = get_job_queue()
+    job = get_request_job(job_id)
+
+    if job is None:
+        return jsonify({'error': 'Job not found'}), 404
+
+    def generate():
+        sent = 0
+        while True:
+            # Wake up periodically so a keep-alive comment can be sent
+            pending = queue.wait_for_events(job, sent, timeout=15)
+
+            if not pending:
+                yield ': keep-alive\n\n'
+                continue
+
+            for event, data in pending:
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+                if event in TERMINAL_EVENTS:
+                    return
+            sent += len(pending)
+
+    return Response(
+        stream_with_context(generate()),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    )
+
+@app.route('/api/artifacts/<artifact_id>', methods=['GET'])
+def get_artifact(artifact_id):
+    """Serve a rendered image with ETag, Cache-Control and Range support"""
+    found = get_artifact_store().find(artifact_id)
+
+    if found is None:
+        return jsonify({'error': 'Artifact not found'}), 404
+
+    path, mimetype = found
+    response = send_file(
+        path,
+        mimetype=mimetype,
+        etag=artifact_id,
+        conditional=True,
+        max_age=app.config['ARTIFACT_MAX_AGE']
+    )
+    response.accept_ranges = 'bytes'
+    # Artifacts never change once written, but belong to one user
+    response.cache_control.public = False
+    response.cache_control.private = True
+    response.cache_control.immutable = True
+    return response
+
+@app.route('/api/studies', methods=['POST'])
+def create_study():
+    """Upload a FLAIR/T1CE pair once and get a study ID for later requests"""
+    try:
         if 'flair' not in request.files or 't1ce' not in request.files:
             return jsonify({'error': 'Both FLAIR and T1CE files are required'}), 400
 
         flair_file = request.files['flair']
         t1ce_file = request.files['t1ce']
-        slice_index = int(request.form.get('slice_index', 75))
 
         if not flair_file.filename or not t1ce_file.filename:
             return jsonify({'error': 'No files selected'}), 400
 
-        # Save files temporarily and process
-        with tempfile.TemporaryDirectory() as temp_dir:
-            flair_path = os.path.join(temp_dir, 'flair.nii')
-            t1ce_path = os.path.join(temp_dir, 't1ce.nii')
+        user_id = get_request_user_id()
 
-            flair_file.save(flair_path)
-            t1ce_file.save(t1ce_path)
+        store = get_study_store()
+        study = store.create(flair_file, t1ce_file, user_id)
 
-            # Make prediction
-            prediction, probabilities = predictor.predict_single_slice(
-                flair_path, t1ce_path, slice_index
-            )
+        return jsonify({'success': True, **study.to_dict(store.ttl_seconds)}), 201
 
-            if prediction is None:
-                return jsonify({'error': 'Failed to process images'}), 500
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-            # Get the original images for visualization
-            flair_img = predictor.preprocess_image(flair_path, slice_index)
-            t1ce_img = predictor.preprocess_image(t1ce_path, slice_index)
+    except Exception as e:
+        return jsonify({'error': f'Study upload error: {str(e)}'}), 500
 
-            # Calculate statistics
-            unique, counts = np.unique(prediction, return_counts=True)
-            class_stats = dict(zip(unique.astype(int).tolist(), counts.astype(int).tolist()))
+@app.route('/api/studies/<study_id>', methods=['GET'])
+def get_study(study_id):
+    """Get metadata of an uploaded study"""
+    store = get_study_store()
+    # Other users' studies get the same 404 as unknown IDs
+    study = store.get(study_id, get_request_user_id())
 
-            # Create comprehensive report
-            report_buffer = create_comprehensive_report(
-                flair_img, t1ce_img, prediction, probabilities, slice_index, class_stats
-            )
+    if study is None:
+        return jsonify({'error': 'Study not found or expired'}), 404
 
-            # Generate filename with timestamp
-            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-            filename = f"brain_tumor_report_{timestamp}_slice_{slice_index}.jpg"
+    return jsonify({'success': True, **study.to_dict(store.ttl_seconds)})
 
-            return send_file(
-                report_buffer,
-                mimetype='image/jpeg',
-                as_attachment=True,
-                download_name=filename
-            )
+@app.route('/api/studies/<study_id>', methods=['DELETE'])
+def delete_study(study_id):
+    """Delete an uploaded study"""
+    if not get_study_store().delete(study_id, get_request_user_id()):
+        return jsonify({'error': 'Study not found or expired'}), 404
 
-    except Exception as e:
-        return jsonify({'error': f'Report generation error: {str(e)}'}), 500
+    return jsonify({'success': True, 'message': 'Study deleted successfully'})
 
 @app.route('/api/auth/login', methods=['POST'])
 def auth_login():
@@ -678,18 +1224,37 @@ def get_analyses():
         token = auth_header.replace('Bearer ', '') if auth_header.startswith('Bearer ') else None
         user_id = get_user_id_from_token(token) if token else 'anonymous'
 
-        # Get limit from query params
-        limit = int(request.args.get('limit', 10))
+        # Page size, keyset cursor and filters from query params
+        from analysis_store import encode_cursor, decode_cursor
+        limit = max(1, min(int(request.args.get('limit', 10)), 100))
+        cursor = request.args.get('cursor')
+        result = request.args.get('result')
+        if result not in (None, 'normal', 'tumor_detected'):
+            raise ValueError(f'Unknown result filter: {result}')
+        filters = {
+            'result': result,
+            'date_from': parse_date_filter(request.args.get('date_from')),
+            'date_to': parse_date_filter(request.args.get('date_to'), end=True),
+            'patient_id': request.args.get('patient_id') or None
+        }
 
-        # Get user's analyses
-        analyses = get_user_analyses(user_id, limit)
+        # One extra row tells whether another page follows
+        analyses = get_user_analyses(
+            user_id, limit + 1, decode_cursor(cursor) if cursor else None, **filters
+        )
+        has_more = len(analyses) > limit
+        analyses = analyses[:limit]
 
         return jsonify({
             'success': True,
             'analyses': analyses,
-            'total': len(analysis_history.get(user_id, []))
+            'total': get_analysis_store().count_user_analyses(user_id),
+            'has_more': has_more,
+            'next_cursor': encode_cursor(analyses[-1]) if has_more else None
         })
 
+    except ValueError as e:
+        return jsonify({'error': f'Invalid query: {str(e)}'}), 400
     except Exception as e:
         return jsonify({'error': f'Failed to get analyses: {str(e)}'}), 500
 
@@ -714,20 +1279,16 @@ def get_analysis(analysis_id):
 def delete_analysis(analysis_id):
     """Delete specific analysis"""
     try:
-        # Get user info from token
-        auth_header = request.headers.get('Authorization', '')
-        token = auth_header.replace('Bearer ', '') if auth_header.startswith('Bearer ') else None
-        user_id = get_user_id_from_token(token) if token else 'anonymous'
+        user_id = get_request_user_id()
 
-        # Find and remove analysis from user's history
-        if user_id in analysis_history:
-            analysis_history[user_id] = [
-                a for a in analysis_history[user_id] if a['id'] != analysis_id
-            ]
+        # Only the owner may delete an analysis; others get the same 404 as for unknown IDs
+        analysis_data = get_analysis_by_id(analysis_id)
+        if not analysis_data or analysis_data.get('user_id') != user_id:
+            return jsonify({'error': 'Analysis not found'}), 404
 
-        # Remove from analysis results
-        if analysis_id in analysis_results:
-            del analysis_results[analysis_id]
+        # Remove from history and drop its rendered images
+        if not delete_analysis_by_id(analysis_id):
+            return jsonify({'error': 'Analysis not found'}), 404
 
         return jsonify({
             'success': True,
@@ -739,26 +1300,55 @@ def delete_analysis(analysis_id):
 
 @app.route('/api/analyses/<analysis_id>/download', methods=['GET'])
 def download_analysis_report(analysis_id):
-    """Download report for specific analysis"""
+    """Download the JPG report of a stored analysis
+
+    The report is rendered from the saved prediction, so neither the
+    volumes nor the model are needed. Reports in the default profile are
+    kept as an artifact after the first download; ?profile= renders another
+    profile on demand.
+    """
     try:
+        from report_renderer import REPORT_PROFILES
+
         analysis_data = get_analysis_by_id(analysis_id)
 
         if not analysis_data:
             return jsonify({'error': 'Analysis not found'}), 404
 
-        # Generate filename with timestamp
-        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        patient_id = analysis_data.get('patient_id', 'unknown')
-        slice_idx = analysis_data.get('slice_index', 0)
-        filename = f"brain_tumor_report_{patient_id}_{timestamp}_slice_{slice_idx}.jpg"
+        profile = request.args.get('profile') or app.config['REPORT_PROFILE']
+        if profile not in REPORT_PROFILES:
+            raise ValueError(f"Unknown report profile: {profile} (choose from {', '.join(REPORT_PROFILES)})")
 
-        # For now, return the analysis data (in a real app, regenerate the report)
-        return jsonify({
-            'success': True,
-            'download_url': f'/api/analyses/{analysis_id}/report.jpg',
-            'filename': filename,
-            'message': 'Use the JPG download from the original analysis for now'
-        })
+        patient_id = analysis_data.get('patient_id') or 'unknown'
+        slice_idx = analysis_data.get('slice_index', 0)
+        filename = f"brain_tumor_report_{patient_id}_slice_{slice_idx}.jpg"
+
+        store = get_artifact_store()
+        report_artifact = analysis_data.get('report_artifact') if profile == app.config['REPORT_PROFILE'] else None
+        found = store.find(report_artifact) if report_artifact else None
+
+        if found is None:
+            report = render_analysis_report(analysis_data, profile)
+            if report_artifact:
+                store.put(report, 'image/jpeg', report_artifact)
+                # The analysis may have been evicted while its report was rendered
+                if get_analysis_by_id(analysis_id) is None:
+                    store.delete(report_artifact)
+                found = store.find(report_artifact)
+            if found is None:
+                return send_file(io.BytesIO(report), mimetype='image/jpeg', as_attachment=True,
+                                 download_name=filename)
+
+        response = send_file(found[0], mimetype='image/jpeg', as_attachment=True, download_name=filename,
+                             etag=report_artifact, conditional=True)
+        response.cache_control.private = True
+        return response
+
+    except LookupError as e:
+        return jsonify({'error': str(e)}), 404
+
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     except Exception as e:
         return jsonify({'error': f'Failed to download report: {str(e)}'}), 500
@@ -772,27 +1362,18 @@ def get_user_stats():
         token = auth_header.replace('Bearer ', '') if auth_header.startswith('Bearer ') else None
         user_id = get_user_id_from_token(token) if token else 'anonymous'
 
-        # Calculate statistics
-        user_analyses = analysis_history.get(user_id, [])
-        total_analyses = len(user_analyses)
-        completed_analyses = len([a for a in user_analyses if a['status'] == 'completed'])
-        tumor_detected = len([a for a in user_analyses if a['result'] == 'tumor_detected'])
-
-        # Calculate this month's analyses
+        # Calculate statistics (one aggregate over the user's history)
         current_month = datetime.now().strftime('%Y-%m')
-        this_month_analyses = len([
-            a for a in user_analyses
-            if a['date'].startswith(current_month)
-        ])
+        counts = get_analysis_store().user_stats(user_id, current_month)
 
         return jsonify({
             'success': True,
             'stats': {
-                'total_analyses': total_analyses,
-                'completed_analyses': completed_analyses,
-                'tumor_detected': tumor_detected,
-                'reports_generated': completed_analyses,  # Assuming one report per completed analysis
-                'this_month_analyses': this_month_analyses
+                'total_analyses': counts['total'],
+                'completed_analyses': counts['completed'],
+                'tumor_detected': counts['tumor_detected'],
+                'reports_generated': counts['completed'],  # Assuming one report per completed analysis
+                'this_month_analyses': counts['this_month']
             }
         })
 
@@ -822,8 +1403,8 @@ if __name__ == '__main__':
     print("🧠 Brain Tumor Segmentation Web App - Final Version")
     print("=" * 60)
     
-    # Initialize model
-    model_loaded = init_model()
+    # Load the model in the background; /api/status reports progress meanwhile
+    start_model_loading()
     
     print("\n🚀 Starting Flask server...")
     print("🌐 Open your browser and go to: http://localhost:5000")
@@ -832,9 +1413,4 @@ if __name__ == '__main__':
     print("⏹️  Press Ctrl+C to stop the server")
     print("\n" + "=" * 60)
     
-    if model_loaded:
-        print("✅ Model loaded successfully - Ready for predictions!")
-    else:
-        print("⚠️  Model loading failed - Check the error messages above")
-    
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Artifact Store
+Keeps rendered images (and the compact predictions they are rendered from)
+as immutable binary files on disk so they can be served, and cached by
+browsers, separately from the JSON API responses
+"""
+
+import os
+import re
+import tempfile
+import uuid
+
+ARTIFACT_ID_PATTERN = re.compile(r'^[0-9a-f]{32}$')
+
+# File extension for each stored media type
+EXTENSIONS = {
+    'image/png': '.png',
+    'image/jpeg': '.jpg',
+    'application/x-npz': '.npz',
+    'application/gzip': '.nii.gz'
+}
+
+class ArtifactStore:
+    def __init__(self, root_dir=None):
+        """Create a store under root_dir (a fresh temporary directory by default)"""
+        self.root_dir = root_dir or tempfile.mkdtemp(prefix='artifacts_')
+        os.makedirs(self.root_dir, exist_ok=True)
+
+    def put(self, content, mimetype='image/png', artifact_id=None):
+        """Write content to a new artifact and return its ID
+
+        Artifacts are never modified after creation, so the ID doubles as a
+        strong ETag. An artifact_id reserved earlier with new_id() can be
+        passed to fill it in later.
+        """
+        artifact_id = artifact_id or self.new_id()
+        path = self.path(artifact_id, mimetype)
+        temp_path = f'{path}.{uuid.uuid4().hex}.tmp'
+
+        with open(temp_path, 'wb') as f:
+            f.write(content)
+        os.replace(temp_path, path)
+
+        return artifact_id
+
+    @staticmethod
+    def new_id():
+        return uuid.uuid4().hex
+
+    def read(self, artifact_id):
+        """Return the content of an existing artifact, or None"""
+        found = self.find(artifact_id)
+        if found is None:
+            return None
+        try:
+            with open(found[0], 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+
+    def path(self, artifact_id, mimetype='image/png'):
+        """Filesystem path of an artifact; raises ValueError for malformed IDs"""
+        if not ARTIFACT_ID_PATTERN.match(artifact_id or ''):
+            raise ValueError('Invalid artifact ID')
+        return os.path.join(self.root_dir, artifact_id + EXTENSIONS[mimetype])
+
+    def find(self, artifact_id):
+        """Return (path, mimetype) of an existing artifact, or None"""
+        for mimetype in EXTENSIONS:
+            try:
+                path = self.path(artifact_id, mimetype)
+            except ValueError:
+                return None
+            if os.path.exists(path):
+                return path, mimetype
+        return None
+
+    def delete(self, artifact_id):
+        """Remove an artifact if it exists"""
+        found = self.find(artifact_id)
+        if found is None:
+            return False
+        try:
+            os.remove(found[0])
+        except FileNotFoundError:
+            return False
+        return True
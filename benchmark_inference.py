@@ -0,0 +1,61 @@
+#!/usr/bin/env python3
+"""
+Inference Latency Benchmark
+Compares per-slice latency of Model.predict against the compiled
+fixed-signature inference function used by BrainTumorPredictor
+"""
+
+import argparse
+import os
+import time
+import numpy as np
+
+from brain_tumor_predictor import BrainTumorPredictor, IMG_SIZE
+
+def measure(fn, X, runs):
+    """Return per-call latencies in milliseconds"""
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn(X)
+        timings.append((time.perf_counter() - start) * 1000.0)
+    return np.array(timings)
+
+def report(name, timings):
+    print(f"{name:<24} p50: {np.percentile(timings, 50):8.2f} ms   "
+          f"p99: {np.percentile(timings, 99):8.2f} ms   "
+          f"mean: {timings.mean():8.2f} ms")
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='best_model.h5', help='Path to the trained model')
+    parser.add_argument('--runs', type=int, default=200, help='Timed calls per path')
+    parser.add_argument('--warmup', type=int, default=10, help='Untimed calls per path')
+    parser.add_argument('--batch', type=int, default=1, help='Slices per call')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.model):
+        print(f"❌ Model file not found: {args.model}")
+        return
+
+    predictor = BrainTumorPredictor(args.model)
+    X = np.random.default_rng(0).random((args.batch, IMG_SIZE, IMG_SIZE, 2), dtype=np.float32)
+
+    paths = [
+        ('Model.predict', lambda x: predictor.model.predict(x, verbose=0)),
+        ('compiled tf.function', predictor.predict_batch),
+    ]
+
+    print(f"\n⏱️  {args.runs} runs, batch size {args.batch}\n")
+    results = {}
+    for name, fn in paths:
+        measure(fn, X, args.warmup)
+        results[name] = measure(fn, X, args.runs) / args.batch
+        report(name, results[name])
+
+    baseline = np.percentile(results['Model.predict'], 50)
+    compiled = np.percentile(results['compiled tf.function'], 50)
+    print(f"\n🚀 p50 speedup: {baseline / compiled:.2f}x")
+
+if __name__ == "__main__":
+    main()
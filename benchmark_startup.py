@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Startup Benchmark
+Measures, in fresh interpreters, how long importing each server module takes
+and which imports dominate (via python -X importtime), plus the time until
+the web app answers /api/status
+"""
+
+import argparse
+import os
+import subprocess
+import sys
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+# Answers /api/status from a fresh interpreter and prints the elapsed seconds
+FIRST_RESPONSE_SCRIPT = """
+import time
+start = time.perf_counter()
+import app
+response = app.app.test_client().get('/api/status')
+assert response.status_code == 200
+print(f'FIRST_RESPONSE {time.perf_counter() - start:.4f}')
+"""
+
+def import_profile(module):
+    """Return (total_seconds, [(cumulative_seconds, name), ...]) for importing module"""
+    completed = subprocess.run(
+        [sys.executable, '-X', 'importtime', '-c', f'import {module}'],
+        cwd=HERE, capture_output=True, text=True
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+    entries = []
+    for line in completed.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nesting is shown by two spaces per level after the separator space
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        entries.append((int(cumulative) / 1e6, name.strip(), depth))
+
+    # The requested module is reported last, right after everything it pulled in
+    if not entries:
+        return 0.0, []
+    direct = []
+    for seconds, name, depth in reversed(entries[:-1]):
+        if depth == 0:
+            break
+        if depth == 1:
+            direct.append((seconds, name))
+    return entries[-1][0], sorted(direct, reverse=True)
+
+def first_response_seconds():
+    completed = subprocess.run(
+        [sys.executable, '-c', FIRST_RESPONSE_SCRIPT],
+        cwd=HERE, capture_output=True, text=True
+    )
+    for line in completed.stdout.splitlines():
+        if line.startswith('FIRST_RESPONSE'):
+            return float(line.split()[1])
+    raise RuntimeError(completed.stderr.strip().splitlines()[-1])
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('modules', nargs='*', default=['app', 'brain_tumor_predictor', 'model_server'],
+                        help='Modules to import')
+    parser.add_argument('--top', type=int, default=8, help='Slowest direct imports to list per module')
+    parser.add_argument('--runs', type=int, default=3, help='Fresh interpreters per measurement (best is kept)')
+    args = parser.parse_args()
+
+    print(f"\n⏱️  Import times (best of {args.runs} fresh interpreters)\n")
+    for module in args.modules:
+        try:
+            runs = [import_profile(module) for _ in range(args.runs)]
+        except RuntimeError as e:
+            print(f"{module:<24} ❌ {e}")
+            continue
+
+        total, top = min(runs)
+        print(f"{module:<24} {total * 1000:8.1f} ms")
+        for cumulative, name in top[:args.top]:
+            print(f"    {name:<32} {cumulative * 1000:8.1f} ms")
+
+    try:
+        seconds = min(first_response_seconds() for _ in range(args.runs))
+        print(f"\n🚀 Import to first /api/status response: {seconds * 1000:.1f} ms")
+    except RuntimeError as e:
+        print(f"\n❌ /api/status check failed: {e}")
+
+if __name__ == "__main__":
+    main()
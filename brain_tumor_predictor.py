@@ -4,19 +4,35 @@ Brain Tumor Segmentation Predictor
 Uses the trained model to predict brain tumor segmentation from MRI scans
 """
 
+import glob
 import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import numpy as np
 import cv2
 import nibabel as nib
-import tensorflow as tf
-from keras import models
 import warnings
+from prediction_cache import PredictionCache, CachedPrediction, file_digest, DEFAULT_CACHE_BYTES
+from inference_backends import InferenceBackend
 warnings.filterwarnings('ignore')
 
+# TensorFlow is imported on first model load, so model-server clients never pay for it
+tf = None
+
+def import_tensorflow():
+    """Import TensorFlow into this module on first use and return it"""
+    global tf
+    if tf is None:
+        import tensorflow
+        tf = tensorflow
+    return tf
+
 # Configuration
 IMG_SIZE = 128
 VOLUME_SLICES = 100
 VOLUME_START_AT = 22
+PREDICT_BATCH_SIZE = 32  # Max slices per call of the compiled inference function
+DECODE_THREADS = 4  # Shared pool that decodes FLAIR while the caller decodes T1CE
 
 # Segmentation classes
 SEGMENT_CLASSES = {
@@ -73,18 +89,129 @@ def specificity(y_true, y_pred):
     possible_negatives = tf.reduce_sum(tf.round(tf.clip_by_value(1 - y_true, 0, 1)))
     return true_negatives / (possible_negatives + 1e-7)
 
-class BrainTumorPredictor:
-    def __init__(self, model_path):
-        """Initialize the predictor with the trained model"""
+class NiftiSliceReader:
+    """Read axial slices from a NIfTI file without decoding the whole volume
+
+    The image data is accessed through nibabel's array proxy, which is
+    memory-mapped for uncompressed .nii files, so only the requested slices
+    are read. Values stay in the file's native dtype until the final
+    conversion to float32. image_file is a path or an already opened
+    nibabel image (e.g. an upload from nifti_ingest).
+    """
+
+    def __init__(self, image_file):
+        self.image_file = image_file
+        if isinstance(image_file, nib.spatialimages.SpatialImage):
+            self.img = image_file
+        else:
+            self.img = nib.load(image_file, mmap=True)
+        self.dataobj = self.img.dataobj
+
+    @property
+    def shape(self):
+        return self.img.shape
+
+    @property
+    def num_slices(self):
+        return self.img.shape[2]
+
+    @property
+    def voxel_spacing(self):
+        """Voxel size in mm along each of the three spatial axes"""
+        return tuple(float(z) for z in self.img.header.get_zooms()[:3])
+
+    def clamp_index(self, slice_index):
+        """Clamp a slice index to the last available slice"""
+        if slice_index >= self.num_slices:
+            return self.num_slices - 1
+        return slice_index
+
+    def read_slice(self, slice_index):
+        """Read a single axial slice as float32"""
+        slice_index = self.clamp_index(slice_index)
+        return np.asarray(self.dataobj[:, :, slice_index]).astype(np.float32, copy=False)
+
+    def read_slices(self, start, stop):
+        """Read axial slices [start, stop) as a float32 (H, W, N) array"""
+        stop = min(stop, self.num_slices)
+        return np.asarray(self.dataobj[:, :, start:stop]).astype(np.float32, copy=False)
+
+    def read_volume(self):
+        """Read the full volume as float32"""
+        return np.asarray(self.dataobj).astype(np.float32, copy=False)
+
+# Decode pool, created on first use
+_decode_pool = None
+_decode_pool_lock = threading.Lock()
+
+def decode_pair(fn, flair, t1ce, discard=None):
+    """Return (fn(flair), fn(t1ce)) with the two calls running concurrently
+
+    The FLAIR call runs on a small shared pool while the caller handles
+    T1CE; gzip inflation, hashing and file reads release the GIL, so the
+    two overlap. If one call raises, discard (if given) is applied to the
+    other's result before the exception propagates.
+    """
+    global _decode_pool
+    with _decode_pool_lock:
+        if _decode_pool is None:
+            _decode_pool = ThreadPoolExecutor(max_workers=DECODE_THREADS, thread_name_prefix='decode')
+
+    future = _decode_pool.submit(fn, flair)
+    try:
+        t1ce_result = fn(t1ce)
+    except Exception:
+        if discard is not None and future.exception() is None:
+            discard(future.result())
+        raise
+
+    try:
+        flair_result = future.result()
+    except Exception:
+        if discard is not None:
+            discard(t1ce_result)
+        raise
+    return flair_result, t1ce_result
+
+class PreprocessedSlice:
+    """Resized and normalized FLAIR/T1CE slices for a single prediction"""
+
+    def __init__(self, flair, t1ce, slice_index):
+        self.flair = flair
+        self.t1ce = t1ce
+        self.slice_index = slice_index
+
+class KerasBackend(InferenceBackend):
+    """In-process tf.keras inference through a compiled, fixed-signature tf.function"""
+
+    name = 'keras'
+
+    def __init__(self, model_path, converted_model_dir=None, on_progress=None):
+        """Load the model and trace the inference function
+
+        The native copy of the model made on first load goes to
+        converted_model_dir (the model's own directory by default).
+        on_progress(stage) is called with 'loading_model' and
+        'warming_up' as loading advances.
+        """
         self.model_path = model_path
+        self.converted_model_dir = converted_model_dir or os.path.dirname(os.path.abspath(model_path))
+        self.model_version = None
         self.model = None
+        self.infer_fn = None
+        if on_progress is not None:
+            on_progress('loading_model')
         self.load_model()
+        if on_progress is not None:
+            on_progress('warming_up')
+        self.compile_inference()
 
     def load_model(self):
         """Load the trained model with custom metrics"""
         try:
             if not os.path.exists(self.model_path):
                 raise FileNotFoundError(f"Model file not found: {self.model_path}")
+            self.model_version = file_digest(self.model_path)
 
             custom_objects = {
                 'dice_coef': dice_coef,
@@ -101,9 +228,14 @@ class BrainTumorPredictor:
             warnings.filterwarnings('ignore')
 
             # Import TensorFlow explicitly
-            import tensorflow as tf
+            tf = import_tensorflow()
             print(f"Using TensorFlow version: {tf.__version__}")
 
+            # Fast path: the native copy saved by an earlier start
+            converted_path = self.converted_model_path()
+            if self.load_converted_model(converted_path):
+                return
+
             # Try multiple loading strategies for compatibility
             try:
                 # Strategy 1: Handle DTypePolicy compatibility issue
@@ -171,24 +303,124 @@ class BrainTumorPredictor:
             if self.model is not None:
                 print(f"📊 Model input shape: {self.model.input_shape}")
                 print(f"📊 Model output shape: {self.model.output_shape}")
+                self.save_converted_model(converted_path)
 
         except Exception as e:
             print(f"❌ Error loading model: {str(e)}")
             raise
 
+    def converted_model_path(self):
+        """Path of the native .keras copy, stamped with the source hash and TF version"""
+        stem = os.path.splitext(os.path.basename(self.model_path))[0]
+        return os.path.join(self.converted_model_dir,
+                            f"{stem}.{self.model_version}.tf{tf.__version__}.keras")
+
+    def load_converted_model(self, converted_path):
+        """Load a previously converted model; returns False if there is none usable"""
+        if not os.path.exists(converted_path):
+            return False
+
+        try:
+            self.model = tf.keras.models.load_model(converted_path, compile=False)
+        except Exception as e:
+            print(f"⚠️ Ignoring unreadable converted model {converted_path}: {e}")
+            self.model = None
+            return False
+
+        print(f"✅ Model loaded from converted copy {converted_path}")
+        return True
+
+    def save_converted_model(self, converted_path):
+        """Save the loaded model natively so later starts skip the compatibility strategies"""
+        temp_path = f"{converted_path[:-len('.keras')]}.{os.getpid()}.tmp.keras"
+        try:
+            os.makedirs(self.converted_model_dir, exist_ok=True)
+            self.model.save(temp_path)
+            os.replace(temp_path, converted_path)
+            print(f"💾 Converted model saved to {converted_path}")
+
+            # Copies for an older model file or TF version are never loaded again
+            stem = os.path.splitext(os.path.basename(self.model_path))[0]
+            for stale in glob.glob(os.path.join(self.converted_model_dir, f"{stem}.*.tf*.keras")):
+                if stale != converted_path and not stale.endswith('.tmp.keras'):
+                    os.remove(stale)
+        except Exception as e:
+            print(f"⚠️ Could not save converted model: {e}")
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+    def compile_inference(self):
+        """Wrap the model in a fixed-signature tf.function and trace it once
+
+        Calling the traced function directly skips the data adapter and
+        distribution loop that Model.predict sets up on every call.
+        """
+        if self.model is None:
+            return
+
+        model = self.model
+
+        @tf.function(input_signature=[tf.TensorSpec(shape=(None, IMG_SIZE, IMG_SIZE, 2), dtype=tf.float32)])
+        def infer(x):
+            return model(x, training=False)
+
+        # Warm-up pass so the first request does not pay the tracing cost
+        infer(tf.zeros((1, IMG_SIZE, IMG_SIZE, 2), dtype=tf.float32))
+        self.infer_fn = infer
+        print("⚡ Inference function compiled and warmed up")
+
+    def predict_batch(self, X):
+        """Run the model on a (N, IMG_SIZE, IMG_SIZE, 2) batch of slices"""
+        if self.model is None:
+            raise Exception("Model not loaded")
+        if self.infer_fn is None:
+            return self.model.predict(X, verbose=0)
+
+        X = np.asarray(X, dtype=np.float32)
+        if len(X) <= PREDICT_BATCH_SIZE:
+            return self.infer_fn(X).numpy()
+
+        # Large inputs are run in chunks to bound activation memory
+        outputs = [self.infer_fn(X[i:i + PREDICT_BATCH_SIZE]).numpy()
+                   for i in range(0, len(X), PREDICT_BATCH_SIZE)]
+        return np.concatenate(outputs, axis=0)
+
+class BrainTumorPredictor:
+    def __init__(self, model_path, cache_bytes=DEFAULT_CACHE_BYTES, backend=None,
+                 converted_model_dir=None, on_progress=None):
+        """Initialize the predictor with the trained model
+
+        Single-slice results are cached in memory up to cache_bytes;
+        pass cache_bytes=0 to disable the cache. Forward passes run on
+        backend (see inference_backends); by default a KerasBackend loads
+        model_path in-process, with converted_model_dir and on_progress
+        passed through to it.
+        """
+        self.model_path = model_path
+        self.converted_model_dir = converted_model_dir or os.path.dirname(os.path.abspath(model_path))
+        self._buffers = threading.local()
+        self.cache = PredictionCache(cache_bytes) if cache_bytes else None
+        self.backend = backend or KerasBackend(model_path, self.converted_model_dir, on_progress)
+        self.model_version = self.backend.model_version
+
+    @property
+    def model(self):
+        """The in-process Keras model, or None when another backend runs inference"""
+        return getattr(self.backend, 'model', None)
 
+    @property
+    def infer_fn(self):
+        return getattr(self.backend, 'infer_fn', None)
 
     def preprocess_image(self, image_file, slice_index=None):
         """Preprocess a single MRI image"""
         try:
-            # Load the NIfTI file
-            img = nib.load(image_file).get_fdata()
-            
-            # Select a specific slice if needed
+            # Read only the requested slice from the NIfTI file
+            reader = NiftiSliceReader(image_file)
             if slice_index is not None:
-                if slice_index >= img.shape[2]:
-                    slice_index = img.shape[2] - 1
-                img = img[:, :, slice_index]
+                img = reader.read_slice(slice_index)
+            else:
+                img = reader.read_volume()
             
             # Resize the image to (IMG_SIZE, IMG_SIZE)
             img_resized = cv2.resize(img, (IMG_SIZE, IMG_SIZE))
@@ -203,65 +435,138 @@ class BrainTumorPredictor:
             print(f"❌ Error preprocessing image {image_file}: {str(e)}")
             return None
     
-    def predict_single_slice(self, flair_path, t1ce_path, slice_index):
-        """Predict segmentation for a single slice"""
+    def preprocess_slice_pair(self, flair_path, t1ce_path, slice_index):
+        """Decode the FLAIR and T1CE slice once and keep both for reuse"""
+        flair_slice, t1ce_slice = decode_pair(
+            lambda image_file: self.preprocess_image(image_file, slice_index), flair_path, t1ce_path
+        )
+
+        if flair_slice is None or t1ce_slice is None:
+            return None
+
+        return PreprocessedSlice(flair_slice, t1ce_slice, slice_index)
+
+    def predict_batch(self, X):
+        """Run the model on a (N, IMG_SIZE, IMG_SIZE, 2) batch of slices"""
+        return self.backend.predict_batch(X)
+
+    def predict_preprocessed(self, inputs):
+        """Predict segmentation for an already preprocessed slice pair"""
+        # Prepare input array
+        X = np.zeros((1, IMG_SIZE, IMG_SIZE, 2), dtype=np.float32)
+        X[0, :, :, 0] = inputs.flair
+        X[0, :, :, 1] = inputs.t1ce
+
+        # Make prediction
+        pred = self.predict_batch(X)
+
+        # Return argmax prediction (class with highest probability)
+        return np.argmax(pred[0], axis=-1), pred[0]
+
+    def predict_single_slice(self, flair_path, t1ce_path, slice_index, return_inputs=False, predict_fn=None,
+                             digests=None):
+        """Predict segmentation for a single slice
+
+        With return_inputs=True the preprocessed slices are returned as a
+        third element so callers can display them without decoding again.
+        Results are looked up in the prediction cache first, using the
+        (flair, t1ce) content digests if the caller already knows them;
+        predict_fn replaces predict_preprocessed for the forward pass on a miss.
+        """
         try:
-            # Prepare input array
-            X = np.zeros((1, IMG_SIZE, IMG_SIZE, 2))
+            key = None
+            if self.cache is not None:
+                flair_digest, t1ce_digest = digests or decode_pair(file_digest, flair_path, t1ce_path)
+                key = PredictionCache.make_key(flair_digest, t1ce_digest, slice_index, self.model_version)
+                entry = self.cache.get(key)
+                if entry is not None:
+                    prediction, probabilities, flair, t1ce = entry.unpack()
+                    if return_inputs:
+                        return prediction, probabilities, PreprocessedSlice(flair, t1ce, slice_index)
+                    return prediction, probabilities
 
-            # Process FLAIR and T1CE images
-            flair_slice = self.preprocess_image(flair_path, slice_index)
-            t1ce_slice = self.preprocess_image(t1ce_path, slice_index)
+            inputs = self.preprocess_slice_pair(flair_path, t1ce_path, slice_index)
 
-            if flair_slice is None or t1ce_slice is None:
-                return None, None
+            if inputs is None:
+                return (None, None, None) if return_inputs else (None, None)
 
-            X[0, :, :, 0] = flair_slice
-            X[0, :, :, 1] = t1ce_slice
+            prediction, probabilities = (predict_fn or self.predict_preprocessed)(inputs)
 
-            # Make prediction
-            if self.model is not None:
-                pred = self.model.predict(X, verbose=0)
-            else:
-                raise Exception("Model not loaded")
+            if key is not None:
+                self.cache.put(key, CachedPrediction(prediction, probabilities, inputs.flair, inputs.t1ce))
 
-            # Return argmax prediction (class with highest probability)
-            return np.argmax(pred[0], axis=-1), pred[0]
+            if return_inputs:
+                return prediction, probabilities, inputs
+            return prediction, probabilities
 
         except Exception as e:
             print(f"❌ Error during prediction: {str(e)}")
-            return None, None
-    
+            return (None, None, None) if return_inputs else (None, None)
+
+    def _thread_buffer(self, name, shape):
+        """Return a reusable float32 buffer for this thread, grown on demand"""
+        buffer = getattr(self._buffers, name, None)
+        if buffer is None or len(buffer) < shape[0]:
+            buffer = np.empty(shape, dtype=np.float32)
+            setattr(self._buffers, name, buffer)
+        return buffer[:shape[0]]
+
+    def preprocess_volume(self, flair_path, t1ce_path, start_slice=VOLUME_START_AT, num_slices=VOLUME_SLICES):
+        """Resize and normalize a slice range of both modalities into the model input
+
+        The returned array is only valid until the next call from the same
+        thread (see preprocess_slices).
+        """
+        # Read only the requested slice range from each volume, both at once
+        flair, t1ce = decode_pair(
+            lambda image_file: NiftiSliceReader(image_file).read_slices(start_slice, start_slice + num_slices),
+            flair_path, t1ce_path
+        )
+        return self.preprocess_slices(flair, t1ce, num_slices)
+
+    def preprocess_slices(self, flair, t1ce, num_slices=None):
+        """Resize and normalize (H, W, N) FLAIR and T1CE slice stacks into the model input
+
+        NIfTI slices come back Fortran-ordered, so each slice is resized
+        through its contiguous transposed view straight into a staging
+        buffer, and each modality is then copied into the float32 input
+        buffer in one transposing assignment. Both buffers are reused per
+        thread and the input is normalized in place, so the returned array
+        is only valid until the next call from the same thread. The input
+        is padded with empty slices up to num_slices.
+        """
+        count = min(flair.shape[2], t1ce.shape[2])
+        if num_slices is None:
+            num_slices = count
+        count = min(count, num_slices)
+
+        X = self._thread_buffer('volume_input', (num_slices, IMG_SIZE, IMG_SIZE, 2))
+        staging = self._thread_buffer('volume_staging', (count, IMG_SIZE, IMG_SIZE))
+
+        for channel, volume in enumerate((flair, t1ce)):
+            # (H, W, N) Fortran order -> (N, W, H) C order, a view in the common case
+            slices = np.ascontiguousarray(volume[:, :, :count].T)
+            for i in range(count):
+                cv2.resize(slices[i], (IMG_SIZE, IMG_SIZE), dst=staging[i])
+            X[:count, :, :, channel] = staging.transpose(0, 2, 1)
+
+        # Slices past the end of the volume stay empty
+        X[count:] = 0
+
+        # Normalize in place
+        peak = X.max() if num_slices > 0 else 0
+        if peak > 0:
+            np.divide(X, peak, out=X)
+
+        return X
+
     def predict_volume(self, flair_path, t1ce_path, start_slice=VOLUME_START_AT, num_slices=VOLUME_SLICES):
         """Predict segmentation for multiple slices"""
         try:
-            # Load full volumes
-            flair = nib.load(flair_path).get_fdata()
-            t1ce = nib.load(t1ce_path).get_fdata()
-
-            # Prepare input array
-            X = np.zeros((num_slices, IMG_SIZE, IMG_SIZE, 2))
-
-            # Process each slice
-            for i in range(num_slices):
-                slice_idx = start_slice + i
-                if slice_idx < flair.shape[2]:
-                    # Resize and normalize
-                    flair_slice = cv2.resize(flair[:, :, slice_idx], (IMG_SIZE, IMG_SIZE))
-                    t1ce_slice = cv2.resize(t1ce[:, :, slice_idx], (IMG_SIZE, IMG_SIZE))
-
-                    X[i, :, :, 0] = flair_slice
-                    X[i, :, :, 1] = t1ce_slice
-
-            # Normalize
-            if np.max(X) > 0:
-                X = X / np.max(X)
+            X = self.preprocess_volume(flair_path, t1ce_path, start_slice, num_slices)
 
             # Make predictions
-            if self.model is not None:
-                predictions = self.model.predict(X, verbose=1)
-            else:
-                raise Exception("Model not loaded")
+            predictions = self.predict_batch(X)
 
             return predictions
 
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+"""
+Quantized Model Comparison
+Exports the model to TFLite in each quantization mode and reports, against
+the float Keras model: per-class Dice agreement of the predicted labels,
+pixel agreement, model size and per-slice latency
+
+    python compare_quantized.py --flair flair.nii --t1ce t1ce.nii --threads 1
+
+The exported .tflite files are kept (next to the model by default) so the
+chosen one can be served with TFLITE_MODEL_PATH.
+"""
+
+import argparse
+import os
+import time
+
+import numpy as np
+
+from brain_tumor_predictor import BrainTumorPredictor, SEGMENT_CLASSES, IMG_SIZE, VOLUME_START_AT, VOLUME_SLICES
+from tflite_inference import (QUANTIZATION_MODES, TFLiteInference, calibration_slices,
+                              default_tflite_path, export_tflite)
+
+def dice_agreement(reference, labels):
+    """Per-class Dice between two label maps (1.0 when a class is absent from both)"""
+    scores = {}
+    for class_idx in SEGMENT_CLASSES:
+        a = reference == class_idx
+        b = labels == class_idx
+        total = a.sum() + b.sum()
+        scores[class_idx] = 1.0 if total == 0 else 2.0 * np.logical_and(a, b).sum() / total
+    return scores
+
+def latency_ms(predict_batch, X, runs, batch):
+    """p50 per-slice latency over runs calls of predict_batch on batch slices"""
+    inputs = X[:batch]
+    predict_batch(inputs)
+    timings = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        predict_batch(inputs)
+        timings.append((time.perf_counter() - start) * 1000.0 / len(inputs))
+    return float(np.percentile(timings, 50))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--model', default='best_model.h5', help='Path to the trained model')
+    parser.add_argument('--flair', nargs='+', default=[], help='FLAIR volume(s) to evaluate on')
+    parser.add_argument('--t1ce', nargs='+', default=[], help='Matching T1CE volume(s)')
+    parser.add_argument('--modes', nargs='+', default=list(QUANTIZATION_MODES), choices=QUANTIZATION_MODES)
+    parser.add_argument('--threads', type=int, default=None, help='TFLite interpreter threads')
+    parser.add_argument('--calibration-slices', type=int, default=16, help='INT8 calibration slices per volume')
+    parser.add_argument('--runs', type=int, default=50, help='Timed calls per latency measurement')
+    parser.add_argument('--batch', type=int, default=8, help='Slices per call for the batched latency')
+    parser.add_argument('--output-dir', default=None, help='Where to write the .tflite files')
+    args = parser.parse_args()
+
+    if len(args.flair) != len(args.t1ce):
+        parser.error('--flair and --t1ce need the same number of volumes')
+    if not os.path.exists(args.model):
+        print(f"❌ Model file not found: {args.model}")
+        return
+
+    predictor = BrainTumorPredictor(args.model, cache_bytes=0, converted_model_dir=args.output_dir)
+    pairs = list(zip(args.flair, args.t1ce))
+
+    if pairs:
+        X = np.concatenate([
+            predictor.preprocess_volume(flair, t1ce, VOLUME_START_AT, VOLUME_SLICES).copy()
+            for flair, t1ce in pairs
+        ])
+        calibration = calibration_slices(predictor, pairs, args.calibration_slices)
+        print(f"\n📊 Evaluating on {len(X)} slices from {len(pairs)} volume pair(s) "
+              f"(INT8 calibrated on {len(calibration)} of them)")
+    else:
+        # Without real scans only the latency numbers are meaningful
+        rng = np.random.default_rng(0)
+        X = rng.random((32, IMG_SIZE, IMG_SIZE, 2), dtype=np.float32)
+        calibration = [X[i:i + 1] for i in range(16)]
+        print("\n⚠️  No volumes given: using random slices, Dice numbers are not meaningful")
+
+    reference = predictor.predict_batch(X).argmax(axis=-1)
+    runs = [('keras float32', predictor.predict_batch, os.path.getsize(args.model))]
+
+    for mode in args.modes:
+        path = default_tflite_path(predictor, mode)
+        if args.output_dir:
+            path = os.path.join(args.output_dir, os.path.basename(path))
+        export_tflite(predictor, path, mode, calibration)
+        runs.append((f'tflite {mode}', TFLiteInference(path, num_threads=args.threads).predict_batch,
+                     os.path.getsize(path)))
+        print(f"💾 {mode}: {path}")
+
+    class_names = [SEGMENT_CLASSES[i] for i in sorted(SEGMENT_CLASSES)]
+    print(f"\n{'model':<16} {'size KB':>9} {'ms/slice@1':>11} {f'ms/slice@{args.batch}':>11} "
+          f"{'speedup':>8} {'pixels':>8}  " + '  '.join(f'{name[:10]:>10}' for name in class_names))
+
+    baseline = None
+    for name, predict_batch, size in runs:
+        single = latency_ms(predict_batch, X, args.runs, 1)
+        batched = latency_ms(predict_batch, X, args.runs, args.batch)
+        baseline = baseline or single
+        labels = predict_batch(X).argmax(axis=-1)
+        dice = dice_agreement(reference, labels)
+        print(f"{name:<16} {size / 1024:9.0f} {single:11.2f} {batched:11.2f} {baseline / single:7.2f}x "
+              f"{(labels == reference).mean():8.4f}  " + '  '.join(f'{dice[i]:10.4f}' for i in sorted(dice)))
+
+if __name__ == "__main__":
+    main()
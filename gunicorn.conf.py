@@ -0,0 +1,18 @@
+"""
+Gunicorn configuration
+Workers load the model (or connect to model_server.py when
+MODEL_SERVER_SOCKET is set) in the background once they have started
+"""
+
+import os
+
+bind = os.environ.get('GUNICORN_BIND', '0.0.0.0:5000')
+# Studies, jobs and history live under data/, so any worker can serve any
+# study_id or job ID
+workers = int(os.environ.get('GUNICORN_WORKERS', '2'))
+threads = int(os.environ.get('GUNICORN_THREADS', '4'))
+timeout = 120
+
+def post_worker_init(worker):
+    from app import start_model_loading
+    start_model_loading()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+"""
+Inference Backends
+The interface BrainTumorPredictor runs its forward passes through, and the
+ONNX Runtime implementation. The tf.keras implementation is KerasBackend in
+brain_tumor_predictor; TFLiteInference and ModelClient are the others.
+"""
+
+import abc
+import os
+
+import numpy as np
+
+from prediction_cache import file_digest
+
+class InferenceBackend(abc.ABC):
+    """
+    Runs forward passes for BrainTumorPredictor
+
+    Implementations set name and model_version (a digest of the weights
+    they run, part of every prediction cache key) and implement
+    predict_batch. Decoding, preprocessing and caching stay in the
+    predictor, so backends only see model-ready arrays.
+    """
+
+    name = None
+    model_version = None
+
+    @abc.abstractmethod
+    def predict_batch(self, X):
+        """Return (N, IMG_SIZE, IMG_SIZE, 4) float32 probabilities for a (N, IMG_SIZE, IMG_SIZE, 2) batch"""
+
+def default_onnx_path(predictor):
+    """Where an ONNX export of predictor's model is kept by default"""
+    stem = os.path.splitext(os.path.basename(predictor.model_path))[0]
+    return os.path.join(predictor.converted_model_dir, f"{stem}.{predictor.model_version}.onnx")
+
+def export_onnx(predictor, output_path):
+    """Export a loaded BrainTumorPredictor's Keras model to ONNX (needs tf2onnx)"""
+    if predictor.model is None:
+        raise ValueError("Export needs a predictor with the model loaded in-process")
+
+    # Keras picks the format from the extension, so the temporary file keeps it
+    temp_path = f"{output_path[:-len('.onnx')]}.{os.getpid()}.tmp.onnx"
+    try:
+        predictor.model.export(temp_path, format='onnx', verbose=False)
+        os.replace(temp_path, output_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return output_path
+
+class OnnxRuntimeBackend(InferenceBackend):
+    name = 'onnxruntime'
+
+    def __init__(self, onnx_path, intra_op_threads=None, inter_op_threads=None):
+        """Open an ONNX export on the CPU execution provider
+
+        Thread counts of None leave onnxruntime's defaults (one intra-op
+        thread per core). inter_op_threads runs independent branches of the
+        graph in parallel; without it nodes run one after another.
+        """
+        if not os.path.exists(onnx_path):
+            raise FileNotFoundError(f"ONNX model not found: {onnx_path}")
+
+        import onnxruntime as ort
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        options.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+        if intra_op_threads:
+            options.intra_op_num_threads = intra_op_threads
+        if inter_op_threads:
+            # The inter-op pool is only used in parallel execution mode
+            options.execution_mode = ort.ExecutionMode.ORT_PARALLEL
+            options.inter_op_num_threads = inter_op_threads
+
+        self.onnx_path = onnx_path
+        self.model_version = file_digest(onnx_path)
+        # InferenceSession.run is thread-safe, so no lock is needed
+        self._session = ort.InferenceSession(onnx_path, sess_options=options,
+                                             providers=['CPUExecutionProvider'])
+        self._input = self._session.get_inputs()[0].name
+
+    def predict_batch(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        return self._session.run(None, {self._input: X})[0]
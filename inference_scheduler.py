@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Inference Scheduler
+Batches single-slice prediction requests from concurrent handler threads
+into one forward pass of the BrainTumorPredictor model
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import numpy as np
+
+from brain_tumor_predictor import IMG_SIZE
+
+# Default batching limits
+DEFAULT_MAX_BATCH_SIZE = 8
+DEFAULT_MAX_WAIT_MS = 5.0
+
+class InferenceScheduler:
+    def __init__(self, predictor, max_batch_size=DEFAULT_MAX_BATCH_SIZE, max_wait_ms=DEFAULT_MAX_WAIT_MS):
+        """Start a batching worker in front of the given predictor"""
+        self.predictor = predictor
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+        self._queue = queue.Queue()
+        self._stopped = threading.Event()
+        self._worker = threading.Thread(target=self._run, name='inference-scheduler', daemon=True)
+        self._worker.start()
+
+    def submit(self, inputs):
+        """Queue a PreprocessedSlice and return a Future of (prediction, probabilities)"""
+        if self._stopped.is_set():
+            raise RuntimeError("Inference scheduler is stopped")
+        future = Future()
+        self._queue.put((inputs, future))
+        return future
+
+    def predict_preprocessed(self, inputs, timeout=None):
+        """Blocking counterpart of BrainTumorPredictor.predict_preprocessed"""
+        return self.submit(inputs).result(timeout=timeout)
+
+    def predict_single_slice(self, flair_path, t1ce_path, slice_index, return_inputs=False, digests=None):
+        """Same contract as BrainTumorPredictor.predict_single_slice, batched across callers
+
+        Decoding and cache lookups happen in the calling thread; only the
+        forward pass is shared.
+        """
+        return self.predictor.predict_single_slice(
+            flair_path, t1ce_path, slice_index, return_inputs=return_inputs,
+            predict_fn=self.predict_preprocessed, digests=digests
+        )
+
+    def stop(self, timeout=None):
+        """Stop the worker; requests still queued are failed"""
+        self._stopped.set()
+        self._queue.put(None)
+        self._worker.join(timeout)
+
+    def _collect_batch(self, first):
+        """Gather up to max_batch_size requests, waiting at most max_wait after the first"""
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                item = self._queue.get(timeout=remaining) if remaining > 0 else self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is None:
+                self._queue.put(None)
+                break
+            batch.append(item)
+        return batch
+
+    def _run(self):
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            batch = [(inputs, future) for inputs, future in self._collect_batch(item)
+                     if future.set_running_or_notify_cancel()]
+            if batch:
+                self._run_batch(batch)
+
+        # Fail anything that arrived after stop()
+        while True:
+            try:
+                item = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            if item is not None and item[1].set_running_or_notify_cancel():
+                item[1].set_exception(RuntimeError("Inference scheduler is stopped"))
+
+    def _run_batch(self, batch):
+        X = np.empty((len(batch), IMG_SIZE, IMG_SIZE, 2), dtype=np.float32)
+        for i, (inputs, _) in enumerate(batch):
+            X[i, :, :, 0] = inputs.flair
+            X[i, :, :, 1] = inputs.t1ce
+
+        try:
+            pred = self.predictor.predict_batch(X)
+        except Exception as e:
+            for _, future in batch:
+                future.set_exception(e)
+            return
+
+        # Return argmax prediction (class with highest probability) per caller
+        labels = np.argmax(pred, axis=-1)
+        for i, (_, future) in enumerate(batch):
+            future.set_result((labels[i], pred[i]))
@@ -0,0 +1,475 @@
+#!/usr/bin/env python3
+"""
+Job Queue
+In-process job subsystem: a bounded queue feeding a fixed pool of worker
+threads, with progress events, cancellation and result retention. File
+results are kept in an ArtifactStore rather than in memory, and with a
+SQLiteJobStore every worker process can follow and cancel the jobs of
+the others
+"""
+
+import json
+import os
+import queue
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from artifact_store import ArtifactStore
+
+# Default limits
+DEFAULT_NUM_WORKERS = 2
+DEFAULT_MAX_QUEUED = 16
+DEFAULT_MAX_JOBS = 200
+DEFAULT_JOB_TTL_SECONDS = 60 * 60  # Finished jobs (and their files) are forgotten after this
+EVENT_POLL_SECONDS = 0.5  # How often events of other processes' jobs are polled
+
+# Events after which a job publishes nothing more
+TERMINAL_EVENTS = ('complete', 'error', 'cancelled')
+TERMINAL_STATUSES = ('completed', 'failed', 'cancelled')
+
+class QueueFullError(Exception):
+    """Raised by JobQueue.submit when no more jobs can be queued"""
+
+class JobCancelled(Exception):
+    """Raised inside a job function when cancellation was requested"""
+
+class JobFile:
+    """Binary job result, such as a rendered report
+
+    metadata, if given, is reported in the job's status and completion
+    event in place of a JSON result. Once the job completes, content is
+    moved to the queue's result store and artifact_id refers to it.
+    """
+
+    def __init__(self, content, mimetype, filename, metadata=None, artifact_id=None):
+        self.content = content
+        self.mimetype = mimetype
+        self.filename = filename
+        self.metadata = metadata
+        self.artifact_id = artifact_id
+
+class Job:
+    def __init__(self, job_id, kind, user_id, condition, store=None):
+        self.id = job_id
+        self.kind = kind
+        self.user_id = user_id
+        self.status = 'queued'
+        self.progress = None
+        self.result = None
+        self.error = None
+        self.events = []
+        self.cancel_requested = False
+        self.created_at = time.time()
+        self.started_at = None
+        self.finished_at = None
+        self._condition = condition
+        self._store = store
+
+    @property
+    def finished(self):
+        return self.status in TERMINAL_STATUSES
+
+    def publish(self, event, data, **updates):
+        """Record an event, update job fields and wake up listeners"""
+        with self._condition:
+            for name, value in updates.items():
+                setattr(self, name, value)
+            self.events.append((event, data))
+            if self._store is not None:
+                try:
+                    self._store.record(self, event, data)
+                except Exception as e:
+                    print(f"⚠️ Failed to record job {self.id} event: {e}")
+            self._condition.notify_all()
+
+    def check_cancelled(self):
+        """Stop the job function at a safe point if cancellation was requested (by any process)"""
+        if not self.cancel_requested and self._store is not None:
+            self.cancel_requested = self._store.cancel_requested(self.id)
+        if self.cancel_requested:
+            raise JobCancelled()
+
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'kind': self.kind,
+            'status': self.status,
+            'progress': self.progress,
+            'error': self.error,
+            'result': self.result if isinstance(self.result, dict) else getattr(self.result, 'metadata', None),
+            'has_result': self.result is not None,
+            'cancel_requested': self.cancel_requested,
+            'created_at': self.created_at,
+            'started_at': self.started_at,
+            'finished_at': self.finished_at
+        }
+
+JOB_SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id TEXT PRIMARY KEY,
+    kind TEXT NOT NULL,
+    user_id TEXT,
+    status TEXT NOT NULL,
+    progress TEXT,
+    result TEXT,
+    result_artifact TEXT,
+    result_mimetype TEXT,
+    result_filename TEXT,
+    error TEXT,
+    cancel_requested INTEGER NOT NULL DEFAULT 0,
+    owner_pid INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    started_at REAL,
+    finished_at REAL
+);
+CREATE INDEX IF NOT EXISTS idx_jobs_finished ON jobs (finished_at);
+CREATE TABLE IF NOT EXISTS job_events (
+    job_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    event TEXT NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (job_id, seq)
+) WITHOUT ROWID;
+"""
+
+JOB_COLUMNS = ('id, kind, user_id, status, progress, result, result_artifact, result_mimetype, '
+               'result_filename, error, cancel_requested, owner_pid, created_at, started_at, finished_at')
+
+def process_alive(pid):
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        pass
+    return True
+
+class SQLiteJobStore:
+    """
+    Job state shared by the worker processes of one host
+
+    Jobs still run in the process that accepted them; that process records
+    their status, events and results here so any process can report them,
+    and reads back cancellation requested elsewhere. Jobs whose process
+    has exited are reported as failed.
+    """
+
+    def __init__(self, db_path):
+        self.db_path = db_path
+        self._local = threading.local()
+
+        directory = os.path.dirname(os.path.abspath(db_path))
+        os.makedirs(directory, exist_ok=True)
+        self._connect().executescript(JOB_SCHEMA)
+
+    def _connect(self):
+        """Return this thread's connection, opening one if needed (and after fork)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+
+        conn = sqlite3.connect(self.db_path, timeout=30, isolation_level=None)
+        conn.execute('PRAGMA journal_mode=WAL')
+        conn.execute('PRAGMA synchronous=NORMAL')
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def create(self, job):
+        self._connect().execute(
+            'INSERT INTO jobs (id, kind, user_id, status, owner_pid, created_at) VALUES (?, ?, ?, ?, ?, ?)',
+            (job.id, job.kind, job.user_id, job.status, os.getpid(), job.created_at)
+        )
+
+    def record(self, job, event, data):
+        """Store a job's current fields and append one event"""
+        result = job.result
+        artifact = mimetype = filename = None
+        if isinstance(result, JobFile):
+            artifact, mimetype, filename = result.artifact_id, result.mimetype, result.filename
+            result = result.metadata
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                'UPDATE jobs SET status = ?, progress = ?, result = ?, result_artifact = ?, '
+                'result_mimetype = ?, result_filename = ?, error = ?, started_at = ?, finished_at = ? '
+                'WHERE id = ?',
+                (job.status, json.dumps(job.progress), json.dumps(result), artifact, mimetype, filename,
+                 job.error, job.started_at, job.finished_at, job.id)
+            )
+            self._append_event(conn, job.id, event, data)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def claim(self, job_id):
+        """Mark a queued job as running; False if it was cancelled meanwhile"""
+        cursor = self._connect().execute(
+            "UPDATE jobs SET status = 'running' WHERE id = ? AND status = 'queued'", (job_id,)
+        )
+        return cursor.rowcount == 1
+
+    def cancel(self, job_id):
+        """Request cancellation; a job that has not started yet is cancelled at once"""
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.execute(
+                f'UPDATE jobs SET cancel_requested = 1 WHERE id = ? AND status NOT IN {TERMINAL_STATUSES}',
+                (job_id,)
+            )
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'cancelled', finished_at = ? WHERE id = ? AND status = 'queued'",
+                (time.time(), job_id)
+            )
+            if cursor.rowcount:
+                self._append_event(conn, job_id, 'cancelled', {'job_id': job_id})
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+    def cancel_requested(self, job_id):
+        row = self._connect().execute('SELECT cancel_requested FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        return bool(row and row[0])
+
+    def load(self, job_id):
+        """Return a read-only Job snapshot, or None if unknown"""
+        row = self._connect().execute(f'SELECT {JOB_COLUMNS} FROM jobs WHERE id = ?', (job_id,)).fetchone()
+        if row is None:
+            return None
+
+        (_, kind, user_id, status, progress, result, artifact, mimetype, filename,
+         error, cancel_requested, owner_pid, created_at, started_at, finished_at) = row
+
+        if status not in TERMINAL_STATUSES and owner_pid != os.getpid() and not process_alive(owner_pid):
+            self._fail_orphan(job_id, status)
+            return self.load(job_id)
+
+        job = Job(job_id, kind, user_id, None)
+        job.status = status
+        job.progress = json.loads(progress) if progress else None
+        job.result = json.loads(result) if result else None
+        if artifact is not None:
+            job.result = JobFile(None, mimetype, filename, job.result, artifact)
+        job.error = error
+        job.cancel_requested = bool(cancel_requested)
+        job.created_at, job.started_at, job.finished_at = created_at, started_at, finished_at
+        return job
+
+    def events(self, job_id, after):
+        """A job's (event, data) pairs from the after-th on"""
+        rows = self._connect().execute(
+            'SELECT event, data FROM job_events WHERE job_id = ? AND seq >= ? ORDER BY seq', (job_id, after)
+        ).fetchall()
+        return [(event, json.loads(data)) for event, data in rows]
+
+    def prune(self, ttl_seconds, max_jobs):
+        """Drop expired finished jobs and the oldest ones beyond max_jobs; returns their result artifacts"""
+        where = (f'status IN {TERMINAL_STATUSES} AND (finished_at < ? OR id IN ('
+                 'SELECT id FROM jobs ORDER BY created_at DESC LIMIT -1 OFFSET ?))')
+        params = (time.time() - ttl_seconds, max_jobs)
+
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            rows = conn.execute(f'SELECT id, result_artifact FROM jobs WHERE {where}', params).fetchall()
+            conn.executemany('DELETE FROM job_events WHERE job_id = ?', [(row[0],) for row in rows])
+            conn.execute(f'DELETE FROM jobs WHERE {where}', params)
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return [artifact for _, artifact in rows if artifact]
+
+    def _append_event(self, conn, job_id, event, data):
+        """Append an event after the job's last one (transaction open)"""
+        conn.execute(
+            'INSERT INTO job_events (job_id, seq, event, data) '
+            'SELECT ?, COALESCE(MAX(seq) + 1, 0), ?, ? FROM job_events WHERE job_id = ?',
+            (job_id, event, json.dumps(data), job_id)
+        )
+
+    def _fail_orphan(self, job_id, status):
+        """Fail a job whose process exited before finishing it"""
+        error = 'The worker running this job exited'
+        conn = self._connect()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            cursor = conn.execute(
+                "UPDATE jobs SET status = 'failed', error = ?, finished_at = ? WHERE id = ? AND status = ?",
+                (error, time.time(), job_id, status)
+            )
+            if cursor.rowcount:
+                self._append_event(conn, job_id, 'error', {'error': error})
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+
+class JobQueue:
+    def __init__(self, num_workers=DEFAULT_NUM_WORKERS, max_queued=DEFAULT_MAX_QUEUED, max_jobs=DEFAULT_MAX_JOBS,
+                 ttl_seconds=DEFAULT_JOB_TTL_SECONDS, result_store=None, store=None):
+        """Start num_workers threads serving a queue of at most max_queued jobs
+
+        File results go to result_store (an ArtifactStore in a fresh
+        temporary directory by default). With a SQLiteJobStore (and a
+        result_store directory shared with the other processes), jobs of
+        other processes can be looked up, followed and cancelled too.
+        """
+        self.num_workers = num_workers
+        self.max_jobs = max_jobs
+        self.ttl_seconds = ttl_seconds
+        self.result_store = result_store or ArtifactStore()
+        self.store = store
+        self._queue = queue.Queue(maxsize=max_queued)
+        self._jobs = OrderedDict()
+        self._condition = threading.Condition()
+        self._workers = [
+            threading.Thread(target=self._run, name=f'job-worker-{i}', daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def submit(self, kind, fn, user_id=None, cleanup=None):
+        """Queue fn(job) and return the Job
+
+        cleanup() is always called once the job has finished or was
+        cancelled before it started. Raises QueueFullError when the queue
+        is at capacity; cleanup is then left to the caller.
+        """
+        job = Job(str(uuid.uuid4()), kind, user_id, self._condition, self.store)
+
+        # Workers take the lock before starting a job, so it is recorded first
+        with self._condition:
+            try:
+                self._queue.put_nowait((job, fn, cleanup))
+            except queue.Full:
+                raise QueueFullError('Job queue is full')
+            self._jobs[job.id] = job
+            if self.store is not None:
+                self.store.create(job)
+            self._prune()
+
+        return job
+
+    def get(self, job_id):
+        """The job with this ID, from this process or (with a store) any other"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+        # A queued job may have been cancelled by another process
+        if self.store is not None and (job is None or job.status == 'queued'):
+            return self.store.load(job_id) or job
+        return job
+
+    def cancel(self, job_id):
+        """Request cancellation; queued jobs are cancelled at once, running ones at their next check"""
+        with self._condition:
+            job = self._jobs.get(job_id)
+            if job is not None and not job.finished:
+                job.cancel_requested = True
+                if job.status == 'queued':
+                    job.publish('cancelled', {'job_id': job.id}, status='cancelled', finished_at=time.time())
+
+        if self.store is None or (job is not None and job.finished):
+            return job
+        self.store.cancel(job_id)
+        return job or self.store.load(job_id)
+
+    def wait_for_events(self, job, sent, timeout=None):
+        """Return the job's events after the first `sent`, waiting up to timeout for new ones
+
+        Events of other processes' jobs are polled from the store.
+        """
+        if job._condition is None:
+            deadline = time.monotonic() + (timeout if timeout is not None else float('inf'))
+            while True:
+                pending = self.store.events(job.id, sent)
+                if pending or time.monotonic() >= deadline:
+                    return pending
+                time.sleep(min(EVENT_POLL_SECONDS, max(0, deadline - time.monotonic())))
+
+        with self._condition:
+            if len(job.events) == sent:
+                self._condition.wait_for(lambda: len(job.events) > sent, timeout=timeout)
+            return job.events[sent:]
+
+    def stats(self):
+        with self._condition:
+            statuses = [job.status for job in self._jobs.values()]
+        return {
+            'workers': self.num_workers,
+            'queued': statuses.count('queued'),
+            'running': statuses.count('running'),
+            'capacity': self._queue.maxsize
+        }
+
+    def result_path(self, job):
+        """(path, mimetype) of a completed job's file result, or None"""
+        if not isinstance(job.result, JobFile) or job.result.artifact_id is None:
+            return None
+        return self.result_store.find(job.result.artifact_id)
+
+    def _prune(self):
+        """Forget expired finished jobs and the oldest ones beyond max_jobs (lock held)"""
+        cutoff = time.time() - self.ttl_seconds
+        finished = [j for j in self._jobs.values() if j.finished]
+        excess = max(0, len(self._jobs) - self.max_jobs)
+        for index, job in enumerate(finished):
+            if index < excess or (job.finished_at or 0) < cutoff:
+                del self._jobs[job.id]
+                # With a store, files are deleted with the shared record below
+                if self.store is None and isinstance(job.result, JobFile) and job.result.artifact_id:
+                    self.result_store.delete(job.result.artifact_id)
+
+        if self.store is not None:
+            for artifact_id in self.store.prune(self.ttl_seconds, self.max_jobs):
+                self.result_store.delete(artifact_id)
+
+    def _store_result(self, result):
+        """Move a file result's content to the result store"""
+        if not isinstance(result, JobFile):
+            return result
+        artifact_id = self.result_store.put(result.content, result.mimetype)
+        return JobFile(None, result.mimetype, result.filename, result.metadata, artifact_id)
+
+    def _run(self):
+        while True:
+            job, fn, cleanup = self._queue.get()
+            try:
+                with self._condition:
+                    if job.status == 'cancelled':
+                        continue
+                    if self.store is not None and not self.store.claim(job.id):
+                        # Cancelled by another process while queued
+                        job.status, job.cancel_requested, job.finished_at = 'cancelled', True, time.time()
+                        job.events.append(('cancelled', {'job_id': job.id}))
+                        self._condition.notify_all()
+                        continue
+                    job.publish('started', {'job_id': job.id}, status='running', started_at=time.time())
+
+                try:
+                    result = self._store_result(fn(job))
+                except JobCancelled:
+                    job.publish('cancelled', {'job_id': job.id}, status='cancelled', finished_at=time.time())
+                except Exception as e:
+                    print(f"❌ Job {job.id} ({job.kind}) failed: {str(e)}")
+                    job.publish('error', {'error': str(e)}, status='failed', error=str(e), finished_at=time.time())
+                else:
+                    data = result if isinstance(result, dict) else getattr(result, 'metadata', None) or {'job_id': job.id}
+                    job.publish('complete', data, status='completed', result=result, finished_at=time.time())
+
+            finally:
+                if cleanup is not None:
+                    try:
+                        cleanup()
+                    except Exception as e:
+                        print(f"❌ Job {job.id} cleanup failed: {str(e)}")
+                self._queue.task_done()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Model Server
+Holds the one TensorFlow model instance for a host and serves forward passes
+to web workers over a Unix domain socket, so gunicorn workers stay light
+clients instead of each loading TensorFlow and the weights
+
+Run it before starting gunicorn with MODEL_SERVER_SOCKET pointing at the
+same path:
+
+    python model_server.py --socket /tmp/brain_model.sock --threads 1
+    MODEL_SERVER_SOCKET=/tmp/brain_model.sock gunicorn -c gunicorn.conf.py app:app
+"""
+
+import argparse
+import json
+import os
+import socket
+import socketserver
+import struct
+import threading
+
+import numpy as np
+
+from brain_tumor_predictor import BrainTumorPredictor, IMG_SIZE
+from inference_backends import InferenceBackend
+
+DEFAULT_SOCKET_PATH = '/tmp/brain_model.sock'
+
+# Frame: 4-byte big-endian header length, JSON header, then header['nbytes'] of raw array data
+HEADER_LENGTH = struct.Struct('>I')
+
+def send_message(sock, header, payload=b''):
+    header = dict(header, nbytes=len(payload))
+    encoded = json.dumps(header).encode('utf-8')
+    sock.sendall(HEADER_LENGTH.pack(len(encoded)) + encoded)
+    if payload:
+        sock.sendall(payload)
+
+def recv_exact(sock, size):
+    buffer = bytearray(size)
+    view = memoryview(buffer)
+    received = 0
+    while received < size:
+        count = sock.recv_into(view[received:])
+        if count == 0:
+            raise ConnectionError('Connection closed by peer')
+        received += count
+    return buffer
+
+def recv_message(sock):
+    """Return (header, payload) of the next frame"""
+    (length,) = HEADER_LENGTH.unpack(recv_exact(sock, HEADER_LENGTH.size))
+    header = json.loads(recv_exact(sock, length).decode('utf-8'))
+    payload = recv_exact(sock, header['nbytes']) if header['nbytes'] else b''
+    return header, payload
+
+class ModelRequestHandler(socketserver.BaseRequestHandler):
+    """Serves requests from one client connection until it closes"""
+
+    def handle(self):
+        server = self.server
+        while True:
+            try:
+                header, payload = recv_message(self.request)
+            except (ConnectionError, OSError):
+                return
+
+            try:
+                if header['op'] == 'info':
+                    send_message(self.request, server.info())
+                elif header['op'] == 'predict':
+                    X = np.frombuffer(payload, dtype=np.float32).reshape(header['shape'])
+                    # One forward pass at a time: TF already uses every core per call
+                    with server.predict_lock:
+                        probabilities = server.predictor.predict_batch(X)
+                    probabilities = np.ascontiguousarray(probabilities, dtype=np.float32)
+                    send_message(self.request, {'shape': list(probabilities.shape)}, probabilities.tobytes())
+                else:
+                    send_message(self.request, {'error': f"Unknown op: {header['op']}"})
+            except (ConnectionError, BrokenPipeError):
+                return
+            except Exception as e:
+                send_message(self.request, {'error': str(e)})
+
+class ModelServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, predictor, socket_path=DEFAULT_SOCKET_PATH):
+        """Bind socket_path (replacing a stale socket file) in front of predictor"""
+        self.predictor = predictor
+        self.socket_path = socket_path
+        self.predict_lock = threading.Lock()
+
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+        super().__init__(socket_path, ModelRequestHandler)
+        os.chmod(socket_path, 0o660)
+
+    def info(self):
+        from brain_tumor_predictor import import_tensorflow
+        import keras
+        return {
+            'model_path': self.predictor.model_path,
+            'model_version': self.predictor.model_version,
+            'tensorflow_version': import_tensorflow().__version__,
+            'keras_version': getattr(keras, '__version__', 'unknown'),
+            'pid': os.getpid()
+        }
+
+    def server_close(self):
+        super().server_close()
+        if os.path.exists(self.socket_path):
+            os.unlink(self.socket_path)
+
+class ModelClient(InferenceBackend):
+    name = 'model_server'
+
+    def __init__(self, socket_path=DEFAULT_SOCKET_PATH, timeout=60.0):
+        """Connect to a running ModelServer; raises ConnectionError if it is not up"""
+        self.socket_path = socket_path
+        self.timeout = timeout
+        self._local = threading.local()
+        info = self._request({'op': 'info'})[0]
+        self.model_version = info['model_version']
+        self.tensorflow_version = info['tensorflow_version']
+        self.keras_version = info['keras_version']
+        self.server_pid = info['pid']
+
+    def predict_batch(self, X):
+        """Same contract as BrainTumorPredictor.predict_batch, run in the server process"""
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        header, payload = self._request({'op': 'predict', 'shape': list(X.shape)}, X.tobytes())
+        return np.frombuffer(payload, dtype=np.float32).reshape(header['shape'])
+
+    def _connection(self):
+        """This thread's connection (one per thread, opened lazily and after fork)"""
+        sock = getattr(self._local, 'sock', None)
+        if sock is not None and self._local.pid == os.getpid():
+            return sock
+
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.settimeout(self.timeout)
+        try:
+            sock.connect(self.socket_path)
+        except OSError as e:
+            sock.close()
+            raise ConnectionError(f'Model server not reachable at {self.socket_path}: {e}')
+        self._local.sock = sock
+        self._local.pid = os.getpid()
+        return sock
+
+    def _request(self, header, payload=b''):
+        # Retry once on a fresh connection, e.g. after the server restarted
+        for attempt in range(2):
+            sock = self._connection()
+            try:
+                send_message(sock, header, payload)
+                response, data = recv_message(sock)
+                break
+            except (ConnectionError, OSError):
+                sock.close()
+                self._local.sock = None
+                if attempt:
+                    raise
+        if 'error' in response:
+            raise RuntimeError(f"Model server error: {response['error']}")
+        return response, data
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the segmentation model over a Unix socket')
+    parser.add_argument('--model', default='best_model.h5', help='Path to the Keras model file')
+    parser.add_argument('--socket', default=DEFAULT_SOCKET_PATH, help='Unix socket path to listen on')
+    parser.add_argument('--threads', type=int, default=0,
+                        help='TensorFlow intra-op threads (0 = one per core)')
+    args = parser.parse_args()
+
+    # Thread pools have to be sized before the first op runs
+    from brain_tumor_predictor import import_tensorflow
+    tf = import_tensorflow()
+    if args.threads:
+        tf.config.threading.set_intra_op_parallelism_threads(args.threads)
+        tf.config.threading.set_inter_op_parallelism_threads(1)
+
+    predictor = BrainTumorPredictor(args.model, cache_bytes=0)
+    server = ModelServer(predictor, args.socket)
+    print(f"🧠 Model server listening on {args.socket} (pid {os.getpid()}, input {IMG_SIZE}x{IMG_SIZE}x2)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        print("\n⏹️  Model server stopped")
+    finally:
+        server.server_close()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+NIfTI Ingestion
+Reads uploaded NIfTI volumes straight from the request stream: gzip is
+detected by its magic bytes and inflated chunk by chunk, the header is
+validated before any of the image data is touched, and the upload is
+hashed on the way through for the prediction cache
+"""
+
+import gzip
+import hashlib
+import io
+import struct
+import tempfile
+
+import nibabel as nib
+import numpy as np
+from nibabel.arrayproxy import ArrayProxy
+
+# Default limits
+DEFAULT_MAX_VOLUME_BYTES = 256 * 1024 * 1024  # Uncompressed image data per volume
+DEFAULT_SPOOL_BYTES = 64 * 1024 * 1024  # Inflated volumes up to this size stay in memory
+
+GZIP_MAGIC = b'\x1f\x8b'
+CHUNK_SIZE = 1024 * 1024
+TRAILING_SLACK = CHUNK_SIZE  # Bytes allowed after the declared image data
+THREADED_GZIP_MIN_BYTES = 4 * 1024 * 1024  # Compressed size from which python-isal's threaded reader is used
+
+# Header size (the first int32 of the file) -> header and image classes
+NIFTI_FORMATS = {
+    348: (nib.Nifti1Header, nib.Nifti1Image, b'n+1'),
+    540: (nib.Nifti2Header, nib.Nifti2Image, b'n+2'),
+}
+
+class HashingReader(io.RawIOBase):
+    """Raw reader that hashes everything read through it (same digest as file_digest)
+
+    Closing it leaves the wrapped stream open.
+    """
+
+    def __init__(self, stream):
+        super().__init__()
+        self.stream = stream
+        self.digest = hashlib.blake2b(digest_size=16)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        count = self.stream.readinto(buffer)
+        self.digest.update(memoryview(buffer)[:count])
+        return count
+
+    def drain(self):
+        """Hash whatever is left of the stream"""
+        while self.read(CHUNK_SIZE):
+            pass
+        return self.digest.hexdigest()
+
+def open_gzip(raw, compressed_size):
+    """Inflating reader over raw
+
+    Large uploads are inflated by python-isal's threaded reader when it is
+    installed: ISA-L inflates several times faster than zlib, on a thread
+    of its own, so reading the upload overlaps with copying the output.
+    """
+    if compressed_size >= THREADED_GZIP_MIN_BYTES:
+        try:
+            from isal import igzip_threaded
+            return igzip_threaded.open(raw, 'rb', threads=1)
+        except ImportError:
+            pass
+    return gzip.GzipFile(fileobj=raw, mode='rb')
+
+def read_exact(source, size):
+    data = source.read(size)
+    while len(data) < size:
+        chunk = source.read(size - len(data))
+        if not chunk:
+            raise ValueError('File is too short to be a NIfTI volume')
+        data += chunk
+    return data
+
+def parse_header(source):
+    """Read and validate a single-file NIfTI-1/2 header; returns (header, header_bytes, image_class)
+
+    Raises ValueError for anything that is not a readable 3D volume, so
+    bad uploads fail before their image data is read.
+    """
+    block = read_exact(source, 348)
+    for endian in '<>':
+        sizeof_hdr = struct.unpack(f'{endian}i', block[:4])[0]
+        if sizeof_hdr in NIFTI_FORMATS:
+            break
+    else:
+        raise ValueError('Not a NIfTI file (expected .nii or .nii.gz)')
+
+    header_class, image_class, magic = NIFTI_FORMATS[sizeof_hdr]
+    if sizeof_hdr > len(block):
+        block += read_exact(source, sizeof_hdr - len(block))
+
+    try:
+        header = header_class(block, check=True)
+    except Exception as e:
+        raise ValueError(f'Malformed NIfTI header: {e}')
+
+    if bytes(header['magic']).rstrip(b'\x00') != magic:
+        raise ValueError('Only single-file NIfTI volumes (.nii/.nii.gz) are supported')
+    return header, block, image_class
+
+def check_volume(header, max_volume_bytes=DEFAULT_MAX_VOLUME_BYTES):
+    """Validate the declared volume and return the size of its image data in bytes
+
+    Trailing size-1 dimensions, as in (X, Y, Z, 1) exports, are dropped from
+    the header, which leaves the data layout unchanged.
+    """
+    shape = header.get_data_shape()
+    if len(shape) > 3 and all(n == 1 for n in shape[3:]):
+        shape = shape[:3]
+        header.set_data_shape(shape)
+    if len(shape) != 3:
+        raise ValueError(f'Expected a 3D volume, got shape {tuple(shape)}')
+    if min(shape) < 1:
+        raise ValueError(f'Invalid volume shape {tuple(shape)}')
+
+    dtype = header.get_data_dtype()
+    if dtype.kind not in 'iuf':
+        raise ValueError(f'Unsupported voxel type {dtype}')
+
+    nbytes = int(np.prod(shape, dtype=np.int64)) * dtype.itemsize
+    if nbytes > max_volume_bytes:
+        raise ValueError(f'Volume too large: {nbytes / 1024 / 1024:.0f} MB of image data '
+                         f'(limit {max_volume_bytes / 1024 / 1024:.0f} MB)')
+
+    if header.get_data_offset() < header.sizeof_hdr:
+        raise ValueError('Malformed NIfTI header: image data overlaps the header')
+    return nbytes
+
+def ingest_volume(stream, sink, max_volume_bytes=DEFAULT_MAX_VOLUME_BYTES):
+    """
+    Copy an uploaded NIfTI volume from stream into sink as an uncompressed .nii
+
+    Returns (header, image_class, digest), where digest is the BLAKE2b
+    digest of the bytes as uploaded. Raises ValueError for malformed,
+    truncated or oversized volumes; the size checks use the header alone.
+    """
+    magic = stream.read(2)
+    compressed_size = stream.seek(0, 2)
+    stream.seek(0)
+    raw = HashingReader(stream)
+    source = open_gzip(raw, compressed_size) if magic == GZIP_MAGIC else raw
+
+    try:
+        header, block, image_class = parse_header(source)
+        expected = header.get_data_offset() + check_volume(header, max_volume_bytes)
+
+        # The header as checked, with any trailing size-1 dimensions dropped
+        block = header.binaryblock
+        sink.write(block)
+        copied = len(block)
+        while True:
+            chunk = source.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            copied += len(chunk)
+            # Stops decompression bombs as well as mislabelled headers
+            if copied > expected + TRAILING_SLACK:
+                raise ValueError('Volume holds more data than its header declares')
+            sink.write(chunk)
+    except ValueError:
+        raise
+    except Exception as e:
+        # zlib/gzip errors, or those of the optional ISA-L reader
+        raise ValueError(f'Corrupt gzip stream: {e}')
+    finally:
+        if source is not raw:
+            source.close()
+
+    if copied < expected:
+        raise ValueError(f'Volume is truncated: {copied} of {expected} bytes')
+
+    return header, image_class, raw.drain()
+
+class IngestedVolume:
+    """An uploaded volume held in a spooled buffer, readable as a nibabel image"""
+
+    def __init__(self, image, digest, buffer, nbytes):
+        self.image = image
+        self.digest = digest
+        self.nbytes = nbytes
+        self._buffer = buffer
+
+    def close(self):
+        self._buffer.close()
+
+def load_volume(stream, max_volume_bytes=DEFAULT_MAX_VOLUME_BYTES, spool_bytes=DEFAULT_SPOOL_BYTES):
+    """Ingest an upload into memory (or a temporary file past spool_bytes)
+
+    The returned image reads slices on demand from the buffer, with the
+    header's scaling applied, like a memory-mapped file on disk.
+    """
+    buffer = tempfile.SpooledTemporaryFile(max_size=spool_bytes)
+    try:
+        header, image_class, digest = ingest_volume(stream, buffer, max_volume_bytes)
+        nbytes = buffer.tell()
+    except Exception:
+        buffer.close()
+        raise
+
+    # mmap=False: asking a spooled buffer for its fileno would move it to disk
+    proxy = ArrayProxy(buffer, header, mmap=False)
+    image = image_class(proxy, header.get_best_affine(), header)
+    return IngestedVolume(image, digest, buffer, nbytes)
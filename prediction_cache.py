@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Prediction Cache
+Content-addressed LRU cache of single-slice inference results, keyed by
+the hash of the uploaded volumes, the slice index and the model version
+"""
+
+import hashlib
+import io
+import threading
+from collections import OrderedDict
+
+import numpy as np
+
+# Default memory budget for cached results
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+
+def file_digest(path, chunk_size=1024 * 1024):
+    """Return the BLAKE2b hex digest of a file's contents"""
+    digest = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+class CachedPrediction:
+    """Compact copy of a prediction: uint8 labels, float16 probabilities and inputs"""
+
+    def __init__(self, prediction, probabilities, flair, t1ce):
+        self.prediction = np.asarray(prediction, dtype=np.uint8)
+        self.probabilities = np.asarray(probabilities, dtype=np.float16)
+        self.flair = np.asarray(flair, dtype=np.float16)
+        self.t1ce = np.asarray(t1ce, dtype=np.float16)
+
+    @property
+    def nbytes(self):
+        return self.prediction.nbytes + self.probabilities.nbytes + self.flair.nbytes + self.t1ce.nbytes
+
+    def unpack(self):
+        """Return (prediction, probabilities, flair, t1ce) as fresh working arrays"""
+        return (self.prediction.copy(), self.probabilities.astype(np.float32),
+                self.flair.astype(np.float32), self.t1ce.astype(np.float32))
+
+    def to_bytes(self):
+        """Serialize to a compressed .npz for storage outside the process"""
+        buffer = io.BytesIO()
+        np.savez_compressed(buffer, prediction=self.prediction, probabilities=self.probabilities,
+                            flair=self.flair, t1ce=self.t1ce)
+        return buffer.getvalue()
+
+    @classmethod
+    def from_bytes(cls, content):
+        """Inverse of to_bytes"""
+        with np.load(io.BytesIO(content), allow_pickle=False) as arrays:
+            return cls(arrays['prediction'], arrays['probabilities'], arrays['flair'], arrays['t1ce'])
+
+class PredictionCache:
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        """Create an empty cache holding at most max_bytes of array data"""
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def make_key(flair_digest, t1ce_digest, slice_index, model_version):
+        return (flair_digest, t1ce_digest, int(slice_index), model_version)
+
+    def get(self, key):
+        """Return the CachedPrediction for key, or None"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry
+
+    def put(self, key, entry):
+        """Store an entry, evicting least recently used ones to stay in budget"""
+        if entry.nbytes > self.max_bytes:
+            return
+
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= old.nbytes
+
+            self._entries[key] = entry
+            self.current_bytes += entry.nbytes
+
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._entries.popitem(last=False)
+                self.current_bytes -= evicted.nbytes
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self.current_bytes,
+                'max_bytes': self.max_bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions
+            }
@@ -0,0 +1,251 @@
+#!/usr/bin/env python3
+"""
+Report Renderer
+Renders the comprehensive JPG report from a per-process template: the static
+layout (header, titles, legend, colorbars, technical text, footer) is drawn
+once per profile, and each report only redraws the image panels and the
+text that depends on the prediction
+"""
+
+import threading
+from collections import namedtuple
+from datetime import datetime
+
+import cv2
+import numpy as np
+
+# Figure size in inches, raster DPI and JPEG quality of a report
+ReportProfile = namedtuple('ReportProfile', ['figsize', 'dpi', 'jpeg_quality'])
+
+REPORT_PROFILES = {
+    'print': ReportProfile(figsize=(16, 20), dpi=300, jpeg_quality=95),
+    'standard': ReportProfile(figsize=(16, 20), dpi=150, jpeg_quality=92),
+    'screen': ReportProfile(figsize=(16, 20), dpi=96, jpeg_quality=90),
+}
+DEFAULT_PROFILE = 'print'
+
+BG_COLOR = '#f8f9fa'
+HEADER_COLOR = '#2c3e50'
+TIGHT_PAD_INCHES = 0.1  # Same margin as savefig(bbox_inches='tight')
+
+CLASS_NAMES = ['Background', 'Necrotic/Core', 'Edema', 'Enhancing']
+PROB_TITLES = [f'{name} Probability' for name in CLASS_NAMES]
+
+TECH_TEXT = """TECHNICAL INFORMATION
+
+Model: Deep Learning U-Net Architecture for Brain Tumor Segmentation
+Input: FLAIR and T1CE MRI sequences (128x128 resolution)
+Output: 4-class segmentation (Background, Necrotic/Core, Edema, Enhancing)
+Processing: Automated AI analysis with probability mapping
+
+DISCLAIMER: This analysis is generated by an AI system for research and educational purposes only.
+Results should not be used for clinical diagnosis without proper medical supervision and validation.
+Always consult qualified medical professionals for clinical interpretation and decision-making."""
+
+def clinical_assessment(tumor_percentage):
+    """(assessment, recommendation, status_color) for a tumor coverage percentage"""
+    if tumor_percentage > 5:
+        return ("SIGNIFICANT TUMOR PRESENCE",
+                "• Recommend clinical correlation\n• Consider follow-up imaging\n• Consult oncology if indicated",
+                '#e74c3c')
+    if tumor_percentage > 1:
+        return ("MODERATE TUMOR ACTIVITY",
+                "• Monitor for changes\n• Clinical correlation advised\n• Follow institutional protocols",
+                '#f39c12')
+    return ("MINIMAL TUMOR ACTIVITY",
+            "• Low tumor burden detected\n• Routine follow-up as indicated\n• Clinical correlation recommended",
+            '#27ae60')
+
+def report_texts(class_stats):
+    """Statistics text, clinical text and clinical box color for class pixel counts"""
+    total_pixels = sum(class_stats.values())
+    tumor_pixels = sum(class_stats.get(i, 0) for i in [1, 2, 3])
+    tumor_percentage = (tumor_pixels / total_pixels * 100) if total_pixels > 0 else 0
+
+    stats_text = f"""QUANTITATIVE ANALYSIS
+
+Total Pixels Analyzed: {total_pixels:,}
+Tumor Pixels Detected: {tumor_pixels:,}
+Tumor Coverage: {tumor_percentage:.1f}%
+
+TISSUE BREAKDOWN:
+"""
+    for i, name in enumerate(CLASS_NAMES):
+        pixels = class_stats.get(i, 0)
+        percentage = (pixels / total_pixels * 100) if total_pixels > 0 else 0
+        stats_text += f"• {name}: {pixels:,} pixels ({percentage:.1f}%)\n"
+
+    assessment, recommendation, status_color = clinical_assessment(tumor_percentage)
+    clinical_text = f"""CLINICAL ASSESSMENT
+
+Status: {assessment}
+
+RECOMMENDATIONS:
+{recommendation}
+"""
+    return stats_text, clinical_text, status_color
+
+class ReportTemplate:
+    """A report figure with its static layout pre-rendered for one profile"""
+
+    def __init__(self, profile):
+        from matplotlib.figure import Figure
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.gridspec import GridSpec
+
+        self.profile = profile
+        self.lock = threading.Lock()
+
+        fig = Figure(figsize=profile.figsize, dpi=profile.dpi)
+        self.canvas = FigureCanvasAgg(fig)
+        self.figure = fig
+        fig.patch.set_facecolor(BG_COLOR)
+        gs = GridSpec(6, 4, figure=fig, height_ratios=[0.8, 2, 2, 1.5, 1.5, 0.5], hspace=0.3, wspace=0.2)
+        placeholder = np.zeros((128, 128), dtype=np.float32)
+
+        # Everything created with animated=True is left out of the template
+        # and drawn per report
+        header_ax = fig.add_subplot(gs[0, :])
+        header_ax.text(0.5, 0.7, 'BRAIN TUMOR SEGMENTATION REPORT',
+                       fontsize=24, fontweight='bold', ha='center', va='center',
+                       color=HEADER_COLOR, transform=header_ax.transAxes)
+        self.subtitle = header_ax.text(0.5, 0.3, '', fontsize=12, ha='center', va='center',
+                                       color='#7f8c8d', transform=header_ax.transAxes, animated=True)
+        header_ax.axis('off')
+
+        flair_ax = fig.add_subplot(gs[1, 0])
+        self.flair = flair_ax.imshow(placeholder, cmap='gray', animated=True)
+        flair_ax.set_title('FLAIR Sequence', fontsize=14, fontweight='bold', pad=10)
+        flair_ax.axis('off')
+
+        t1ce_ax = fig.add_subplot(gs[1, 1])
+        self.t1ce = t1ce_ax.imshow(placeholder, cmap='gray', animated=True)
+        t1ce_ax.set_title('T1CE Sequence', fontsize=14, fontweight='bold', pad=10)
+        t1ce_ax.axis('off')
+
+        overlay_ax = fig.add_subplot(gs[1, 2])
+        self.overlay_base = overlay_ax.imshow(placeholder, cmap='gray', animated=True)
+        self.overlay = overlay_ax.imshow(placeholder, alpha=0.6, cmap='jet', animated=True)
+        overlay_ax.set_title('Segmentation Overlay', fontsize=14, fontweight='bold', pad=10)
+        overlay_ax.axis('off')
+
+        legend_ax = fig.add_subplot(gs[1, 3])
+        legend_text = "SEGMENTATION LEGEND:\n\n" + ''.join(f"● {name}\n" for name in CLASS_NAMES)
+        legend_ax.text(0.1, 0.9, legend_text, fontsize=12, va='top', ha='left',
+                       transform=legend_ax.transAxes, family='monospace')
+        legend_ax.set_title('Segmentation Legend', fontsize=14, fontweight='bold', pad=10)
+        legend_ax.axis('off')
+
+        # The colorbars only depend on the fixed 0..1 range, so they are static
+        self.probabilities = []
+        for i, title in enumerate(PROB_TITLES):
+            prob_ax = fig.add_subplot(gs[2, i])
+            image = prob_ax.imshow(placeholder, cmap='hot', vmin=0, vmax=1, animated=True)
+            prob_ax.set_title(title, fontsize=12, fontweight='bold', pad=10)
+            prob_ax.axis('off')
+            cbar = fig.colorbar(image, ax=prob_ax, fraction=0.046, pad=0.04)
+            cbar.set_label('Probability', fontsize=10)
+            self.probabilities.append(image)
+
+        stats_ax = fig.add_subplot(gs[3, :2])
+        stats_ax.axis('off')
+        self.stats = stats_ax.text(0.05, 0.95, '', fontsize=11, va='top', ha='left',
+                                   transform=stats_ax.transAxes, family='monospace', animated=True,
+                                   bbox=dict(boxstyle="round,pad=0.5", facecolor='white', alpha=0.8))
+
+        clinical_ax = fig.add_subplot(gs[3, 2:])
+        clinical_ax.axis('off')
+        self.clinical = clinical_ax.text(0.05, 0.95, '', fontsize=11, va='top', ha='left',
+                                         transform=clinical_ax.transAxes, animated=True,
+                                         bbox=dict(boxstyle="round,pad=0.5", facecolor=BG_COLOR, alpha=0.1))
+
+        tech_ax = fig.add_subplot(gs[4, :])
+        tech_ax.axis('off')
+        tech_ax.text(0.05, 0.95, TECH_TEXT, fontsize=10, va='top', ha='left',
+                     transform=tech_ax.transAxes, style='italic',
+                     bbox=dict(boxstyle="round,pad=0.5", facecolor='#ecf0f1', alpha=0.8))
+
+        footer_ax = fig.add_subplot(gs[5, :])
+        footer_ax.text(0.5, 0.5, 'Brain Tumor Segmentation System | AI-Powered Medical Image Analysis',
+                       fontsize=10, ha='center', va='center', style='italic',
+                       color='#7f8c8d', transform=footer_ax.transAxes)
+        footer_ax.axis('off')
+
+        self.dynamic = [self.subtitle, self.flair, self.t1ce, self.overlay_base, self.overlay,
+                        *self.probabilities, self.stats, self.clinical]
+
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(fig.bbox)
+        self.crop = self._tight_crop(report_texts({0: 1}))
+
+    def _tight_crop(self, texts):
+        """Pixel (top, bottom, left, right) of the area savefig(bbox_inches='tight') would keep"""
+        stats_text, clinical_text, _ = texts
+        self.subtitle.set_text(f'Generated: {datetime.now():%Y-%m-%d %H:%M:%S} | Slice Index: 0')
+        self.stats.set_text(stats_text)
+        self.clinical.set_text(clinical_text)
+
+        renderer = self.canvas.get_renderer()
+        bbox = self.figure.get_tightbbox(renderer).padded(TIGHT_PAD_INCHES)
+        dpi = self.profile.dpi
+        height = int(round(self.figure.bbox.height))
+        left = max(0, int(round(bbox.x0 * dpi)))
+        top = max(0, height - int(round(bbox.y1 * dpi)))
+        right = min(int(round(self.figure.bbox.width)), left + int(bbox.width * dpi))
+        bottom = min(height, top + int(bbox.height * dpi))
+        return top, bottom, left, right
+
+    def render(self, flair_img, t1ce_img, prediction, probabilities, slice_idx, class_stats):
+        """Return the report for one prediction as an (H, W, 3) uint8 RGB image"""
+        stats_text, clinical_text, status_color = report_texts(class_stats)
+        timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+
+        with self.lock:
+            self.subtitle.set_text(f'Generated: {timestamp} | Slice Index: {slice_idx}')
+            # Gray panels and the overlay are autoscaled per image, as imshow does
+            for image, data in ((self.flair, flair_img), (self.t1ce, t1ce_img),
+                                (self.overlay_base, flair_img), (self.overlay, prediction)):
+                image.set_data(data)
+                image.autoscale()
+            for i, image in enumerate(self.probabilities):
+                image.set_data(probabilities[:, :, i])
+            self.stats.set_text(stats_text)
+            self.clinical.set_text(clinical_text)
+            self.clinical.get_bbox_patch().set_facecolor(status_color)
+
+            self.canvas.restore_region(self.background)
+            for artist in self.dynamic:
+                self.figure.draw_artist(artist)
+
+            top, bottom, left, right = self.crop
+            return np.asarray(self.canvas.buffer_rgba())[top:bottom, left:right, :3].copy()
+
+# Templates are built on first use of each profile
+_templates = {}
+_templates_lock = threading.Lock()
+
+def get_report_template(profile_name=DEFAULT_PROFILE):
+    """Return the process-wide template of a profile; raises ValueError for unknown names"""
+    if profile_name not in REPORT_PROFILES:
+        raise ValueError(f"Unknown report profile: {profile_name} (choose from {', '.join(REPORT_PROFILES)})")
+    with _templates_lock:
+        template = _templates.get(profile_name)
+        if template is None:
+            template = ReportTemplate(REPORT_PROFILES[profile_name])
+            _templates[profile_name] = template
+        return template
+
+def encode_jpeg(image, quality):
+    """Encode an RGB uint8 image as JPEG bytes"""
+    ok, encoded = cv2.imencode('.jpg', np.ascontiguousarray(image[:, :, ::-1]),
+                               [cv2.IMWRITE_JPEG_QUALITY, quality])
+    if not ok:
+        raise RuntimeError('JPEG encoding failed')
+    return encoded.tobytes()
+
+def render_report(flair_img, t1ce_img, prediction, probabilities, slice_idx, class_stats,
+                  profile_name=DEFAULT_PROFILE):
+    """Render the comprehensive report and return it as JPEG bytes"""
+    template = get_report_template(profile_name)
+    image = template.render(flair_img, t1ce_img, prediction, probabilities, slice_idx, class_stats)
+    return encode_jpeg(image, template.profile.jpeg_quality)
@@ -7,6 +7,7 @@ class DashboardManager {
     constructor() {
         this.currentUser = null;
         this.analyses = [];
+        this.studyId = null;
         this.init();
     }
 
@@ -424,18 +425,35 @@ class DashboardManager {
                 }
             });
 
-            if (response.ok) {
-                const data = await response.json();
-                this.showAlert(data.message || 'Report download initiated', 'info');
+            if (!response.ok) {
+                const errorData = await response.json();
+                throw new Error(errorData.error || 'Failed to download report');
+            }
 
-                // For now, show the analysis and let user download from there
-                this.viewAnalysis(id);
-            } else {
-                this.showAlert('Failed to download report', 'danger');
+            const blob = await response.blob();
+            const url = window.URL.createObjectURL(blob);
+            const a = document.createElement('a');
+            a.href = url;
+
+            const contentDisposition = response.headers.get('Content-Disposition');
+            let filename = 'brain_tumor_report.jpg';
+            if (contentDisposition) {
+                const filenameMatch = contentDisposition.match(/filename="(.+)"/);
+                if (filenameMatch) {
+                    filename = filenameMatch[1];
+                }
             }
+
+            a.download = filename;
+            document.body.appendChild(a);
+            a.click();
+            document.body.removeChild(a);
+            window.URL.revokeObjectURL(url);
+
+            this.showAlert('Report downloaded successfully!', 'success');
         } catch (error) {
             console.error('Error downloading report:', error);
-            this.showAlert('Error downloading report', 'danger');
+            this.showAlert(`Error downloading report: ${error.message}`, 'danger');
         }
     }
 
@@ -500,6 +518,7 @@ class DashboardManager {
 
         if (flairFile) {
             flairFile.addEventListener('change', (e) => {
+                this.studyId = null;
                 this.handleFileUpload(e, 'flair');
                 this.validateFiles();
             });
@@ -507,6 +526,7 @@ class DashboardManager {
 
         if (t1ceFile) {
             t1ceFile.addEventListener('change', (e) => {
+                this.studyId = null;
                 this.handleFileUpload(e, 't1ce');
                 this.validateFiles();
             });
@@ -577,6 +597,82 @@ class DashboardManager {
         }
     }
 
+    async ensureStudy(headers) {
+        // Upload the selected volumes once; later requests only send the study ID
+        if (this.studyId) {
+            return this.studyId;
+        }
+
+        const formData = new FormData();
+        formData.append('flair', document.getElementById('flair-file').files[0]);
+        formData.append('t1ce', document.getElementById('t1ce-file').files[0]);
+
+        const response = await fetch('/api/studies', {
+            method: 'POST',
+            headers: headers,
+            body: formData
+        });
+
+        const data = await response.json();
+        if (!response.ok) {
+            throw new Error(data.error || 'Upload failed');
+        }
+
+        this.studyId = data.study_id;
+        return this.studyId;
+    }
+
+    async postWithStudy(url, fields, headers = {}) {
+        for (let attempt = 0; attempt < 2; attempt++) {
+            const formData = new FormData();
+            formData.append('study_id', await this.ensureStudy(headers));
+            Object.entries(fields).forEach(([key, value]) => formData.append(key, value));
+
+            const response = await fetch(url, {
+                method: 'POST',
+                headers: headers,
+                body: formData
+            });
+
+            // An expired study is uploaded again once
+            if (response.status !== 404 || attempt > 0) {
+                return response;
+            }
+            this.studyId = null;
+        }
+    }
+
+    async runJob(url, fields, headers = {}) {
+        // Submit a background job for the current study and wait for its result
+        const response = await this.postWithStudy(url, fields, headers);
+        const job = await response.json();
+
+        if (!response.ok) {
+            throw new Error(job.error || 'Failed to submit job');
+        }
+
+        while (true) {
+            const statusResponse = await fetch(job.status_url, { headers: headers });
+            const data = await statusResponse.json();
+
+            if (!statusResponse.ok) {
+                throw new Error(data.error || 'Failed to get job status');
+            }
+
+            if (data.job.status === 'completed') {
+                return fetch(job.result_url, { headers: headers });
+            }
+            if (data.job.status === 'failed') {
+                throw new Error(data.job.error || 'Job failed');
+            }
+            if (data.job.status === 'cancelled') {
+                throw new Error('Job was cancelled');
+            }
+
+            await new Promise(resolve => setTimeout(resolve, 500));
+        }
+    }
+
     async analyzeImages() {
         const flairFile = document.getElementById('flair-file');
         const t1ceFile = document.getElementById('t1ce-file');
@@ -593,23 +689,15 @@ class DashboardManager {
         this.hideResults();
 
         try {
-            // Prepare form data
-            const formData = new FormData();
-            formData.append('flair', flairFile.files[0]);
-            formData.append('t1ce', t1ceFile.files[0]);
-            formData.append('slice_index', sliceIndex.value);
-            formData.append('patient_id', patientId.value);
-
             // Get auth token
             const token = localStorage.getItem('authToken');
 
-            // Make API request
-            const response = await fetch('/api/predict', {
-                method: 'POST',
-                headers: {
-                    'Authorization': `Bearer ${token}`
-                },
-                body: formData
+            // Run the prediction as a background job against the uploaded study
+            const response = await this.runJob('/api/jobs/predict', {
+                slice_index: sliceIndex.value,
+                patient_id: patientId.value
+            }, {
+                'Authorization': `Bearer ${token}`
             });
 
             const data = await response.json();
@@ -637,7 +725,7 @@ class DashboardManager {
         // Display visualization
         const resultImage = document.getElementById('result-image');
         if (resultImage) {
-            resultImage.src = `data:image/png;base64,${data.visualization}`;
+            resultImage.src = data.visualization_url;
         }
 
         // Calculate metrics
@@ -832,6 +920,7 @@ class DashboardManager {
         if (flairFile) flairFile.value = '';
         if (t1ceFile) t1ceFile.value = '';
         if (patientId) patientId.value = '';
+        this.studyId = null;
 
         // Clear status
         const flairStatus = document.getElementById('flair-status');
@@ -897,17 +986,13 @@ class DashboardManager {
             downloadBtn.innerHTML = '<i class="fas fa-spinner fa-spin me-2"></i>Generating...';
             downloadBtn.disabled = true;
 
-            const formData = new FormData();
-            const flairFile = document.getElementById('flair-file');
-            const t1ceFile = document.getElementById('t1ce-file');
-
-            formData.append('flair', flairFile.files[0]);
-            formData.append('t1ce', t1ceFile.files[0]);
-            formData.append('slice_index', this.currentResults.slice_index);
+            // Get auth token
+            const token = localStorage.getItem('authToken');
 
-            const response = await fetch('/api/download-report', {
-                method: 'POST',
-                body: formData
+            const response = await this.runJob('/api/jobs/report', {
+                slice_index: this.currentResults.slice_index
+            }, {
+                'Authorization': `Bearer ${token}`
             });
 
             if (!response.ok) {
@@ -255,7 +255,7 @@ class BrainTumorApp {
 
     displayResults(data) {
         // Display visualization
-        this.resultImage.src = `data:image/png;base64,${data.visualization}`;
+        this.resultImage.src = data.visualization_url;
 
         // Display tumor status with modern styling
         const tumorStatus = document.getElementById('tumor-status');
@@ -0,0 +1,330 @@
+#!/usr/bin/env python3
+"""
+Study Store
+Keeps uploaded FLAIR/T1CE volumes on disk for a limited time so clients can
+request many slices of a study without re-uploading it. Each study directory
+holds its own metadata file, so every worker process sharing root_dir can
+resolve any study
+"""
+
+import json
+import os
+import shutil
+import tempfile
+import time
+import uuid
+
+from brain_tumor_predictor import decode_pair
+from job_queue import process_alive
+from nifti_ingest import DEFAULT_MAX_VOLUME_BYTES, ingest_volume
+
+# Default limits
+DEFAULT_STUDY_TTL_SECONDS = 60 * 60
+DEFAULT_STUDY_MAX_BYTES = 2 * 1024 * 1024 * 1024
+DEFAULT_MAX_STUDIES = 200
+
+METADATA_FILENAME = 'study.json'  # Written last; a study directory without it is not resolvable
+LEASE_PREFIX = 'lease-'  # lease-<pid>-<id> files mark a study as in use by a live process
+ORPHAN_GRACE_SECONDS = 60  # Age before a directory without metadata is swept
+
+class Study:
+    """An uploaded FLAIR/T1CE pair stored as uncompressed NIfTI files"""
+
+    def __init__(self, study_id, directory, user_id, flair_filename, t1ce_filename):
+        self.id = study_id
+        self.directory = directory
+        self.user_id = user_id
+        self.flair_filename = flair_filename
+        self.t1ce_filename = t1ce_filename
+        self.flair_path = os.path.join(directory, 'flair.nii')
+        self.t1ce_path = os.path.join(directory, 't1ce.nii')
+        self.metadata_path = os.path.join(directory, METADATA_FILENAME)
+        self.digests = None
+        self.shape = None
+        self.num_slices = 0
+        self.nbytes = 0
+        self.created_at = time.time()
+        self.last_access = self.created_at
+
+    def to_dict(self, ttl_seconds):
+        return {
+            'study_id': self.id,
+            'flair_filename': self.flair_filename,
+            't1ce_filename': self.t1ce_filename,
+            'shape': list(self.shape),
+            'num_slices': self.num_slices,
+            'size_bytes': self.nbytes,
+            'expires_in': max(0, int(self.last_access + ttl_seconds - time.time()))
+        }
+
+    def to_metadata(self):
+        return {
+            'user_id': self.user_id,
+            'flair_filename': self.flair_filename,
+            't1ce_filename': self.t1ce_filename,
+            'digests': list(self.digests),
+            'shape': list(self.shape),
+            'num_slices': self.num_slices,
+            'nbytes': self.nbytes,
+            'created_at': self.created_at
+        }
+
+    @classmethod
+    def load(cls, study_id, directory):
+        """Read a study from its metadata file, or None if it is missing"""
+        path = os.path.join(directory, METADATA_FILENAME)
+        try:
+            with open(path) as f:
+                data = json.load(f)
+            last_access = os.stat(path).st_mtime
+        except (OSError, ValueError):
+            return None
+
+        study = cls(study_id, directory, data['user_id'], data['flair_filename'], data['t1ce_filename'])
+        study.digests = tuple(data['digests'])
+        study.shape = tuple(data['shape'])
+        study.num_slices = data['num_slices']
+        study.nbytes = data['nbytes']
+        study.created_at = data['created_at']
+        study.last_access = last_access
+        return study
+
+class StudyLease:
+    """Context manager that keeps a study from being evicted while in use"""
+
+    def __init__(self, store, study, lease_path):
+        self.store = store
+        self.study = study
+        self.lease_path = lease_path
+
+    def __enter__(self):
+        return self.study
+
+    def __exit__(self, *exc):
+        self.release()
+
+    def release(self):
+        if self.study is not None:
+            self.store._release(self.study, self.lease_path)
+            self.study = None
+
+class StudyStore:
+    """
+    Studies under root_dir, shared by every process that uses the same root_dir
+
+    The last access time of a study is the mtime of its metadata file, and
+    a lease is a file in its directory named after the leasing process, so
+    expiry and quota eviction in one process never remove a study another
+    live process is reading.
+    """
+
+    def __init__(self, root_dir=None, ttl_seconds=DEFAULT_STUDY_TTL_SECONDS,
+                 max_bytes=DEFAULT_STUDY_MAX_BYTES, max_studies=DEFAULT_MAX_STUDIES,
+                 max_volume_bytes=DEFAULT_MAX_VOLUME_BYTES):
+        """Create a store under root_dir (a fresh temporary directory by default)"""
+        self.root_dir = root_dir or tempfile.mkdtemp(prefix='studies_')
+        os.makedirs(self.root_dir, exist_ok=True)
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.max_studies = max_studies
+        self.max_volume_bytes = max_volume_bytes
+
+    def create(self, flair_file, t1ce_file, user_id=None):
+        """Store an uploaded FLAIR/T1CE pair and return the new Study
+
+        Gzip-compressed uploads are inflated once here so later slice reads
+        can be memory-mapped. Raises ValueError for unreadable or oversized
+        volumes (checked from the header before the data is written) or
+        uploads that do not fit in the quota.
+        """
+        study_id = str(uuid.uuid4())
+        directory = os.path.join(self.root_dir, study_id)
+        os.makedirs(directory)
+        # Held while the files are written so no process sweeps the half-written study
+        lease_path = self._lease(directory)
+        study = Study(study_id, directory, user_id, flair_file.filename, t1ce_file.filename)
+
+        try:
+            # Both uploads are inflated and written concurrently
+            (flair_header, flair_digest), (t1ce_header, t1ce_digest) = decode_pair(
+                lambda upload: self._store_volume(*upload),
+                (flair_file, study.flair_path, 'FLAIR'), (t1ce_file, study.t1ce_path, 'T1CE')
+            )
+
+            study.shape = flair_header.get_data_shape()
+            study.num_slices = min(study.shape[2], t1ce_header.get_data_shape()[2])
+            study.nbytes = os.path.getsize(study.flair_path) + os.path.getsize(study.t1ce_path)
+            study.digests = (flair_digest, t1ce_digest)
+
+            if study.nbytes > self.max_bytes:
+                raise ValueError('Study exceeds the storage quota')
+
+            temp_path = f'{study.metadata_path}.{os.getpid()}.tmp'
+            with open(temp_path, 'w') as f:
+                json.dump(study.to_metadata(), f)
+            os.replace(temp_path, study.metadata_path)
+
+        except Exception:
+            shutil.rmtree(directory, ignore_errors=True)
+            raise
+
+        self._unlease(lease_path)
+        study.last_access = os.stat(study.metadata_path).st_mtime
+        self._evict()
+        return study
+
+    def acquire(self, study_id, user_id):
+        """Return a StudyLease for a live study of user_id, or None if unknown, expired or not theirs"""
+        study = self._load(study_id, user_id)
+        if study is None:
+            return None
+
+        lease_path = self._lease(study.directory)
+        # A process evicting the study removes the metadata before it checks for
+        # leases, so once the lease exists the metadata still being there means
+        # the files stay until the lease is released
+        if not self._touch(study):
+            self._release(study, lease_path)
+            return None
+        return StudyLease(self, study, lease_path)
+
+    def get(self, study_id, user_id):
+        """Return a live study of user_id without leasing it (for metadata only)"""
+        return self._load(study_id, user_id)
+
+    def delete(self, study_id, user_id):
+        """Remove a study of user_id; files of a leased study are removed once released"""
+        study = self._load(study_id, user_id)
+        if study is None:
+            return False
+        self._remove(study.directory)
+        return True
+
+    def stats(self):
+        studies = [study for _, study in self._scan() if study is not None]
+        return {
+            'studies': len(studies),
+            'bytes': sum(study.nbytes for study in studies),
+            'max_bytes': self.max_bytes
+        }
+
+    def _load(self, study_id, user_id):
+        """The live study with study_id owned by user_id, or None; expired studies are removed"""
+        try:
+            uuid.UUID(study_id)
+        except ValueError:
+            return None
+        study = Study.load(study_id, os.path.join(self.root_dir, study_id))
+        if study is None or study.user_id != user_id:
+            return None
+        if self._expired(study, time.time()):
+            if not self._leased(study.directory):
+                self._remove(study.directory)
+            return None
+        return study
+
+    def _touch(self, study):
+        """Record an access to a study; False if its metadata is gone"""
+        try:
+            os.utime(study.metadata_path)
+        except FileNotFoundError:
+            return False
+        study.last_access = time.time()
+        return True
+
+    def _release(self, study, lease_path):
+        self._unlease(lease_path)
+        if not self._touch(study) and not self._leased(study.directory):
+            # Deleted or evicted while leased
+            shutil.rmtree(study.directory, ignore_errors=True)
+        self._evict()
+
+    def _expired(self, study, now):
+        return now - study.last_access > self.ttl_seconds
+
+    def _lease(self, directory):
+        lease_path = os.path.join(directory, f'{LEASE_PREFIX}{os.getpid()}-{uuid.uuid4().hex}')
+        open(lease_path, 'w').close()
+        return lease_path
+
+    def _unlease(self, lease_path):
+        try:
+            os.remove(lease_path)
+        except FileNotFoundError:
+            pass
+
+    def _leased(self, directory):
+        """Whether a live process holds a lease on the study; stale leases are dropped"""
+        try:
+            names = os.listdir(directory)
+        except FileNotFoundError:
+            return False
+
+        leased = False
+        for name in names:
+            if not name.startswith(LEASE_PREFIX):
+                continue
+            pid = int(name[len(LEASE_PREFIX):].split('-', 1)[0])
+            if process_alive(pid):
+                leased = True
+            else:
+                self._unlease(os.path.join(directory, name))
+        return leased
+
+    def _scan(self):
+        """(directory, Study or None if it has no metadata) for every study under root_dir"""
+        for study_id in os.listdir(self.root_dir):
+            directory = os.path.join(self.root_dir, study_id)
+            if os.path.isdir(directory):
+                yield directory, Study.load(study_id, directory)
+
+    def _evict(self):
+        """Drop expired and orphaned studies, then least recently used ones over quota"""
+        now = time.time()
+        idle = []
+        total_bytes = count = 0
+        for directory, study in list(self._scan()):
+            leased = self._leased(directory)
+            if study is None:
+                # Left behind by a delete whose leaseholder died
+                try:
+                    orphaned = not leased and now - os.stat(directory).st_mtime > ORPHAN_GRACE_SECONDS
+                except FileNotFoundError:
+                    orphaned = False
+                if orphaned:
+                    self._remove(directory)
+                continue
+            if not leased and self._expired(study, now):
+                self._remove(directory)
+                continue
+            total_bytes += study.nbytes
+            count += 1
+            if not leased:
+                idle.append(study)
+
+        for study in sorted(idle, key=lambda s: s.last_access):
+            if total_bytes <= self.max_bytes and count <= self.max_studies:
+                break
+            if self._remove(study.directory):
+                total_bytes -= study.nbytes
+                count -= 1
+
+    def _remove(self, directory):
+        """Unpublish a study; its files go now unless a live process still leases it"""
+        try:
+            os.remove(os.path.join(directory, METADATA_FILENAME))
+            removed = True
+        except FileNotFoundError:
+            removed = False
+        if not self._leased(directory):
+            shutil.rmtree(directory, ignore_errors=True)
+        return removed
+
+    def _store_volume(self, upload, path, modality):
+        """Save an upload as an uncompressed .nii; returns (header, digest of the upload)"""
+        with open(path, 'wb') as out:
+            try:
+                header, _, digest = ingest_volume(upload.stream, out, self.max_volume_bytes)
+            except ValueError as e:
+                raise ValueError(f'{modality}: {e}')
+        return header, digest
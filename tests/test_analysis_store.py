@@ -0,0 +1,57 @@
+"""
+Analysis Store
+History counters of the in-memory and SQLite stores once analyses expire
+"""
+
+from datetime import datetime, timedelta
+
+import pytest
+
+from analysis_store import AnalysisStore, SQLiteAnalysisStore
+
+DAY = 24 * 60 * 60
+
+def record(analysis_id, days_ago=0, user_id='alice', result='tumor_detected'):
+    date = datetime.now() - timedelta(days=days_ago)
+    return {'id': analysis_id, 'user_id': user_id, 'date': date.isoformat(),
+            'status': 'completed', 'result': result, 'patient_id': ''}
+
+@pytest.fixture(params=['memory', 'sqlite'])
+def store(request, tmp_path):
+    dropped = []
+    if request.param == 'memory':
+        store = AnalysisStore(ttl_seconds=None, on_evict=dropped.append)
+    else:
+        store = SQLiteAnalysisStore(str(tmp_path / 'analyses.db'), ttl_seconds=None, on_evict=dropped.append)
+    store.dropped = dropped
+    return store
+
+def expire(store, analysis_id):
+    """Push one analysis past a one-day TTL"""
+    store.ttl_seconds = DAY
+    if isinstance(store, AnalysisStore):
+        store._entries[analysis_id].last_access -= 2 * DAY
+
+def test_user_stats_skip_expired_analyses(store):
+    month = datetime.now().strftime('%Y-%m')
+    store.save('new', record('new'), {'id': 'new'})
+    store.save('old', record('old', days_ago=2), {'id': 'old'})
+    store.save('bob', record('bob', user_id='bob'), {'id': 'bob'})
+    expire(store, 'old')
+
+    stats = store.user_stats('alice', month)
+    assert stats['total'] == 1
+    assert stats['tumor_detected'] == 1
+    assert store.count_user_analyses('alice') == 1
+    assert store.count_user_analyses('bob') == 1
+    assert store.dropped == [{'id': 'old'}]
+    assert store.stats()['expirations'] == 1
+
+def test_user_stats_without_expired_analyses(store):
+    store.save('a', record('a'), {'id': 'a'})
+    store.save('b', record('b', result='no_tumor'), {'id': 'b'})
+    store.ttl_seconds = DAY
+
+    assert store.count_user_analyses('alice') == 2
+    assert store.user_stats('alice', datetime.now().strftime('%Y-%m'))['tumor_detected'] == 1
+    assert store.dropped == []
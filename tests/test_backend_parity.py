@@ -0,0 +1,103 @@
+"""
+Backend Parity
+Runs the same synthetic volumes through the Keras model and the other
+inference backends (an ONNX export on onnxruntime, and a TFLite export when
+TFLITE_MODEL_PATH is set) and fails if their probabilities or labels drift
+apart
+
+    python -m pytest tests/test_backend_parity.py
+
+The ONNX export is written next to the model (best_model.h5, or MODEL_PATH)
+unless ONNX_MODEL_PATH names an existing one, and can then be served with
+ONNX_MODEL_PATH.
+"""
+
+import os
+
+import numpy as np
+import pytest
+
+pytest.importorskip('onnxruntime')
+pytest.importorskip('tf2onnx')
+
+from brain_tumor_predictor import BrainTumorPredictor, VOLUME_START_AT, VOLUME_SLICES
+from inference_backends import OnnxRuntimeBackend, default_onnx_path, export_onnx
+
+MODEL_PATH = os.environ.get('MODEL_PATH', 'best_model.h5')
+ATOL = 1e-4  # Max absolute probability difference allowed
+MIN_AGREEMENT = 0.999  # Min fraction of matching labels
+SLICE_STEP = 5  # Every SLICE_STEP-th preprocessed slice is compared
+
+def write_synthetic_volumes(directory, count, shape=(240, 240, 155), seed=0):
+    """Write count (flair, t1ce) pairs of int16 NIfTI volumes with a head and a few bright blobs"""
+    import nibabel as nib
+
+    rng = np.random.default_rng(seed)
+    x, y, z = np.meshgrid(*(np.linspace(-1, 1, n) for n in shape), indexing='ij')
+    head = (x ** 2 + y ** 2 + (z * 1.3) ** 2) < 0.8
+
+    pairs = []
+    for i in range(count):
+        volumes = []
+        for scale in (900, 600):
+            volume = head * (scale * (0.6 + 0.2 * rng.random(shape)))
+            for _ in range(3):
+                center = rng.uniform(-0.4, 0.4, size=3)
+                radius = rng.uniform(0.08, 0.2)
+                blob = ((x - center[0]) ** 2 + (y - center[1]) ** 2 + (z - center[2]) ** 2) < radius ** 2
+                volume[blob] += scale * rng.uniform(0.5, 1.5)
+            volumes.append(volume.astype(np.int16))
+
+        pair = []
+        for name, volume in zip(('flair', 't1ce'), volumes):
+            path = os.path.join(directory, f'synthetic_{i}_{name}.nii')
+            nib.save(nib.Nifti1Image(volume, np.eye(4)), path)
+            pair.append(path)
+        pairs.append(tuple(pair))
+    return pairs
+
+@pytest.fixture(scope='module')
+def predictor():
+    if not os.path.exists(MODEL_PATH):
+        pytest.skip(f'Model file not found: {MODEL_PATH}')
+    return BrainTumorPredictor(MODEL_PATH, cache_bytes=0)
+
+@pytest.fixture(scope='module')
+def onnx_path(predictor):
+    path = os.environ.get('ONNX_MODEL_PATH') or default_onnx_path(predictor)
+    if not os.path.exists(path):
+        export_onnx(predictor, path)
+    return path
+
+@pytest.fixture(scope='module')
+def reference(predictor, tmp_path_factory):
+    """(model-ready slices, Keras probabilities) for two synthetic volume pairs"""
+    pairs = write_synthetic_volumes(str(tmp_path_factory.mktemp('volumes')), 2)
+    X = np.concatenate([
+        predictor.preprocess_volume(flair, t1ce, VOLUME_START_AT, VOLUME_SLICES)[::SLICE_STEP]
+        for flair, t1ce in pairs
+    ])
+    return X, predictor.predict_batch(X)
+
+def assert_matches(probabilities, expected, atol=ATOL):
+    labels = probabilities.argmax(axis=-1)
+    expected_labels = expected.argmax(axis=-1)
+    if atol is not None:
+        assert float(np.abs(probabilities - expected).max()) <= atol
+    assert float((labels == expected_labels).mean()) >= MIN_AGREEMENT
+
+@pytest.mark.parametrize('intra_op_threads, inter_op_threads', [(None, None), (1, 2)])
+def test_onnxruntime_matches_keras(onnx_path, reference, intra_op_threads, inter_op_threads):
+    X, expected = reference
+    backend = OnnxRuntimeBackend(onnx_path, intra_op_threads=intra_op_threads, inter_op_threads=inter_op_threads)
+    assert_matches(backend.predict_batch(X), expected)
+
+def test_tflite_matches_keras_labels(reference):
+    """Quantized exports are only held to the label agreement"""
+    tflite_path = os.environ.get('TFLITE_MODEL_PATH')
+    if not tflite_path:
+        pytest.skip('TFLITE_MODEL_PATH not set')
+
+    from tflite_inference import TFLiteInference
+    X, expected = reference
+    assert_matches(TFLiteInference(tflite_path).predict_batch(X), expected, atol=None)
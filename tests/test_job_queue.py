@@ -0,0 +1,78 @@
+"""
+Job Queue
+Jobs shared through a SQLiteJobStore between queues (as between worker
+processes): status, events, file results and cancellation
+"""
+
+import threading
+
+import pytest
+
+from artifact_store import ArtifactStore
+from job_queue import JobFile, JobQueue, SQLiteJobStore
+
+TIMEOUT = 10
+
+@pytest.fixture
+def queues(tmp_path):
+    """Two queues over one database and result directory, like two gunicorn workers"""
+    def make():
+        return JobQueue(num_workers=1, result_store=ArtifactStore(root_dir=str(tmp_path / 'results')),
+                        store=SQLiteJobStore(str(tmp_path / 'jobs.db')))
+    return make(), make()
+
+def wait_finished(queue, job):
+    sent = 0
+    while True:
+        events = queue.wait_for_events(queue.get(job.id), sent, timeout=TIMEOUT)
+        assert events, 'job did not finish in time'
+        sent += len(events)
+        if events[-1][0] in ('complete', 'error', 'cancelled'):
+            return [event for event, _ in events]
+
+def test_result_is_served_by_another_queue(queues):
+    first, second = queues
+    job = first.submit('report', lambda job: JobFile(b'jpeg', 'image/jpeg', 'report.jpg', {'size': 4}), 'alice')
+    wait_finished(first, job)
+
+    found = second.get(job.id)
+    assert found.status == 'completed'
+    assert found.user_id == 'alice'
+    assert found.to_dict()['result'] == {'size': 4}
+    path, mimetype = second.result_path(found)
+    assert mimetype == 'image/jpeg'
+    with open(path, 'rb') as f:
+        assert f.read() == b'jpeg'
+
+def test_events_are_followed_from_another_queue(queues):
+    first, second = queues
+
+    def run(job):
+        job.publish('progress', {'completed': 1})
+        return {'ok': True}
+
+    job = first.submit('predict', run, 'alice')
+    assert wait_finished(second, job) == ['started', 'progress', 'complete']
+
+def test_cancel_from_another_queue(queues):
+    first, second = queues
+    started = threading.Event()
+    release = threading.Event()
+
+    def run(job):
+        started.set()
+        release.wait(TIMEOUT)
+        job.check_cancelled()
+        return {'ok': True}
+
+    running = first.submit('predict', run, 'alice')
+    queued = first.submit('predict', lambda job: {'ok': True}, 'alice')
+    assert started.wait(TIMEOUT)
+
+    assert second.cancel(queued.id).status == 'cancelled'
+    second.cancel(running.id)
+    release.set()
+
+    assert wait_finished(first, running)[-1] == 'cancelled'
+    assert second.get(running.id).status == 'cancelled'
+    assert second.get(queued.id).status == 'cancelled'
@@ -0,0 +1,57 @@
+"""
+NIfTI Ingestion
+Uploads read through load_volume and ingest_volume, plain and gzipped
+"""
+
+import gzip
+import io
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from nifti_ingest import ingest_volume, load_volume
+
+def nifti_bytes(data, compress=False):
+    raw = nib.Nifti1Image(data, np.eye(4)).to_bytes()
+    return gzip.compress(raw) if compress else raw
+
+@pytest.fixture
+def volume():
+    return np.arange(6 * 5 * 4, dtype=np.int16).reshape(6, 5, 4)
+
+@pytest.mark.parametrize('compress', [False, True])
+def test_load_volume_reads_slices(volume, compress):
+    ingested = load_volume(io.BytesIO(nifti_bytes(volume, compress)))
+    try:
+        assert ingested.image.shape == (6, 5, 4)
+        np.testing.assert_array_equal(ingested.image.dataobj[:, :, 2], volume[:, :, 2])
+    finally:
+        ingested.close()
+
+def test_trailing_singleton_dimensions_are_dropped(volume):
+    ingested = load_volume(io.BytesIO(nifti_bytes(volume[..., np.newaxis])))
+    try:
+        assert ingested.image.shape == (6, 5, 4)
+        np.testing.assert_array_equal(ingested.image.dataobj[:, :, 3], volume[:, :, 3])
+    finally:
+        ingested.close()
+
+def test_stored_copy_has_the_squeezed_header(volume):
+    sink = io.BytesIO()
+    ingest_volume(io.BytesIO(nifti_bytes(volume[..., np.newaxis, np.newaxis])), sink)
+    image = nib.Nifti1Image.from_bytes(sink.getvalue())
+    assert image.shape == (6, 5, 4)
+    np.testing.assert_array_equal(np.asarray(image.dataobj), volume)
+
+def test_4d_series_is_rejected(volume):
+    with pytest.raises(ValueError, match='Expected a 3D volume'):
+        load_volume(io.BytesIO(nifti_bytes(np.stack([volume, volume], axis=-1))))
+
+def test_spool_limit_moves_the_volume_to_disk(volume):
+    ingested = load_volume(io.BytesIO(nifti_bytes(volume)), spool_bytes=64)
+    try:
+        assert ingested._buffer._rolled
+        np.testing.assert_array_equal(np.asarray(ingested.image.dataobj), volume)
+    finally:
+        ingested.close()
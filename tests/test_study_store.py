@@ -0,0 +1,79 @@
+"""
+Study Store
+Studies shared through root_dir between store instances (as between worker
+processes), owner checks and leases
+"""
+
+import io
+import os
+
+import nibabel as nib
+import numpy as np
+import pytest
+
+from study_store import StudyStore
+
+class Upload:
+    """Stands in for a Werkzeug FileStorage"""
+
+    def __init__(self, filename, data):
+        self.filename = filename
+        self.stream = io.BytesIO(data)
+
+def upload_pair():
+    volume = np.arange(8 * 8 * 6, dtype=np.int16).reshape(8, 8, 6)
+    data = nib.Nifti1Image(volume, np.eye(4)).to_bytes()
+    return Upload('flair.nii', data), Upload('t1ce.nii', data)
+
+@pytest.fixture
+def stores(tmp_path):
+    """Two stores over one directory, like two gunicorn workers"""
+    return StudyStore(str(tmp_path)), StudyStore(str(tmp_path))
+
+def test_study_resolves_from_another_store(stores):
+    first, second = stores
+    study = first.create(*upload_pair(), user_id='alice')
+
+    found = second.get(study.id, 'alice')
+    assert found.shape == (8, 8, 6)
+    assert found.digests == study.digests
+    with second.acquire(study.id, 'alice') as leased:
+        assert os.path.exists(leased.flair_path)
+
+    assert second.delete(study.id, 'alice')
+    assert first.get(study.id, 'alice') is None
+    assert not os.path.exists(study.directory)
+
+def test_other_users_do_not_see_a_study(stores):
+    first, second = stores
+    study = first.create(*upload_pair(), user_id='alice')
+
+    assert second.get(study.id, 'bob') is None
+    assert second.acquire(study.id, 'bob') is None
+    assert not second.delete(study.id, 'bob')
+    assert first.get(study.id, 'alice') is not None
+
+def test_deleted_study_keeps_its_files_until_released(stores):
+    first, second = stores
+    study = first.create(*upload_pair(), user_id='alice')
+
+    lease = first.acquire(study.id, 'alice')
+    assert second.delete(study.id, 'alice')
+    assert os.path.exists(study.flair_path)
+    lease.release()
+    assert not os.path.exists(study.directory)
+
+def test_quota_evicts_idle_studies_only(tmp_path):
+    store = StudyStore(str(tmp_path))
+    leased = store.create(*upload_pair(), user_id='alice')
+    store.max_bytes = leased.nbytes
+
+    with store.acquire(leased.id, 'alice'):
+        idle = store.create(*upload_pair(), user_id='alice')
+        assert store.get(leased.id, 'alice') is not None
+        assert store.get(idle.id, 'alice') is None
+
+def test_unknown_and_malformed_ids(stores):
+    first, _ = stores
+    assert first.get('../etc', 'alice') is None
+    assert first.acquire('00000000-0000-0000-0000-000000000000', 'alice') is None
@@ -0,0 +1,119 @@
+#!/usr/bin/env python3
+"""
+TFLite Inference
+Exports the segmentation model to a quantized TFLite flatbuffer (dynamic-range,
+INT8 or float16) and runs it through the TFLite interpreter with the same
+predict_batch contract as BrainTumorPredictor
+"""
+
+import os
+import threading
+
+import numpy as np
+
+from inference_backends import InferenceBackend
+from prediction_cache import file_digest
+
+QUANTIZATION_MODES = ('dynamic', 'int8', 'float16')
+
+def load_interpreter_class():
+    """Prefer the standalone LiteRT/tflite-runtime interpreters, which avoid importing TensorFlow"""
+    try:
+        from ai_edge_litert.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    try:
+        from tflite_runtime.interpreter import Interpreter
+        return Interpreter
+    except ImportError:
+        pass
+    from brain_tumor_predictor import import_tensorflow
+    return import_tensorflow().lite.Interpreter
+
+def default_tflite_path(predictor, mode):
+    """Where an export of predictor's model in the given mode is kept by default"""
+    stem = os.path.splitext(os.path.basename(predictor.model_path))[0]
+    return os.path.join(predictor.converted_model_dir, f"{stem}.{predictor.model_version}.{mode}.tflite")
+
+def calibration_slices(predictor, volume_pairs, slices_per_volume=16):
+    """
+    Preprocessed (1, IMG_SIZE, IMG_SIZE, 2) inputs for INT8 calibration
+
+    Takes slices_per_volume evenly spaced slices from the brain-bearing
+    range of each (flair_path, t1ce_path) pair.
+    """
+    from brain_tumor_predictor import NiftiSliceReader, VOLUME_START_AT, VOLUME_SLICES
+
+    samples = []
+    for flair_path, t1ce_path in volume_pairs:
+        num_slices = NiftiSliceReader(flair_path).num_slices
+        start = min(VOLUME_START_AT, max(0, num_slices - 1))
+        count = min(VOLUME_SLICES, num_slices - start)
+        X = predictor.preprocess_volume(flair_path, t1ce_path, start, count)
+        for i in np.linspace(0, count - 1, min(slices_per_volume, count)).astype(int):
+            samples.append(X[i:i + 1].copy())
+    return samples
+
+def export_tflite(predictor, output_path, mode='dynamic', calibration_data=None):
+    """
+    Convert a loaded BrainTumorPredictor's model to TFLite and write it to output_path
+
+    mode is 'dynamic' (int8 weights, float activations), 'int8' (int8
+    weights and activations, calibrated on calibration_data; ops without
+    an int8 kernel stay float) or 'float16' (float16 weights).
+    """
+    if mode not in QUANTIZATION_MODES:
+        raise ValueError(f"Unknown quantization mode: {mode}")
+    if predictor.model is None:
+        raise ValueError("Export needs a predictor with the model loaded in-process")
+    if mode == 'int8' and not calibration_data:
+        raise ValueError("INT8 quantization needs calibration slices")
+
+    from brain_tumor_predictor import import_tensorflow
+    tf = import_tensorflow()
+
+    converter = tf.lite.TFLiteConverter.from_keras_model(predictor.model)
+    converter.optimizations = [tf.lite.Optimize.DEFAULT]
+    if mode == 'float16':
+        converter.target_spec.supported_types = [tf.float16]
+    elif mode == 'int8':
+        converter.representative_dataset = lambda: ([sample] for sample in calibration_data)
+
+    flatbuffer = converter.convert()
+
+    temp_path = f"{output_path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as f:
+        f.write(flatbuffer)
+    os.replace(temp_path, output_path)
+    return output_path
+
+class TFLiteInference(InferenceBackend):
+    name = 'tflite'
+
+    def __init__(self, tflite_path, num_threads=None):
+        """Load a .tflite model; num_threads=None lets the interpreter decide"""
+        if not os.path.exists(tflite_path):
+            raise FileNotFoundError(f"TFLite model not found: {tflite_path}")
+
+        self.tflite_path = tflite_path
+        self.num_threads = num_threads
+        self.model_version = file_digest(tflite_path)
+        self._interpreter = load_interpreter_class()(model_path=tflite_path, num_threads=num_threads)
+        self._input = self._interpreter.get_input_details()[0]['index']
+        self._output = self._interpreter.get_output_details()[0]['index']
+        self._batch_size = None
+        # One interpreter, one invocation at a time
+        self._lock = threading.Lock()
+
+    def predict_batch(self, X):
+        X = np.ascontiguousarray(X, dtype=np.float32)
+        with self._lock:
+            # Tensors are reallocated only when the batch size changes
+            if len(X) != self._batch_size:
+                self._interpreter.resize_tensor_input(self._input, X.shape, strict=False)
+                self._interpreter.allocate_tensors()
+                self._batch_size = len(X)
+            self._interpreter.set_tensor(self._input, X)
+            self._interpreter.invoke()
+            return self._interpreter.get_tensor(self._output).copy()
@@ -0,0 +1,128 @@
+#!/usr/bin/env python3
+"""
+Volume Segmentation
+Segments a whole volume slice by slice: the slices that hold tissue are
+found from their intensity, only those are run through the model in
+batches, and the predictions are resized back and stitched into a label
+map at the volume's own resolution
+"""
+
+import gzip
+
+import cv2
+import nibabel as nib
+import numpy as np
+
+from brain_tumor_predictor import NiftiSliceReader, PREDICT_BATCH_SIZE, SEGMENT_CLASSES, decode_pair
+
+# Empty-slice detection
+DEFAULT_INTENSITY_THRESHOLD = 0.05  # Fraction of a modality's peak above which a voxel counts as tissue
+DEFAULT_MIN_TISSUE_FRACTION = 0.002  # Fraction of a slice that must be tissue for it to be segmented
+
+def tissue_slices(volume, intensity_threshold=DEFAULT_INTENSITY_THRESHOLD,
+                  min_tissue_fraction=DEFAULT_MIN_TISSUE_FRACTION):
+    """Boolean mask over the slices of an (H, W, N) stack marking those that hold tissue"""
+    peak = volume.max() if volume.size else 0
+    if peak <= 0:
+        return np.zeros(volume.shape[2], dtype=bool)
+
+    tissue = np.count_nonzero(volume > intensity_threshold * peak, axis=(0, 1))
+    return tissue >= min_tissue_fraction * volume.shape[0] * volume.shape[1]
+
+class VolumeSegmentation:
+    """Full-resolution label map of a volume and the slices that were segmented"""
+
+    def __init__(self, labels, segmented_slices, start_slice, num_slices, spacing, affine):
+        self.labels = labels  # (H, W, D) uint8 class labels, 0 on slices that were skipped
+        self.segmented_slices = segmented_slices
+        self.start_slice = start_slice
+        self.num_slices = num_slices
+        self.spacing = spacing
+        self.affine = affine
+
+    @property
+    def skipped_slices(self):
+        return self.num_slices - len(self.segmented_slices)
+
+    @property
+    def brain_range(self):
+        """(first, last) segmented slice, or None if every slice was empty"""
+        if len(self.segmented_slices) == 0:
+            return None
+        return int(self.segmented_slices[0]), int(self.segmented_slices[-1])
+
+    def class_counts(self):
+        """Voxels per class over the requested slice range (skipped slices count as background)"""
+        labels = self.labels[:, :, self.start_slice:self.start_slice + self.num_slices]
+        return np.bincount(labels.ravel(order='K'), minlength=len(SEGMENT_CLASSES))
+
+    def to_nifti_bytes(self):
+        """The label map as a gzipped NIfTI-1 volume in the input's voxel space"""
+        image = nib.Nifti1Image(self.labels, self.affine)
+        return gzip.compress(image.to_bytes(), compresslevel=1)
+
+def upsample_labels(probabilities, shape):
+    """Class labels at shape (H, W) from (IMG_SIZE, IMG_SIZE, classes) probabilities
+
+    The probabilities are resized before the argmax, so class boundaries
+    come out smooth rather than blocky.
+    """
+    resized = cv2.resize(probabilities, (shape[1], shape[0]), interpolation=cv2.INTER_LINEAR)
+    return resized.argmax(axis=-1)
+
+def segment_volume(predictor, flair, t1ce, start_slice=0, num_slices=None, batch_size=PREDICT_BATCH_SIZE,
+                   skip_empty=True, intensity_threshold=DEFAULT_INTENSITY_THRESHOLD,
+                   min_tissue_fraction=DEFAULT_MIN_TISSUE_FRACTION, on_batch=None):
+    """
+    Segment slices [start_slice, start_slice + num_slices) of a FLAIR/T1CE pair
+
+    flair and t1ce are paths or nibabel images. With skip_empty, slices
+    without tissue in either modality are left as background instead of
+    being run through the model. The rest are normalized together, as in
+    predictor.predict_volume, and predicted batch_size slices at a time;
+    on_batch(completed, total) is called once the slices to segment are
+    known and after every batch, and may raise to stop the segmentation.
+    Returns a VolumeSegmentation on the FLAIR volume's grid.
+    """
+    flair_reader = NiftiSliceReader(flair)
+    t1ce_reader = NiftiSliceReader(t1ce)
+
+    total_slices = min(flair_reader.num_slices, t1ce_reader.num_slices)
+    if num_slices is None:
+        num_slices = total_slices - start_slice
+    stop = min(start_slice + num_slices, total_slices)
+    num_slices = max(0, stop - start_slice)
+
+    flair_stack, t1ce_stack = decode_pair(lambda reader: reader.read_slices(start_slice, stop),
+                                          flair_reader, t1ce_reader)
+
+    if skip_empty:
+        mask = tissue_slices(flair_stack, intensity_threshold, min_tissue_fraction) | \
+               tissue_slices(t1ce_stack, intensity_threshold, min_tissue_fraction)
+    else:
+        mask = np.ones(num_slices, dtype=bool)
+    selected = np.flatnonzero(mask)
+
+    labels = np.zeros(flair_reader.shape, dtype=np.uint8, order='F')
+    total = len(selected)
+    if on_batch is not None:
+        on_batch(0, total)
+
+    if total:
+        # The tissue-bearing slices are usually one run, which needs no copy
+        if selected[-1] - selected[0] + 1 == total:
+            index = slice(selected[0], selected[-1] + 1)
+        else:
+            index = selected
+        X = predictor.preprocess_slices(flair_stack[:, :, index], t1ce_stack[:, :, index])
+
+        in_plane_shape = flair_reader.shape[:2]
+        for offset in range(0, total, batch_size):
+            predictions = predictor.predict_batch(X[offset:offset + batch_size])
+            for i, probabilities in zip(selected[offset:offset + batch_size], predictions):
+                labels[:, :, start_slice + i] = upsample_labels(probabilities, in_plane_shape)
+            if on_batch is not None:
+                on_batch(min(offset + batch_size, total), total)
+
+    return VolumeSegmentation(labels, start_slice + selected, start_slice, num_slices,
+                              flair_reader.voxel_spacing, flair_reader.img.affine)